@@ -6,6 +6,7 @@
 
 from Kqlmagic.constants import Constants
 from Kqlmagic.kql_client import KqlQueryResponse, KqlSchemaResponse
+from Kqlmagic import kql_lexer
 import hashlib
 import json
 import os
@@ -29,21 +30,28 @@ class CacheClient(object):
         root_path = os.path.normpath(ip.starting_dir)
         self.files_folder = root_path + "/" + ip.run_line_magic("config", "{0}.cache_folder_name".format(Constants.MAGIC_CLASS_NAME))
 
-    def _get_query_hash_filename(self, query):
-        lines = [l.replace("\r", "").replace("\t", " ").strip() for l in query.split("\n")]
+    def _get_query_hash_filename(self, query, query_parameters=None):
+        # comments are detected by the lexer, so comment markers within string literals (urls) are kept.
+        # a comment preceded by a space is dropped with the space, as was done before, to keep the cached files names
         q_lines = []
-        for line in lines:
-            if not line.startswith("//"):
-                idx = line.find(" //")
-                q_lines.append(line[: idx if idx >= 0 else len(line)])
+        for code, comment in kql_lexer.iter_lines(query):
+            line = code.replace("\r", "").replace("\t", " ")
+            if comment is None:
+                q_lines.append(line.strip())
+            elif line.strip():
+                line = line.lstrip()
+                q_lines.append(line[:-1] if line.endswith(" ") else line)
+        # query parameters values are part of the key, the query text is the same for all values
+        if query_parameters:
+            q_lines.append(json.dumps(query_parameters, sort_keys=True))
         return "q_" + hashlib.sha1(bytes("".join(q_lines), "utf-8")).hexdigest() + ".json"
 
-    def _get_file_path(self, query, database_at_cluster, cache_folder):
+    def _get_file_path(self, query, database_at_cluster, cache_folder, query_parameters=None):
         """ get the file name from the query string.
         if query string ends with the '.json' extension it returns the string
         otherwise it computes it from the query
         """
-        file_name = query if query.strip().endswith(".json") else self._get_query_hash_filename(query)
+        file_name = query if query.strip().endswith(".json") else self._get_query_hash_filename(query, query_parameters)
         folder_path = self._get_folder_path(database_at_cluster, cache_folder=cache_folder)
         file_path = folder_path + "/" + file_name
         return os.path.normpath(file_path)
@@ -82,7 +90,9 @@ class CacheClient(object):
         :param str database_at_cluster: name of database and cluster that a folder will be derived that contains all the files with the query results for this specific database.
         :param str query: Query to be executed.
         """
-        file_path = self._get_file_path(query, database_at_cluster, cache_folder=options.get("use_cache"))
+        file_path = self._get_file_path(
+            query, database_at_cluster, cache_folder=options.get("use_cache"), query_parameters=options.get("query_parameters")
+        )
         str_response = open(file_path, "r").read()
         json_response = json.loads(str_response)
         if query.startswith(".") and json_response.get("tables") is not None:
@@ -97,7 +107,7 @@ class CacheClient(object):
         :param str query: Query to be executed.
         """
         if filefolder is not None:
-            filepath = filefolder + "/" + self._get_query_hash_filename(query)
+            filepath = filefolder + "/" + self._get_query_hash_filename(query, options.get("query_parameters"))
         if filepath is not None:
             file_path = os.path.normpath(filepath)
             parts = file_path.split("/")
@@ -108,7 +118,9 @@ class CacheClient(object):
                 if not os.path.exists(folder_name):
                     os.makedirs(folder_name)
         else:
-            file_path = self._get_file_path(query, database + "_at_" + cluster, cache_folder=options.get("cache"))
+            file_path = self._get_file_path(
+                query, database + "_at_" + cluster, cache_folder=options.get("cache"), query_parameters=options.get("query_parameters")
+            )
         outfile = open(file_path, "w")
         outfile.write(json.dumps(result.json_response))
         outfile.flush()
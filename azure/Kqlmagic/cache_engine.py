@@ -45,6 +45,10 @@ class CacheEngine(KqlEngine):
             outfile.flush()
             outfile.close()
 
+    def supports_query_parameters(self):
+        # the query parameters values are part of the cached file key, as they were when the results were saved by the engine
+        return self.kql_engine.supports_query_parameters() if self.kql_engine is not None else True
+
     def validate(self, **options):
         client = self.get_client()
         if not client:
@@ -5,6 +5,7 @@
 # --------------------------------------------------------------------------
 
 from datetime import timedelta, datetime
+import json
 import pytz
 from Kqlmagic.constants import Constants, VisualizationKeys
 
@@ -51,6 +52,36 @@ def is_quantity(val) -> bool:
     """
     return hasattr(val, "__sub__")
 
+def get_sort_order(values: list) -> str:
+    """Returns the sort order of the values, in one linear pass:
+    "constant" (all values equal, or less than two values), "ascending" (non decreasing), "descending" (strictly decreasing),
+    "non_increasing" (decreasing with equal values), or None if values are not sorted.
+
+    Keeping "constant" or "ascending" values, or reversing "descending" values, gives the same order as a stable sort.
+    """
+    is_ascending = True
+    is_descending = True
+    is_strictly_descending = True
+    previous_value = None
+    for idx, value in enumerate(values):
+        if idx > 0:
+            if previous_value > value:
+                is_ascending = False
+            elif previous_value < value:
+                is_descending = False
+                is_strictly_descending = False
+            else:
+                is_strictly_descending = False
+            if not is_ascending and not is_descending:
+                return None
+        previous_value = value
+    if is_ascending and is_descending:
+        return "constant"
+    if is_ascending:
+        return "ascending"
+    return "descending" if is_strictly_descending else "non_increasing"
+
+
 def datetime_to_linear_ticks(t: datetime) -> int:
     return (t-datetime(1,1,1,0,0,0,0, pytz.UTC)).total_seconds() * Constants.TICK_TO_INT_FACTOR
 
@@ -61,10 +92,17 @@ class ColumnGuesserMixin(object):
     pie: ... y
     """
 
+    _chart_sub_tables_key = None
+
     DATAFRAME_QUNATITY_TYPES = ["int64", "float64", "datetime64[ns]", "timedelta64[ns]", "int32"]
     DATAFRAME_TIME_TYPES = ["datetime64[ns]", "timedelta64[ns]"]
 
     def _build_chart_sub_tables(self, properties:dict, name=None, x_type="first") -> list:
+        # sub-tables are cached, keyed by the visualization properties and the data version
+        chart_sub_tables_key = (json.dumps(properties, sort_keys=True, default=str), name, x_type, self._data_version)
+        if self._chart_sub_tables_key == chart_sub_tables_key:
+            return self.chart_sub_tables
+        self._chart_sub_tables_key = None
         self.chart_sub_tables = []
         self._build_columns(name, without_data=True)
 
@@ -100,32 +138,40 @@ class ColumnGuesserMixin(object):
             print("No valid xcolumn")
             return []
 
-        rows = self
+        #
+        # work on the columns values, and an order of rows indexes, instead of sorting and scanning rows
+        #
+        columns_values = self._get_columns_values()
+        x_values = columns_values[x_col_idx]
+        rows_count = len(x_values)
+        rows_order = range(rows_count)
 
         #
         # discover x direction, and always sort ascending
         #
         is_descending_sorted = None
-        if self.columns[x_col_idx].is_quantity and len(rows) >= 2:
-            if  properties.get(VisualizationKeys.IS_QUERY_SORTED) == True:
-                previous_col_value = rows[0][x_col_idx]
-                is_descending_sorted = True
-                for r in rows[1:]:
-                    current_col_value = r[x_col_idx]
-                    if previous_col_value < current_col_value:
-                        is_descending_sorted = False
-                        break
-                    previous_col_value = current_col_value
+        if self.columns[x_col_idx].is_quantity and rows_count >= 2:
+            # one linear pass discovers whether x is already sorted, most query results are
+            sort_order = get_sort_order(x_values)
+            if properties.get(VisualizationKeys.IS_QUERY_SORTED) == True:
+                is_descending_sorted = sort_order in ("descending", "non_increasing", "constant")
 
-            rows = list(reversed(list(self))) if is_descending_sorted else sorted(self, key=lambda row: row[x_col_idx])
+            if is_descending_sorted or sort_order == "descending":
+                rows_order = range(rows_count - 1, -1, -1)
+            elif sort_order not in ("ascending", "constant"):
+                rows_order = sorted(rows_order, key=x_values.__getitem__)
 
         #
         # create a new unique list of col_x values (keep same order)
         #
         col_x = Column(col=self.columns[x_col_idx])
-        for row in rows:
-            if row[x_col_idx] not in col_x:
-                col_x.append(row[x_col_idx])
+        try:
+            col_x.extend(dict.fromkeys([x_values[i] for i in rows_order]))
+        except TypeError:
+            # not hashable x values
+            for i in rows_order:
+                if x_values[i] not in col_x:
+                    col_x.append(x_values[i])
 
         #
         # discover series columns (each combination of values in this columns, is a serie)
@@ -151,54 +197,49 @@ class ColumnGuesserMixin(object):
         # a sub-table for each serie X y-col
         #
         chart_sub_tables_dict = {}
-        for row in rows:
-            for qcol in quantity_columns:
-                if len(series_columns) > 0:
-                    sub_table_name = ":".join([str(row[col.idx]) for col in series_columns]) + ":" + qcol.name
-                else:
-                    sub_table_name = qcol.name
+        series_columns_values = [columns_values[col.idx] for col in series_columns]
+        quantity_columns_values = [(qcol, columns_values[qcol.idx]) for qcol in quantity_columns]
+        for i in rows_order:
+            # series name prefix is computed once per row
+            series_prefix = ":".join([str(values[i]) for values in series_columns_values]) + ":" if len(series_columns) > 0 else ""
+            x_value = x_values[i]
+            for qcol, qcol_values in quantity_columns_values:
+                sub_table_name = series_prefix + qcol.name
                 chart_sub_table = chart_sub_tables_dict.get(sub_table_name)
                 if chart_sub_table is None:
                     chart_sub_table = chart_sub_tables_dict[sub_table_name] = ChartSubTable(
                         name=sub_table_name,
                         col_x=Column(col=self.columns[x_col_idx]),
                         col_y=Column(col=qcol),
-                        mapping=dict(zip(col_x, [None for i in range(len(col_x))])),
+                        mapping=dict.fromkeys(col_x),
                         is_descending_sorted=is_descending_sorted,
                     )
-                chart_sub_table[row[x_col_idx]] = datetime_to_linear_ticks(row[qcol.idx]) if qcol.is_datetime else row[qcol.idx]
+                chart_sub_table[x_value] = datetime_to_linear_ticks(qcol_values[i]) if qcol.is_datetime else qcol_values[i]
         self.chart_sub_tables = list(chart_sub_tables_dict.values())
+        self._chart_sub_tables_key = chart_sub_tables_key
         return self.chart_sub_tables
 
     def _build_columns(self, name=None, without_data=False):
         self.x = Column()
         self.ys = []
 
-        rows = self
-        if name:
-            idx = self.columns_name.index(name)
-            rows = sorted(self, key=lambda row: row[idx])  # sort by index
-
+        # columns types are taken from the schema inferred once per response, not from the rows
         self.columns = [Column(idx, name) for (idx, name) in enumerate(self.columns_name)]
-        if len(self.columns_datafarme_type) > 0:
-            for col in self.columns:
-                datafarme_type = self.columns_datafarme_type[col.idx]
-                col.is_quantity = datafarme_type in self.DATAFRAME_QUNATITY_TYPES
-                col.is_datetime = datafarme_type in self.DATAFRAME_TIME_TYPES
-            if without_data:
-                return
-
-        for row in rows:
-            for (col_idx, col_val) in enumerate(row):
-                col = self.columns[col_idx]
-                if not without_data:
-                    col.append(col_val)
-                if len(self.columns_datafarme_type) == 0:
-                    if (col_val is not None) and (not is_quantity(col_val)):
-                        col.is_quantity = False
-                        col.is_datetime = False
-                    elif not isinstance(col_val, datetime):
-                        col.is_datetime = False
+        for col, col_schema in zip(self.columns, self._get_columns_schema()):
+            col.is_quantity = col_schema["is_quantity"]
+            col.is_datetime = col_schema["is_datetime"]
+        if without_data:
+            return
+
+        columns_values = self._get_columns_values()
+        if name and get_sort_order(columns_values[self.columns_name.index(name)]) not in ("ascending", "constant"):
+            values = columns_values[self.columns_name.index(name)]
+            rows_order = sorted(range(len(values)), key=values.__getitem__)  # sort by index
+            for col, values in zip(self.columns, columns_values):
+                col.extend([values[i] for i in rows_order])
+        else:
+            for col, values in zip(self.columns, columns_values):
+                col.extend(values)
 
     def _get_y(self):
         for idx in range(len(self.columns) - 1, -1, -1):
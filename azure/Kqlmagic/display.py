@@ -5,6 +5,7 @@
 # --------------------------------------------------------------------------
 
 import uuid
+import time
 from IPython.core.display import display, HTML
 from IPython.display import JSON
 
@@ -296,3 +297,29 @@ class Display(object):
     @staticmethod
     def showDangerMessage(msg, **kwargs):
         Display._showMessage(Display.getDangerMessageHtml(msg))
+
+
+class UpdatableDisplay(object):
+    """
+    Html output that is replaced in place on each update.
+    Updates are throttled to at most one per min_interval seconds.
+    """
+
+    def __init__(self, min_interval: float = 0.5):
+        self.min_interval = min_interval
+        self._handle = None
+        self._last_update_time = 0
+
+    def update(self, html_str: str):
+        now = time.time()
+        if now - self._last_update_time < self.min_interval:
+            return
+        self._last_update_time = now
+        if self._handle is None:
+            self._handle = display(HTML(html_str), display_id=True)
+        else:
+            self._handle.update(HTML(html_str))
+
+    def clear(self):
+        if self._handle is not None:
+            self._handle.update(HTML(""))
@@ -0,0 +1,51 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import os
+import io
+import csv
+import gzip
+import hashlib
+
+import requests
+from six.moves.urllib.parse import urlparse, urlunparse
+from six.moves.urllib.request import url2pathname, pathname2url
+
+from Kqlmagic.kql_client import KqlError
+
+
+def to_csv_gz(rows) -> bytes:
+    "returns rows (lists of csv values), as gzip compressed csv"
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\n").writerows(rows)
+    return gzip.compress(text.getvalue().encode("utf-8"))
+
+
+def upload_blob(data: bytes, blob_name: str, container_url: str, timeout=None) -> str:
+    """
+    Uploads data as a block blob to the container, and returns the blob url.
+
+    container_url is a blob container url, with a SAS token that permits write and read, the returned blob url
+    carries the same SAS token, so the service can read it. For tests, container_url can be a local folder (path or file:// url),
+    the data is written to a file in the folder, and the file url is returned.
+    The blob name is prefixed by the data hash, so the same data is uploaded to the same blob.
+    """
+    blob_name = "{0}_{1}".format(hashlib.sha1(data).hexdigest()[:16], blob_name)
+    parts = urlparse(container_url)
+    if parts.scheme not in ["http", "https"]:
+        folder = url2pathname(parts.path) if parts.scheme == "file" else container_url
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.abspath(os.path.join(folder, blob_name))
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return "file:" + pathname2url(file_path)
+
+    blob_url = urlunparse(parts._replace(path="{0}/{1}".format(parts.path.rstrip("/"), blob_name)))
+    request_headers = {"x-ms-blob-type": "BlockBlob", "Content-Type": "application/octet-stream"}
+    response = requests.put(blob_url, data=data, headers=request_headers, timeout=timeout)
+    if response.status_code not in [requests.codes.ok, requests.codes.created]:  # pylint: disable=E1101
+        raise KqlError([response.text], response)
+    return blob_url
@@ -0,0 +1,218 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import uuid
+import weakref
+from collections import OrderedDict
+
+
+def _cell_text(value) -> str:
+    return "" if value is None else str(value)
+
+
+class InteractiveTable(object):
+    """
+    Interactive (paged, sortable and filterable) table view of a ResultSet.
+
+    The table is an ipywidgets widget, so it works in any front end that renders widgets (Jupyter Notebook,
+    JupyterLab, VS Code). The front end holds only the displayed page of rows. Page, sort and filter changes
+    are handled by the kernel, that answers from the in-memory columns values of the result,
+    so payload size and browser memory stay constant, regardless of the number of rows.
+    If ipywidgets is not installed, the first page is displayed as a static table.
+    """
+
+    # rows displayed per page
+    PAGE_SIZE = 100
+    # visible rows in the viewport, the page is scrolled within the viewport
+    VIEWPORT_ROWS = 20
+    # row height and column width, in pixels
+    ROW_HEIGHT = 24
+    COLUMN_WIDTH = 150
+
+    # max number of tables kept for widget requests, least recently used tables are dropped
+    MAX_TABLES = 32
+    _tables = OrderedDict()
+
+    def __init__(self, result_set, **kwargs):
+        self.table_id = "kql_it_" + uuid.uuid4().hex
+        self._result_set_ref = weakref.ref(result_set)
+        self.columns_name = list(result_set.field_names)
+        self.rows_count = len(result_set)
+
+        # view cache, sort index per column, and lower cased rows text for filtering, are computed on demand
+        self._sort_indexes = {}
+        self._rows_text = None
+        self._view_key = None
+        self._view = None
+
+        InteractiveTable._tables[self.table_id] = self
+        while len(InteractiveTable._tables) > InteractiveTable.MAX_TABLES:
+            InteractiveTable._tables.popitem(last=False)
+
+    @classmethod
+    def get_table(cls, table_id):
+        "returns the table, and marks it as recently used, or None if the table was dropped"
+        table = cls._tables.get(table_id)
+        if table is not None:
+            cls._tables.move_to_end(table_id)
+        return table
+
+    def _get_result_set(self):
+        result_set = self._result_set_ref()
+        if result_set is None:
+            raise ValueError("result is not available anymore")
+        return result_set
+
+    def _get_columns_values(self):
+        return self._get_result_set()._get_columns_values()
+
+    def _get_columns_schema(self):
+        return self._get_result_set()._get_columns_schema()
+
+    def _get_sort_index(self, column):
+        "returns rows indexes sorted by column values (ascending), None values last"
+        sort_index = self._sort_indexes.get(column)
+        if sort_index is None:
+            values = self._get_columns_values()[column]
+            sort_index = None
+            if self._get_columns_schema()[column]["type"] != "dynamic":
+                try:
+                    sort_index = sorted(range(self.rows_count), key=lambda i: (values[i] is None, values[i]))
+                except TypeError:
+                    pass
+            if sort_index is None:
+                # dynamic, or not comparable values, sort by text
+                sort_index = sorted(range(self.rows_count), key=lambda i: (values[i] is None, _cell_text(values[i])))
+            self._sort_indexes[column] = sort_index
+        return sort_index
+
+    def _get_filter_mask(self, filter):
+        "returns a list of booleans, True for rows that contain filter text (case insensitive) in any of the columns"
+        if self._rows_text is None:
+            columns_text = [[_cell_text(v).lower() for v in values] for values in self._get_columns_values()]
+            self._rows_text = ["\x1f".join(row_text) for row_text in zip(*columns_text)]
+        filter = filter.lower()
+        return [filter in row_text for row_text in self._rows_text]
+
+    def _get_view(self, sort=None, filter=None):
+        "returns rows indexes of the view, or None if view is all rows in original order"
+        column = sort.get("column") if sort else None
+        ascending = sort.get("ascending", True) if sort else True
+        view_key = (column, ascending, filter or None)
+        if view_key != self._view_key:
+            view = None
+            if column is not None:
+                view = self._get_sort_index(column)
+                if not ascending:
+                    view = view[::-1]
+            if filter:
+                mask = self._get_filter_mask(filter)
+                view = [i for i in (view or range(self.rows_count)) if mask[i]]
+            self._view_key = view_key
+            self._view = view
+        return self._view
+
+    def get_window(self, offset=0, limit=None, sort=None, filter=None, **kwargs):
+        """returns a window of rows, of the sorted and filtered view, as cells text"""
+        limit = limit or self.PAGE_SIZE
+        view = self._get_view(sort, filter)
+        total = self.rows_count if view is None else len(view)
+        offset = max(0, min(offset, total))
+        end = min(total, offset + limit)
+        if view is None:
+            # without sort and filter, only the rows in window are converted (unless the result columns were already converted)
+            result_set = self._get_result_set()
+            table = result_set._queryResult.tables[result_set.fork_table_id]
+            columns_values = table.columns_values_range(offset, end)
+            rows = [[_cell_text(v) for v in row] for row in zip(*columns_values)]
+        else:
+            columns_values = self._get_columns_values()
+            rows = [[_cell_text(values[i]) for values in columns_values] for i in view[offset:end]]
+        return {"offset": offset, "total": total, "rows": rows}
+
+    def _get_window_html(self, window, sort=None):
+        "returns the html of the window rows, within a viewport that scrolls the rows, under a fixed header"
+        cell_style = (
+            "width:{0}px;min-width:{0}px;max-width:{0}px;height:{1}px;padding:0 4px;"
+            "overflow:hidden;white-space:nowrap;text-overflow:ellipsis;text-align:left;".format(self.COLUMN_WIDTH, self.ROW_HEIGHT)
+        )
+        sort_column = sort.get("column") if sort else None
+        sort_marks = {sort_column: " &#9650;" if sort and sort.get("ascending", True) else " &#9660;"}
+        header = "".join(
+            [
+                '<th style="{0}position:sticky;top:0;background:white;">{1}{2}</th>'.format(cell_style, _escape(name), sort_marks.get(idx, ""))
+                for idx, name in enumerate(self.columns_name)
+            ]
+        )
+        rows = "".join(
+            [
+                "<tr>{0}</tr>".format("".join(['<td style="{0}" title="{1}">{1}</td>'.format(cell_style, _escape(cell)) for cell in row]))
+                for row in window["rows"]
+            ]
+        )
+        viewport_height = (min(max(len(window["rows"]), 1), self.VIEWPORT_ROWS) + 1) * self.ROW_HEIGHT
+        return (
+            '<div style="overflow:auto;max-height:{0}px;">'
+            '<table style="table-layout:fixed;border-collapse:collapse;"><thead><tr>{1}</tr></thead><tbody>{2}</tbody></table>'
+            "</div>".format(viewport_height + 20, header, rows)
+        )
+
+    def get_widget(self):
+        """returns the table widget, with the first page of rows, or None if ipywidgets is not installed.
+        The widget refers the table by its id, so a dropped table (see MAX_TABLES) is released, and the widget reports it"""
+        try:
+            import ipywidgets
+        except ImportError:
+            return None
+
+        table_id = self.table_id
+        page_size = self.PAGE_SIZE
+        filter_text = ipywidgets.Text(placeholder="filter", continuous_update=False, layout=ipywidgets.Layout(width="200px"))
+        sort_column = ipywidgets.Dropdown(
+            options=[("no sort", None)] + [(name, idx) for idx, name in enumerate(self.columns_name)], layout=ipywidgets.Layout(width="160px")
+        )
+        descending = ipywidgets.ToggleButton(value=False, description="descending", layout=ipywidgets.Layout(width="100px"))
+        prev_button = ipywidgets.Button(description="previous", layout=ipywidgets.Layout(width="80px"))
+        next_button = ipywidgets.Button(description="next", layout=ipywidgets.Layout(width="80px"))
+        status = ipywidgets.Label()
+        rows_html = ipywidgets.HTML()
+        state = {"offset": 0}
+
+        def _render(offset):
+            table = InteractiveTable.get_table(table_id)
+            if table is None:
+                status.value = "table is not available anymore, rerun the cell"
+                prev_button.disabled = next_button.disabled = True
+                return
+            sort = {"column": sort_column.value, "ascending": not descending.value} if sort_column.value is not None else None
+            window = table.get_window(offset, page_size, sort=sort, filter=filter_text.value)
+            state["offset"] = window["offset"]
+            end = window["offset"] + len(window["rows"])
+            rows_html.value = table._get_window_html(window, sort=sort)
+            status.value = "{0} rows, displaying rows {1} to {2}".format(window["total"], min(window["offset"] + 1, end), end)
+            prev_button.disabled = window["offset"] == 0
+            next_button.disabled = end >= window["total"]
+
+        filter_text.observe(lambda change: _render(0), names="value")
+        sort_column.observe(lambda change: _render(0), names="value")
+        descending.observe(lambda change: _render(0), names="value")
+        prev_button.on_click(lambda button: _render(state["offset"] - page_size))
+        next_button.on_click(lambda button: _render(state["offset"] + page_size))
+        _render(0)
+        controls = ipywidgets.HBox([filter_text, sort_column, descending, prev_button, next_button, status])
+        return ipywidgets.VBox([controls, rows_html])
+
+    def get_html(self):
+        """returns the static html of the first page of rows, used when widgets are not available"""
+        window = self.get_window(0, self.PAGE_SIZE)
+        message = "{0} rows, displaying first {1} rows (interactive mode requires the ipywidgets package)".format(
+            window["total"], len(window["rows"])
+        )
+        return '{0}\n<span style="font-style:italic;">{1}</span>'.format(self._get_window_html(window), message)
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
@@ -56,6 +56,8 @@ class KqlResponseTable(six.Iterator):
             self.index2type_mapping.append(ctype)
         self.row_index = 0
         self._rows_count = sum([1 for r in self.rows if isinstance(r,list)]) # len(self.rows)
+        self._columns_values = None
+        self._columns_converters = None
         # Here we keep converter functions for each type that we need to take special care (e.g. convert)
 
         # index MUST be lowercase !!!
@@ -104,18 +106,62 @@ class KqlResponseTable(six.Iterator):
     def __next__(self):
         if self.row_index >= self.rows_count:
             raise StopIteration
-        row = self.rows[self.row_index]
-        result_dict = {}
-        for index, value in enumerate(row):
-            data_type = self.index2type_mapping[index].lower()
-            column_name = self.index2column_mapping[index]
-            if data_type in self.converters_lambda_mappings:
-                value = self.converters_lambda_mappings[data_type](value)
-            elif self.rows_count == 1 and self.columns_count == 1 and column_name == "DatabaseSchema" and data_type == "string":
-                value = self.to_object(value)
-            result_dict[column_name] = value
+        row_index = self.row_index
+        if self._columns_values is not None:
+            values = [column_values[row_index] for column_values in self._columns_values]
+        else:
+            # only the fetched row is converted, so a limited fetch doesn't convert the whole table
+            row = self.rows[row_index]
+            converters = self._get_columns_converters()
+            values = [converter(value) if converter is not None else value for converter, value in zip(converters, row)]
         self.row_index = self.row_index + 1
-        return KqlResult(self.index2column_mapping, result_dict)
+        return KqlResult(self.index2column_mapping, dict(zip(self.index2column_mapping, values)))
+
+    def columns_values(self):
+        """ Returns a list of columns, each a list of the column converted values, of all the rows.
+        Values are converted column-wise once, and cached """
+        if self._columns_values is None:
+            self._columns_values = self.columns_values_range(0, self.rows_count)
+        return self._columns_values
+
+    def _get_columns_converters(self):
+        if self._columns_converters is None:
+            self._columns_converters = [self._get_column_converter(index) for index in range(self.columns_count)]
+        return self._columns_converters
+
+    def _get_column_converter(self, index):
+        data_type = self.index2type_mapping[index].lower()
+        converter = self.converters_lambda_mappings.get(data_type)
+        if (
+            converter is None
+            and self.rows_count == 1
+            and self.columns_count == 1
+            and self.index2column_mapping[index] == "DatabaseSchema"
+            and data_type == "string"
+        ):
+            converter = self.to_object
+        return converter
+
+    def column_values_range(self, index, start, end):
+        """ Returns the column converted values of rows in range start to end.
+        If columns were not converted yet, only the rows in range are converted, and they are not cached """
+        if self._columns_values is not None:
+            return self._columns_values[index][start:end]
+        values = [row[index] for row in self.rows[start : min(end, self.rows_count)]]
+        converter = self._get_columns_converters()[index]
+        return list(map(converter, values)) if converter is not None else values
+
+    def columns_values_range(self, start, end):
+        """ Returns a list of columns converted values of rows in range start to end.
+        If columns were not converted yet, only the rows in range are converted, and they are not cached """
+        return [self.column_values_range(index, start, end) for index in range(self.columns_count)]
+
+    def iter_columns_chunks(self, chunk_size, size=None):
+        """ Returns iterator over chunks of rows, each chunk is a list of columns converted values.
+        Chunks are converted on the fly, to keep memory bounded """
+        rows_count = self.rows_count if size is None else min(size, self.rows_count)
+        for start in range(0, rows_count, chunk_size):
+            yield self.columns_values_range(start, min(start + chunk_size, rows_count))
 
     @property
     def columns_name(self):
@@ -146,6 +192,106 @@ class KqlResponseTable(six.Iterator):
         return self.__iter__()
 
 
+_JSON_ARRAY_DELIMITERS = "[], \r\n\t"
+
+# json complete strings, braces, and a string start, of a string that continues in the next chunk
+_JSON_STRUCTURE_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]|"')
+
+
+def iter_json_array(chunks):
+    """yields the object items of a json array (such as v2 response frames), received as text chunks, as soon as each item is complete.
+    Item boundaries are found by scanning each chunk once, by the braces and the strings (that may contain braces),
+    so each item is decoded once, when it is complete, whatever the number of chunks it was received in"""
+    depth = 0
+    # the text of an unterminated string, from its start quote, that continues in the next chunk
+    open_string = None
+    item_parts = []
+    for chunk in chunks:
+        start = 0
+        pos = 0
+        if open_string is not None:
+            # a string can only end with a complete string match, from its start quote
+            text = open_string + chunk
+            match = _JSON_STRUCTURE_PATTERN.match(text)
+            if match.group() == '"':
+                open_string = text
+                item_parts.append(chunk)
+                continue
+            pos = match.end() - len(open_string)
+            open_string = None
+        for match in _JSON_STRUCTURE_PATTERN.finditer(chunk, pos):
+            token = match.group()
+            if token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+                if depth == 0:
+                    item_parts.append(chunk[start : match.end()])
+                    yield json.loads("".join(item_parts).lstrip(_JSON_ARRAY_DELIMITERS))
+                    item_parts = []
+                    start = match.end()
+            elif token == '"':
+                open_string = chunk[match.start() :]
+                break
+        item_parts.append(chunk[start:])
+    rest = "".join(item_parts).strip(_JSON_ARRAY_DELIMITERS)
+    if rest:
+        raise ValueError("incomplete json array item: {0}".format(rest[:100]))
+
+
+class KqlProgressiveFrames(object):
+    """
+    Merges progressive v2 frames (TableHeader, TableFragment, TableProgress, TableCompletion) of each table to a DataTable frame,
+    at the position of the table header frame. Other frames are kept as is.
+    Frames are added one by one, as they are received, so the merged tables can be displayed while the query runs.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.tables = {}
+        self.progress = {}
+        self.completed = set()
+
+    def add(self, frame: dict):
+        frame_type = frame["FrameType"]
+        if frame_type == "TableHeader":
+            table = {k: v for k, v in frame.items() if k != "FrameType"}
+            table["FrameType"] = "DataTable"
+            table["Rows"] = []
+            self.tables[frame["TableId"]] = table
+            self.frames.append(table)
+        elif frame_type == "TableFragment":
+            table = self.tables[frame["TableId"]]
+            if frame.get("TableFragmentType") == "DataReplace":
+                table["Rows"] = list(frame["Rows"])
+            else:
+                table["Rows"].extend(frame["Rows"])
+        elif frame_type == "TableProgress":
+            self.progress[frame["TableId"]] = frame.get("TableProgress")
+        elif frame_type == "TableCompletion":
+            self.completed.add(frame["TableId"])
+        else:
+            self.frames.append(frame)
+
+    @property
+    def primary_table(self):
+        "returns the first primary result table (DataTable frame), or None if it was not received yet"
+        for frame in self.frames:
+            if frame["FrameType"] == "DataTable" and frame.get("TableKind") == "PrimaryResult":
+                return frame
+        return None
+
+    @property
+    def primary_progress(self):
+        "returns the progress (percent) of the first primary result table, or None if unknown"
+        table = self.primary_table
+        if table is None:
+            return None
+        if table["TableId"] in self.completed:
+            return 100.0
+        return self.progress.get(table["TableId"])
+
+
 class KqlSchemaResponse(object):
     def __init__(self, json_response):
         self.json_response = json_response
@@ -168,6 +314,8 @@ class KqlQueryResponse(object):
         self.endpoint_version = endpoint_version
         self.visualization = None
         if self.endpoint_version == "v2":
+            if any(f["FrameType"] == "TableHeader" for f in json_response):
+                json_response = self.json_response = self._merge_progressive_frames(json_response)
             self.all_tables = [t for t in json_response if t["FrameType"] == "DataTable"]
             self.tables = [t for t in json_response if t["FrameType"] == "DataTable" and t["TableKind"] == "PrimaryResult"]
             self.primary_results = [KqlResponseTable(t["TableId"], t) for t in self.tables]
@@ -192,6 +340,14 @@ class KqlQueryResponse(object):
         except:
             return "v2"
 
+    @staticmethod
+    def _merge_progressive_frames(frames: list) -> list:
+        "merges progressive v2 frames of each table to a DataTable frame"
+        progressive_frames = KqlProgressiveFrames()
+        for frame in frames:
+            progressive_frames.add(frame)
+        return progressive_frames.frames
+
     @property
     def visualization_results(self):
         if self.visualization is None:
@@ -56,6 +56,10 @@ class KqlEngine(object):
     def get_client(self):
         return self.client
 
+    def supports_query_parameters(self):
+        "returns True if the client sends the values of the parameters declared by a declare query_parameters statement"
+        return False
+
     def client_execute(self, query, user_namespace=None, **options):
         if query.strip():
             client = self.get_client()
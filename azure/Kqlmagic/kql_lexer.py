@@ -0,0 +1,178 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+"""
+Single pass KQL lexer.
+
+The query is scanned once, by one compiled regular expression, into a stream of tokens: comments, string literals,
+identifiers, numbers, operators, punctuation and whitespace. Every character of the query belongs to exactly one token,
+so joining the tokens text restores the query.
+Comment markers, semicolons and equal signs that are inside string literals are part of the string token, so code that
+works on the token stream (comments removal, statements split, let assignment split, blank lines split) is not fooled by
+string literals that contain them, such as urls.
+"""
+
+import re
+from collections import namedtuple
+
+
+class TokenKind(object):
+    COMMENT = "comment"
+    STRING = "string"
+    WHITESPACE = "whitespace"
+    IDENTIFIER = "identifier"
+    NUMBER = "number"
+    OPERATOR = "operator"
+    PUNCTUATION = "punctuation"
+
+
+Token = namedtuple("Token", ["kind", "text", "start"])
+
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*)
+    |(?P<string>
+        [hH]?(?:```[\s\S]*?(?:```|\Z)|~~~[\s\S]*?(?:~~~|\Z))      # multi-line string literal
+        |[hH]?@(?:'(?:[^'\n]|'')*'?|"(?:[^"\n]|"")*"?)            # verbatim string literal, quote is escaped by doubling it
+        |[hH]?(?:'(?:[^'\\\n]|\\.)*'?|"(?:[^"\\\n]|\\.)*"?)      # string literal, with backslash escapes
+    )
+    |(?P<whitespace>\s+)
+    |(?P<identifier>[A-Za-z_$][\w$]*)
+    |(?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?[A-Za-z]*)
+    |(?P<operator><\||==|!=|=~|!~|<=|>=|=>|<>|\.\.)
+    |(?P<punctuation>.)
+    """,
+    re.VERBOSE,
+)
+
+_OPENING_BRACKETS = ("(", "[", "{")
+_CLOSING_BRACKETS = (")", "]", "}")
+
+
+def tokenize(query: str) -> list:
+    "returns the list of the query tokens"
+    return [Token(match.lastgroup, match.group(), match.start()) for match in _TOKEN_PATTERN.finditer(query)]
+
+
+def _ensure_tokens(query_or_tokens) -> list:
+    return tokenize(query_or_tokens) if isinstance(query_or_tokens, str) else query_or_tokens
+
+
+def to_text(tokens: list) -> str:
+    "returns the text of the tokens"
+    return "".join(token.text for token in tokens)
+
+
+def strip_comments(query_or_tokens) -> str:
+    "returns the query text without comments, line breaks are kept"
+    return to_text(token for token in _ensure_tokens(query_or_tokens) if token.kind != TokenKind.COMMENT)
+
+
+def iter_lines(query_or_tokens):
+    """yields for each line of the query, a tuple of the line code (without the line break) and the line comment,
+    or None if the line has no comment. Multi-line string literals are split between the lines they span"""
+    code = []
+    for token in _ensure_tokens(query_or_tokens):
+        if token.kind == TokenKind.COMMENT:
+            yield "".join(code), token.text
+            code = None
+        elif "\n" in token.text:
+            parts = token.text.split("\n")
+            if code is not None:
+                code.append(parts[0])
+                yield "".join(code), None
+            for part in parts[1:-1]:
+                yield part, None
+            code = [parts[-1]]
+        elif code is None:
+            # a comment ends at the line break, so a token after it can only be a line break
+            code = [token.text]
+        else:
+            code.append(token.text)
+    if code is not None:
+        yield "".join(code), None
+
+
+def split(query_or_tokens, separator: str, max_split: int = -1) -> list:
+    """splits the tokens at the top level separator tokens (that are not within brackets),
+    returns a list of tokens lists, the separator tokens are not included"""
+    parts = [[]]
+    depth = 0
+    for token in _ensure_tokens(query_or_tokens):
+        if token.kind == TokenKind.PUNCTUATION or token.kind == TokenKind.OPERATOR:
+            if token.text in _OPENING_BRACKETS:
+                depth += 1
+            elif token.text in _CLOSING_BRACKETS:
+                depth = max(depth - 1, 0)
+            elif token.text == separator and depth == 0 and (max_split < 0 or len(parts) <= max_split):
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    return parts
+
+
+def split_statements(query_or_tokens) -> list:
+    "returns the query statements text, without comments, split at the top level semicolons"
+    tokens = [token for token in _ensure_tokens(query_or_tokens) if token.kind != TokenKind.COMMENT]
+    return [to_text(statement) for statement in split(tokens, ";")]
+
+
+def code_tokens(tokens: list) -> list:
+    "returns the tokens without whitespace and comment tokens"
+    return [token for token in tokens if token.kind != TokenKind.WHITESPACE and token.kind != TokenKind.COMMENT]
+
+
+def split_let_statement(statement: str):
+    """returns the tuple (name, value tokens) of a let statement, value tokens are without whitespace and comments,
+    or None if statement is not a let statement"""
+    parts = split(statement, "=", max_split=1)
+    if len(parts) != 2:
+        return None
+    name_tokens = code_tokens(parts[0])
+    if len(name_tokens) != 2 or name_tokens[0].text != "let" or name_tokens[1].kind != TokenKind.IDENTIFIER:
+        return None
+    return name_tokens[1].text, code_tokens(parts[1])
+
+
+def split_blank_lines(query: str) -> list:
+    """returns the query parts, split at blank lines (a blank line within a multi-line string literal doesn't split).
+    Whitespace between parts is dropped, whitespace only parts are dropped"""
+    parts = [[]]
+    for token in tokenize(query):
+        if token.kind == TokenKind.WHITESPACE and token.text.count("\n") >= 2:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return [to_text(part) for part in parts if any(token.kind != TokenKind.WHITESPACE for token in part)]
+
+
+def insert_before_render(query: str, operator: str) -> str:
+    """returns the query with the tabular operator (a '| operator ...' text) inserted before the top level render operator,
+    or appended after the last statement, if the query has no render operator"""
+    tokens = tokenize(query)
+    depth = 0
+    render_token = None
+    last_code_token = None
+    for idx, token in enumerate(tokens):
+        if token.kind == TokenKind.WHITESPACE or token.kind == TokenKind.COMMENT:
+            continue
+        if token.text in _OPENING_BRACKETS:
+            depth += 1
+        elif token.text in _CLOSING_BRACKETS:
+            depth = max(depth - 1, 0)
+        elif token.text == "|" and depth == 0:
+            next_tokens = code_tokens(tokens[idx + 1 : idx + 4])
+            if len(next_tokens) > 0 and next_tokens[0].text == "render":
+                render_token = token
+        if token.text != ";" or depth > 0:
+            last_code_token = token
+    if render_token is not None:
+        return "{0}{1} {2}".format(query[: render_token.start], operator, query[render_token.start :])
+    if last_code_token is None:
+        return query
+    idx = last_code_token.start + len(last_code_token.text)
+    return "{0}\n{1}{2}".format(query[:idx], operator, query[idx:])
@@ -29,9 +29,11 @@ from Kqlmagic.connection import Connection
 
 from Kqlmagic.parser import Parser
 from Kqlmagic.parameterizer import Parameterizer
+from Kqlmagic.query_rewriter import QueryRewriter
+from Kqlmagic.query_sweep import QuerySweep
 
 from Kqlmagic.log import Logger, logger, set_logger, create_log_context, set_logging_options
-from Kqlmagic.display import Display
+from Kqlmagic.display import Display, UpdatableDisplay
 from Kqlmagic.database_html import Database_html
 from Kqlmagic.help_html import Help_html
 from Kqlmagic.kusto_engine import KustoEngine
@@ -90,7 +92,12 @@ class Kqlmagic(Magics, Configurable):
     timeout = Int(None, config=True, allow_none=True, help="Specifies the maximum time in seconds, to wait for a query response. None, means default http wait time. Abbreviation: to, wait")
     plot_package = Enum(["matplotlib", "plotly"], "plotly", config=True, help="Set the plot package. Abbreviation: pp")
     table_package = Enum(
-        ["prettytable", "pandas", "plotly", "qgrid"], "prettytable", config=True, help="Set the table display package. Abbreviation: tp"
+        ["prettytable", "pandas", "plotly", "qgrid", "interactive"],
+        "prettytable",
+        config=True,
+        help="Set the table display package. "
+        "interactive, displays a paged, sortable and filterable table widget, that fetches rows from the kernel on demand "
+        "(requires ipywidgets). Abbreviation: tp",
     )
     last_raw_result_var = Unicode(
         "_kql_raw_result_", config=True, help="Set the name of the variable that will contain last raw result. Abbreviation: var"
@@ -102,6 +109,100 @@ class Kqlmagic(Magics, Configurable):
         config=True,
         help="Include plotly javascript code in popup window. If set to False (default), it download the script from https://cdn.plot.ly/plotly-latest.min.js. Abbreviation: pfi",
     )
+    chart_max_points = Int(
+        10000,
+        config=True,
+        allow_none=True,
+        help="Downsample each serie of line, area and time charts to at most max points, keeping the min and max values of each bucket. "
+        "None or 0, means no downsampling. Abbreviation: cmp",
+    )
+    chart_max_categories = Int(
+        100,
+        config=True,
+        allow_none=True,
+        help="Aggregate pie, bar and column charts categories to the top max categories (by value), "
+        "the rest of the categories are summed into a single 'other' category. None or 0, means no aggregation. Abbreviation: cmc",
+    )
+    chart_engine = Enum(
+        ["auto", "webgl", "svg"],
+        "auto",
+        config=True,
+        help="Set the rendering engine of scatter, line and time charts. "
+        "auto, switches from svg to webgl when the number of points is above chart_webgl_threshold. Abbreviation: ce",
+    )
+    chart_webgl_threshold = Int(
+        50000, config=True, help="Number of chart points above which auto chart_engine renders with webgl. Abbreviation: cwt"
+    )
+
+    live_window = Int(
+        10000,
+        config=True,
+        allow_none=True,
+        help="Max number of points retained by each serie of a live chart. None or 0, means unlimited. Abbreviation: lw",
+    )
+
+    params_inline_max_size = Int(
+        1000000,
+        config=True,
+        allow_none=True,
+        help="Max size (in characters) of a DataFrame or list python parameter, inlined in the query as a datatable or dynamic literal. "
+        "Larger parameters are uploaded to params_upload_url as gzip compressed csv, and referenced as externaldata. "
+        "None or 0, means always inline. Abbreviation: pims",
+    )
+    params_upload_url = Unicode(
+        None,
+        config=True,
+        allow_none=True,
+        help="Blob container url, with a SAS token that permits write and read, to upload large python parameters to. "
+        "None, means large parameters are inlined. Abbreviation: puu",
+    )
+    params_declare = Bool(
+        False,
+        config=True,
+        help="Declare scalar and dynamic python parameters by a declare query_parameters statement, and send their values in the request properties, "
+        "instead of inlining them as let statements. The query text doesn't change when the values change. "
+        "Supported by kusto, other engines get the values inlined. Abbreviation: pdc",
+    )
+
+    query_results_cache_max_age = Unicode(
+        None,
+        config=True,
+        allow_none=True,
+        help="Request property, max age of a cached query result, that the service can return instead of running the query, "
+        "timespan formatted as [d.]hh:mm:ss. None, means the service results cache is not used. Abbreviation: qrcma",
+    )
+    truncation_max_size = Int(
+        None,
+        config=True,
+        allow_none=True,
+        help="Request property, max overall data size (in bytes) returned by the query. None, means service default. Abbreviation: tms",
+    )
+    server_timeout = Unicode(
+        None,
+        config=True,
+        allow_none=True,
+        help="Request property, query timeout on the service side, timespan formatted as [d.]hh:mm:ss. "
+        "None, means service default. Abbreviation: sto",
+    )
+    query_datascope = Enum(
+        ["default", "all", "hotcache"],
+        None,
+        config=True,
+        allow_none=True,
+        help="Request property, query data scope, hotcache restricts the query to the hot cache data. None, means service default. Abbreviation: qds",
+    )
+    results_progressive_enabled = Bool(
+        False,
+        config=True,
+        help="Request property, the service returns the results progressively, as table fragments. Abbreviation: rpe",
+    )
+
+    sweep_max_workers = Int(
+        8,
+        config=True,
+        allow_none=True,
+        help="Max number of concurrent queries of a sweep (-sweep option). None or 0, means python default. Abbreviation: smw",
+    )
 
     validate_connection_string = Bool(
         True, config=True, help="Validate connectionString with an implicit query, when query statement is missing. Abbreviation: vc"
@@ -201,7 +302,6 @@ class Kqlmagic(Magics, Configurable):
 
         set_logger(Logger())
         ip = get_ipython()  # pylint: disable=E0602
-        ip.magic("matplotlib inline")
 
         # Add ourself to the list of module configurable via %config
         self.shell.configurables.append(self)
@@ -498,6 +598,51 @@ class Kqlmagic(Magics, Configurable):
         if self.notebook_app != "jupyterlab":
             display(Javascript("""try {IPython.notebook.kernel.execute("NOTEBOOK_URL = '" + window.location + "'");} catch(err) {;}"""))
 
+    _PROGRESS_DISPLAY_MAX_ROWS = 10
+
+    def _get_progress_callback(self, progress_display, **options):
+        max_rows = min(options.get("display_limit") or self._PROGRESS_DISPLAY_MAX_ROWS, self._PROGRESS_DISPLAY_MAX_ROWS)
+
+        def _progress_callback(progressive_frames):
+            table = progressive_frames.primary_table
+            rows = table["Rows"] if table is not None else []
+            progress = progressive_frames.primary_progress
+            msg = "receiving results: {0} records".format(len(rows))
+            if progress is not None:
+                msg += " ({0:.0f}%)".format(progress)
+            body = Display.getInfoMessageHtml(msg).get("body")
+            if len(rows) > 0:
+                import pandas
+
+                columns = [col["ColumnName"] for col in table["Columns"]]
+                body += pandas.DataFrame(rows[:max_rows], columns=columns).to_html(index=False)
+            progress_display.update(Display.toHtml(body=body))
+
+        return _progress_callback
+
+    def _execute_sweep(self, conn, query, params_dict, user_ns: dict, start_time, **options):
+        sweep = QuerySweep(options.get("sweep"))
+        result = sweep.execute(conn, query, params_dict, user_ns, max_workers=options.get("sweep_max_workers", self.sweep_max_workers), **options)
+        end_time = time.time()
+
+        feedback_info = []
+        if options.get("feedback", self.feedback):
+            minutes, seconds = divmod(end_time - start_time, 60)
+            feedback_info.append(
+                "Done ({:0>2}:{:06.3f}): {} parameter sets, {} records".format(int(minutes), seconds, len(sweep.param_sets), len(result))
+            )
+
+        if options.get("result_var"):
+            result_var = options["result_var"]
+            if options.get("feedback", self.feedback):
+                feedback_info.append("Returning data to local variable {}".format(result_var))
+            self.shell.user_ns.update({result_var: result})
+            result = None
+
+        if len(feedback_info) > 0 and not options.get("suppress_results"):
+            Display.showSuccessMessage(feedback_info)
+        return None if options.get("suppress_results") else result
+
     def execute_query(self, parsed, user_ns: dict, result_set=None):
         if Help_html.showfiles_base_url is None:
             window_location = user_ns.get("NOTEBOOK_URL")
@@ -592,12 +737,36 @@ class Kqlmagic(Magics, Configurable):
             start_time = time.time()
 
             params_dict = options.get("params_dict") or user_ns
-            parametrized_query = Parameterizer(params_dict).expand(query) if result_set is None else result_set.parametrized_query
-            raw_query_result = conn.execute(parametrized_query, user_ns, **options)
+            # only engines that send the query parameters values can declare them, other engines get the values as let statements literals
+            if options.get("params_declare") and not conn.supports_query_parameters():
+                options["params_declare"] = False
+
+            if options.get("sweep") and result_set is None:
+                return self._execute_sweep(conn, query, params_dict, user_ns, start_time, **options)
+
+            if result_set is None:
+                parameterizer = Parameterizer(params_dict)
+                parametrized_query = parameterizer.expand(query, **options)
+                parametrized_query = QueryRewriter().rewrite(parametrized_query, **options)
+                # declared query parameters values are sent with the query, and kept in options for the result set refresh
+                options["query_parameters"] = parameterizer.query_parameters
+            else:
+                parametrized_query = result_set.parametrized_query
+            # progressive results are displayed while they are received, as a records counter and the first records
+            progress_display = None
+            execute_options = options
+            if options.get("results_progressive_enabled") and not suppress_results:
+                progress_display = UpdatableDisplay()
+                execute_options = {**options, "progress_callback": self._get_progress_callback(progress_display, **options)}
+            try:
+                raw_query_result = conn.execute(parametrized_query, user_ns, **execute_options)
+            finally:
+                if progress_display is not None:
+                    progress_display.clear()
 
             end_time = time.time()
 
-            if options.get("save_as") is not None:
+            if options.get("save_as") is not None and not ResultSet.is_export_file(options.get("save_as")):
                 save_as_file_path = CacheClient().save(
                     raw_query_result, conn.get_database(), conn.get_cluster(), parametrized_query, filepath=options.get("save_as"), **options
                 )
@@ -667,6 +836,9 @@ class Kqlmagic(Magics, Configurable):
                     saved_result.feedback_info.append("query results cached")
 
             if options.get("save_as") is not None:
+                if ResultSet.is_export_file(options.get("save_as")):
+                    # csv, parquet and jsonl are streamed from the response rows, instead of saving the raw json response
+                    save_as_file_path = saved_result.export(options.get("save_as")).file_or_image
                 if options.get("feedback", self.feedback):
                     saved_result.feedback_info.append("query results saved as {0}".format(save_as_file_path))
             if options.get("save_to") is not None:
@@ -689,6 +861,11 @@ class Kqlmagic(Magics, Configurable):
             else:
                 saved_result._update_fork_results()
 
+            if options.get("live") and result_set is None:
+                saved_result.start_live(options.get("live"), options.get("live_window", self.live_window))
+                if options.get("feedback", self.feedback):
+                    saved_result.feedback_info.append("live chart, updated every {0} seconds".format(options.get("live")))
+
             # Return results into the default ipython _ variable
             self.shell.user_ns.update({options.get("last_raw_result_var", self.last_raw_result_var): saved_result})
 
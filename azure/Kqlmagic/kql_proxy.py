@@ -6,7 +6,9 @@
 
 import six
 import json
+from datetime import datetime
 from Kqlmagic.display import Display
+from Kqlmagic.column_guesser import ColumnGuesserMixin, is_quantity
 
 
 class KqlRow(six.Iterator):
@@ -96,6 +98,7 @@ class KqlTableResponse(object):
         self.visualization_results = visualization_results
         self.data_table = data_table
         self.columns_count = self.data_table.columns_count
+        self._columns_schema = None
 
     def fetchall(self):
         return KqlRowsIter(self.data_table, self.data_table.rows_count, self.data_table.columns_count, **self.kwargs)
@@ -103,6 +106,25 @@ class KqlTableResponse(object):
     def fetchmany(self, size):
         return KqlRowsIter(self.data_table, min(size, self.data_table.rows_count), self.data_table.columns_count, **self.kwargs)
 
+    def columns_values(self, size=None):
+        """returns a list of columns values lists, limited to size rows if specified.
+        A limited size doesn't convert (or cache) the rows beyond size"""
+        if size is not None and size < self.data_table.rows_count:
+            return self.data_table.columns_values_range(0, size)
+        return self.data_table.columns_values()
+
+    def columns_values_range(self, start, end):
+        "returns a list of columns values lists, of rows in range start to end"
+        return self.data_table.columns_values_range(start, end)
+
+    def column_values_range(self, index, start, end):
+        "returns the column values, of rows in range start to end"
+        return self.data_table.column_values_range(index, start, end)
+
+    def iter_columns_chunks(self, chunk_size, size=None):
+        "returns iterator over chunks of rows, each chunk is a list of columns values lists"
+        return self.data_table.iter_columns_chunks(chunk_size, size=size)
+
     def rowcount(self):
         return self.data_table.rows_count
 
@@ -130,6 +152,43 @@ class KqlTableResponse(object):
     def datafarme_types(self):
         return [self.KQL_TO_DATAFRAME_DATA_TYPES.get(t) for t in self.data_table.columns_type]
 
+    @property
+    def columns_schema(self):
+        """ returns the inferred schema of the columns, a list of dicts with keys:
+        name, type, dataframe_type, is_quantity, is_datetime and has_nulls.
+        Inferred in a single pass, once per response, and shared by charts, dataframe and table rendering.
+        type is the lower cased kql type (v1 responses DataType is capitalized), as compared by to_dataframe """
+        if self._columns_schema is None:
+            # columns with nulls, found in one pass over the rows, only rows with nulls are scanned by value
+            null_columns = set()
+            for row in self.data_table.rows[: self.data_table.rows_count]:
+                if None in row:
+                    null_columns.update(idx for idx, val in enumerate(row) if val is None)
+            columns_schema = []
+            for idx, (name, col_type) in enumerate(zip(self.data_table.columns_name, self.data_table.columns_type)):
+                col_type = col_type.lower()
+                dataframe_type = self.KQL_TO_DATAFRAME_DATA_TYPES.get(col_type)
+                if dataframe_type is not None:
+                    col_is_quantity = dataframe_type in ColumnGuesserMixin.DATAFRAME_QUNATITY_TYPES
+                    col_is_datetime = dataframe_type in ColumnGuesserMixin.DATAFRAME_TIME_TYPES
+                else:
+                    # unknown kql type, infer from the converted values
+                    converted_values = self.data_table.column_values_range(idx, 0, self.data_table.rows_count)
+                    col_is_quantity = all(v is None or is_quantity(v) for v in converted_values)
+                    col_is_datetime = col_is_quantity and all(v is None or isinstance(v, datetime) for v in converted_values)
+                columns_schema.append(
+                    {
+                        "name": name,
+                        "type": col_type,
+                        "dataframe_type": dataframe_type,
+                        "is_quantity": col_is_quantity,
+                        "is_datetime": col_is_datetime,
+                        "has_nulls": idx in null_columns,
+                    }
+                )
+            self._columns_schema = columns_schema
+        return self._columns_schema
+
     def _map_columns_to_index(self, columns: list):
         map = {}
         for idx, col in enumerate(columns):
@@ -149,27 +208,23 @@ class KqlTableResponse(object):
 
         frame = pandas.DataFrame(self.data_table.rows, columns=self.data_table.columns_name)
 
-        for (idx, col_name) in enumerate(self.data_table.columns_name):
-            col_type = self.data_table.columns_type[idx].lower()
+        for col_schema in self.columns_schema:
+            col_name = col_schema["name"]
+            col_type = col_schema["type"]
             if col_type == "timespan":
                 frame[col_name] = pandas.to_timedelta(
                     frame[col_name].apply(lambda t: t.replace(".", " days ") if t and "." in t.split(":")[0] else t)
                 )
             elif col_type == "dynamic":
                 frame[col_name] = frame[col_name].apply(lambda x: self._dynamic_to_object(x))
-            elif col_type in self.KQL_TO_DATAFRAME_DATA_TYPES:
-                pandas_type = self.KQL_TO_DATAFRAME_DATA_TYPES[col_type]
+            elif col_schema["dataframe_type"] is not None:
+                pandas_type = col_schema["dataframe_type"]
                 # NA type promotion
-                if pandas_type == "int64" or pandas_type == "int32":
-                    for i in range(0, len(frame[col_name])):
-                        if frame[col_name][i] is None or str( frame[col_name][i]) == "nan":
-                            pandas_type = "float64"
-                            break
-                elif pandas_type == "bool":
-                    for i in range(0, len(frame[col_name])) or str( frame[col_name][i]) == "nan":
-                        if frame[col_name][i] is None:
-                            pandas_type = "object"
-                            break
+                if col_schema["has_nulls"]:
+                    if pandas_type == "int64" or pandas_type == "int32":
+                        pandas_type = "float64"
+                    elif pandas_type == "bool":
+                        pandas_type = "object"
                 frame[col_name] = frame[col_name].astype(pandas_type, errors="raise" if raise_errors else "ignore")
         return frame
 
@@ -13,7 +13,7 @@ import dateutil.parser
 import requests
 
 from Kqlmagic.my_aad_helper import _MyAadHelper, ConnKeysKCSB
-from Kqlmagic.kql_client import KqlQueryResponse, KqlError
+from Kqlmagic.kql_client import KqlQueryResponse, KqlError, KqlProgressiveFrames, iter_json_array
 from Kqlmagic.constants import Constants, ConnStrKeys
 from Kqlmagic.version import VERSION
 
@@ -47,6 +47,18 @@ class Kusto_Client(object):
     _QUERY_ENDPOINT_VERSION = "v2"
     _MGMT_ENDPOINT_TEMPLATE = "{0}/{1}/rest/mgmt"
     _QUERY_ENDPOINT_TEMPLATE = "{0}/{1}/rest/query"
+
+    _STREAM_CHUNK_SIZE = 64 * 1024
+    _PROGRESS_FRAME_TYPES = ("TableHeader", "TableFragment", "TableProgress", "TableCompletion")
+
+    # request properties options, by the query options they are set from
+    _REQUEST_OPTIONS = {
+        "query_results_cache_max_age": "query_results_cache_max_age",
+        "truncation_max_size": "truncationmaxsize",
+        "server_timeout": "servertimeout",
+        "query_datascope": "query_datascope",
+        "results_progressive_enabled": "results_progressive_enabled",
+    }
     _DATA_SOURCE_TEMPLATE = "https://{0}.kusto.windows.net"
 
     _WEB_CLIENT_VERSION = VERSION
@@ -95,6 +107,13 @@ class Kusto_Client(object):
             If this is False, exception is raised. Default is False.
         options["timeout"] : float, optional
             Optional parameter. Network timeout in seconds. Default is no timeout.
+        options["query_parameters"] : dict, optional
+            Optional parameter. Values of the query parameters, declared by the query declare query_parameters statement.
+        options["progress_callback"] : callable, optional
+            Optional parameter. Called with the KqlProgressiveFrames, on each progressive frame, while results are received.
+        options["query_results_cache_max_age"], options["truncation_max_size"], options["server_timeout"],
+        options["query_datascope"], options["results_progressive_enabled"] : optional
+            Optional parameters. Request properties options, not sent if None.
         """
         if kusto_query.startswith("."):
             endpoint_version = self._MGMT_ENDPOINT_VERSION
@@ -108,6 +127,20 @@ class Kusto_Client(object):
             "csl": kusto_query,
         }
 
+        properties = {}
+        request_options = {}
+        for option, request_option in self._REQUEST_OPTIONS.items():
+            value = options.get(option)
+            if value is not None and value is not False:
+                request_options[request_option] = value
+        if len(request_options) > 0:
+            properties["Options"] = request_options
+        # values of the query parameters declared by a declare query_parameters statement
+        if options.get("query_parameters"):
+            properties["Parameters"] = options.get("query_parameters")
+        if len(properties) > 0:
+            request_payload["properties"] = json.dumps(properties)
+
         request_headers = {
             "Accept": "application/json",
             "Accept-Encoding": "gzip,deflate",
@@ -119,15 +152,30 @@ class Kusto_Client(object):
             request_headers["Authorization"] = self._aad_helper.acquire_token()
             request_headers["Fed"] = "True"
 
-        response = requests.post(endpoint, headers=request_headers, json=request_payload, timeout=options.get("timeout"))
+        # progressive results are streamed, frames are merged as they are received, and reported to progress_callback
+        is_progressive = options.get("results_progressive_enabled") and endpoint_version == "v2"
+        response = requests.post(endpoint, headers=request_headers, json=request_payload, timeout=options.get("timeout"), stream=is_progressive)
 
         if response.status_code != requests.codes.ok:  # pylint: disable=E1101
             raise KqlError([response.text], response)
 
-        kql_response = KqlQueryResponse(response.json(), endpoint_version)
+        if is_progressive:
+            json_response = self._read_progressive_frames(response, options.get("progress_callback"))
+        else:
+            json_response = response.json()
+        kql_response = KqlQueryResponse(json_response, endpoint_version)
 
         if kql_response.has_exceptions() and not accept_partial_results:
             raise KqlError(kql_response.get_exceptions(), response, kql_response)
 
         return kql_response
 
+    def _read_progressive_frames(self, response, progress_callback=None) -> list:
+        "returns the merged frames of a streamed progressive response"
+        response.encoding = response.encoding or "utf-8"
+        progressive_frames = KqlProgressiveFrames()
+        for frame in iter_json_array(response.iter_content(chunk_size=self._STREAM_CHUNK_SIZE, decode_unicode=True)):
+            progressive_frames.add(frame)
+            if progress_callback is not None and frame["FrameType"] in self._PROGRESS_FRAME_TYPES:
+                progress_callback(progressive_frames)
+        return progressive_frames.frames
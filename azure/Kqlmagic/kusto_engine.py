@@ -59,6 +59,9 @@ class KustoEngine(KqlEngine):
             )
             self.client = Kusto_Client(self._parsed_conn)
 
+    def supports_query_parameters(self):
+        return True
+
     def get_client(self):
         if self.client is None:
             cluster_connection = self.conn_class.get_connection_by_name("@" + self.cluster_name)
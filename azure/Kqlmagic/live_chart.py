@@ -0,0 +1,165 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import asyncio
+from datetime import datetime, timezone
+
+from Kqlmagic.connection import Connection, ConnectionError
+from Kqlmagic.constants import VisualizationValues
+from Kqlmagic.display import Display
+from Kqlmagic.log import logger
+from Kqlmagic import kql_lexer
+
+
+def get_delta_query(query: str, x_column_name: str, last_value) -> str:
+    """
+    Returns the query, restricted to rows newer than last_value of the x column.
+    The restriction is inserted before the render operator (or appended, if the query has no render operator).
+    """
+    if isinstance(last_value, datetime):
+        if last_value.tzinfo is not None:
+            last_value = last_value.astimezone(timezone.utc).replace(tzinfo=None)
+        value = "datetime({0})".format(last_value.isoformat())
+    elif isinstance(last_value, str):
+        value = "'{0}'".format(last_value.replace("\\", "\\\\").replace("'", "\\'"))
+    else:
+        value = str(last_value)
+    where = "| where ['{0}'] > {1}".format(x_column_name.replace("'", "\\'"), value)
+    return kql_lexer.insert_before_render(query, where)
+
+
+class LiveChart(object):
+    """
+    Keeps a timechart figure of a ResultSet up to date.
+
+    The chart is displayed as a plotly FigureWidget, so updates are pushed to the displayed chart.
+    Every interval seconds, only the delta query (rows newer than the last seen x value) is submitted, in a worker thread,
+    and the new points are appended to the figure traces, in one batch update, on the kernel event loop.
+    Each trace retains at most window points.
+    """
+
+    def __init__(self, result_set, interval: int, window: int = None, **kwargs):
+        self.result_set = result_set
+        self.interval = interval
+        self.window = window
+        self.options = {**result_set.options, **kwargs}
+        self.figure = None
+        self._loop = None
+        self._timer_handle = None
+        self._stopped = True
+        self.last_value = None
+        self.x_column_name = None
+
+    def start(self):
+        "start the live updates, must be called from the kernel event loop thread (a notebook cell)"
+        if self.result_set.visualization != VisualizationValues.TIME_CHART:
+            raise ValueError("live mode is supported only for timechart, query visualization is {0}".format(self.result_set.visualization))
+        figure = self.result_set._get_chart_figure()
+        if figure is None or not hasattr(figure, "batch_update"):
+            raise ValueError("live mode requires a plotly chart figure")
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise ValueError("live mode requires a running kernel event loop (a notebook)")
+        try:
+            from plotly.graph_objs import FigureWidget
+
+            self.figure = FigureWidget(figure)
+        except ImportError:
+            raise ValueError("live mode requires ipywidgets package, run '!pip install ipywidgets' to install it")
+        sub_tables = self.result_set.chart_sub_tables
+        self.x_column_name = sub_tables[0].col_x.name
+        self.last_value = self._get_last_value(sub_tables)
+        self._stopped = False
+        self._schedule()
+        return self
+
+    def stop(self):
+        "stop the live updates"
+        self._stopped = True
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
+
+    @property
+    def is_running(self):
+        return not self._stopped
+
+    def _schedule(self):
+        if not self._stopped:
+            self._timer_handle = self._loop.call_later(self.interval, self._tick)
+
+    @staticmethod
+    def _get_last_value(sub_tables):
+        last_values = [x for tab in sub_tables for x, y in tab.items() if y is not None]
+        return max(last_values) if len(last_values) > 0 else None
+
+    def _tick(self):
+        "runs on the kernel event loop, the delta query is submitted in a worker thread, so the kernel is not blocked"
+        self._timer_handle = None
+        if not self._stopped:
+            self._loop.run_in_executor(None, self.get_delta_sub_tables).add_done_callback(self._on_delta_sub_tables)
+
+    def _on_delta_sub_tables(self, future):
+        "runs on the kernel event loop, when the delta query completes"
+        if self._stopped:
+            return
+        try:
+            self.update(future.result())
+        except Exception as e:
+            logger().debug("LiveChart - update failed: {0}".format(e))
+            Display.showDangerMessage("live chart update failed, live mode stopped: {0}".format(e))
+            self._stopped = True
+        self._schedule()
+
+    def get_delta_sub_tables(self) -> list:
+        "submit the delta query, and returns its chart sub-tables"
+        from Kqlmagic.results import ResultSet
+
+        conn = Connection.connections.get(self.result_set.metadata.get("connection"))
+        if conn is None:
+            raise ConnectionError("connection {0} is not available".format(self.result_set.metadata.get("connection")))
+
+        query = self.result_set.parametrized_query
+        if self.last_value is not None:
+            query = get_delta_query(query, self.x_column_name, self.last_value)
+        raw_query_result = conn.execute(query, {}, **self.options)
+        delta = ResultSet(raw_query_result, query, fork_table_id=0, fork_table_resultSets={}, metadata={}, options=self.options)
+        if len(delta) == 0:
+            return []
+        return delta._build_chart_sub_tables(
+            self.result_set.visualization_properties, x_type=self.result_set._get_plotly_chart_x_type(self.result_set.visualization_properties)
+        )
+
+    def update(self, delta_sub_tables: list):
+        "append the new points of the delta sub-tables to the figure traces, new series are added with the same trace class"
+        if len(delta_sub_tables) == 0:
+            return
+        traces_by_name = {trace.name: trace for trace in self.figure.data}
+        with self.figure.batch_update():
+            for tab in delta_sub_tables:
+                xs = [x for x, y in tab.items() if y is not None]
+                ys = [y for y in tab.values() if y is not None]
+                trace = traces_by_name.get(tab.name)
+                if trace is None:
+                    color = self.result_set.get_color_from_palette(len(self.figure.data), n_colors=len(self.figure.data) + 1)
+                    if self.window:
+                        xs = xs[-self.window :]
+                        ys = ys[-self.window :]
+                    # same trace class (Scatter or Scattergl) as the figure traces, plotly doesn't mix them well
+                    trace_class = type(self.figure.data[0]) if len(self.figure.data) > 0 else self.result_set._get_plotly_scatter_class(len(xs))
+                    self.figure.add_trace(trace_class(x=xs, y=ys, name=tab.name, line=dict(width=1, color=color), opacity=0.8))
+                else:
+                    xs = list(trace.x) + xs
+                    ys = list(trace.y) + ys
+                    if self.window and len(xs) > self.window:
+                        xs = xs[-self.window :]
+                        ys = ys[-self.window :]
+                    trace.x = xs
+                    trace.y = ys
+        last_value = self._get_last_value(delta_sub_tables)
+        if last_value is not None and (self.last_value is None or last_value > self.last_value):
+            self.last_value = last_value
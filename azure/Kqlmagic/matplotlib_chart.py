@@ -0,0 +1,252 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import io
+import re
+import base64
+import functools
+
+from Kqlmagic.constants import VisualizationKeys, VisualizationValues, VisualizationKinds
+
+
+_RGB_PATTERN = re.compile(r"rgb\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_figure_classes():
+    """returns matplotlib Figure and Agg canvas classes, imported once.
+    Figures are created and rendered without pyplot, so no global pyplot state and no backend (inline) configuration is involved"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    return Figure, FigureCanvasAgg
+
+
+def _to_mpl_color(color):
+    "converts palette 'rgb(r, g, b)' color to matplotlib (r, g, b) color"
+    match = _RGB_PATTERN.match(str(color)) if color is not None else None
+    if match is None:
+        return color
+    return tuple(int(c) / 255 for c in match.groups())
+
+
+class MatplotlibChart(object):
+    """
+    Builds a matplotlib figure of a ResultSet chart, using the object oriented Figure/Axes api.
+
+    Series are taken from the result set chart sub-tables, as arrays, and are drawn on the figure axes,
+    so no pyplot global state is used, and figures can be rendered headless to png/svg buffers.
+    """
+
+    @staticmethod
+    def is_figure(obj) -> bool:
+        "returns True if obj is a matplotlib figure (without importing matplotlib, if it was not imported yet)"
+        return type(obj).__module__ == "matplotlib.figure" and type(obj).__name__ == "Figure"
+
+    @staticmethod
+    def new_figure(figsize=None):
+        "returns a new matplotlib figure, attached to an Agg canvas"
+        Figure, FigureCanvasAgg = _get_figure_classes()
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        return fig
+
+    @staticmethod
+    def to_image(fig, format="png", dpi=None) -> bytes:
+        "renders the figure to png or svg (or any other Agg supported format) bytes, headless"
+        buffer = io.BytesIO()
+        fig.canvas.print_figure(buffer, format=format or "png", dpi=dpi, bbox_inches="tight")
+        return buffer.getvalue()
+
+    @staticmethod
+    def to_html(fig, format="png", dpi=None) -> str:
+        "returns the figure as an html inline image (png), or inline svg"
+        image = MatplotlibChart.to_image(fig, format=format, dpi=dpi)
+        if format == "svg":
+            svg = image.decode("utf-8")
+            # drop xml declaration and doctype, inline svg starts at the svg element
+            return svg[svg.find("<svg") :]
+        return '<img src="data:image/{0};base64,{1}">'.format(format, base64.b64encode(image).decode("ascii"))
+
+    def __init__(self, result_set, **kwargs):
+        self.result_set = result_set
+        self.options = {**result_set.options, **kwargs}
+        self.kwargs = kwargs
+
+    def build(self, properties: dict):
+        "returns the chart figure, or None if visualization is not supported or there is no valid chart"
+        visualization = properties.get(VisualizationKeys.VISUALIZATION)
+        renderer = {
+            VisualizationValues.PIE_CHART: self._render_piechart,
+            VisualizationValues.BAR_CHART: self._render_barchart,
+            VisualizationValues.COLUMN_CHART: self._render_barchart,
+            VisualizationValues.AREA_CHART: self._render_areachart,
+            VisualizationValues.STACKED_AREA_CHART: self._render_areachart,
+            VisualizationValues.LINE_CHART: self._render_linechart,
+            VisualizationValues.TIME_CHART: self._render_linechart,
+            VisualizationValues.ANOMALY_CHART: self._render_linechart,
+            VisualizationValues.SCATTER_CHART: self._render_scatterchart,
+        }.get(visualization)
+        if renderer is None:
+            return None
+        tabs = self.result_set._build_chart_sub_tables(properties, x_type=self.result_set._get_plotly_chart_x_type(properties))
+        if len(tabs) < 1:
+            return None
+        return renderer(properties, tabs)
+
+    def _get_colors(self, n_colors):
+        palette = self.result_set._get_palette(n_colors=n_colors, **self.kwargs)
+        return [_to_mpl_color(str(c)) for c in palette[:n_colors]]
+
+    def _set_axes_properties(self, fig, ax, chart_properties):
+        ax.set_title(chart_properties["title"])
+        ax.set_xlabel(chart_properties["xlabel"])
+        ax.set_ylabel(chart_properties["ylabel"])
+        if chart_properties["xscale"] == "log":
+            ax.set_xscale("log")
+        if chart_properties["yscale"] == "log":
+            ax.set_yscale("log")
+        if chart_properties["xscale"] == "date":
+            fig.autofmt_xdate()
+        if chart_properties["showlegend"] and len(ax.get_legend_handles_labels()[0]) > 0:
+            ax.legend()
+
+    def _render_piechart(self, properties: dict, tabs: list):
+        import numpy as np
+
+        categories = [self.result_set._get_chart_sub_tables_categories([tab], **self.kwargs)[0] for tab in tabs]
+        colors = self._get_colors(max([len(labels) for labels, values in categories]))
+        pies = len(tabs)
+        columns = min(pies, 5)
+        rows = (pies + columns - 1) // columns
+        fig = self.new_figure(figsize=(4 * columns, 4 * rows))
+        for idx, (tab, (labels, values)) in enumerate(zip(tabs, categories)):
+            ax = fig.add_subplot(rows, columns, idx + 1)
+            values = np.array([np.nan if v is None else v for v in values], dtype=float)
+            # like plotly, null, nan and non positive values have no wedge, a pie without wedges is annotated
+            wedges = np.nan_to_num(values) > 0
+            if wedges.any():
+                ax.pie(
+                    values[wedges],
+                    labels=[str(label) for label, is_wedge in zip(labels, wedges) if is_wedge],
+                    colors=[color for color, is_wedge in zip(colors, wedges) if is_wedge],
+                    autopct="%1.1f%%",
+                )
+            else:
+                ax.text(0.5, 0.5, "no data", ha="center", va="center", transform=ax.transAxes)
+                ax.set_xticks([])
+                ax.set_yticks([])
+            ax.set_title(tab.name)
+            ax.axis("equal")
+        fig.suptitle(properties.get(VisualizationKeys.TITLE) or VisualizationValues.PIE_CHART)
+        return fig
+
+    def _render_barchart(self, properties: dict, tabs: list):
+        import numpy as np
+
+        chart_properties = self.result_set._get_plotly_chart_properties(properties, tabs)
+        if tabs[0].col_x.is_quantity:
+            categories = [(list(tab.keys()), list(tab.values())) for tab in tabs]
+        else:
+            categories = self.result_set._get_chart_sub_tables_categories(tabs, **self.kwargs)
+        labels = list(dict.fromkeys(x for xs, ys in categories for x in xs))
+        label_idx = {x: idx for idx, x in enumerate(labels)}
+        positions = np.arange(len(labels))
+        colors = self._get_colors(len(tabs))
+        kind = properties.get(VisualizationKeys.KIND)
+        is_stacked = kind in (VisualizationKinds.STACKED, VisualizationKinds.STACKED_100)
+        is_horizontal = chart_properties["orientation"] == "h"
+
+        # values matrix, series by labels, missing values are zero
+        values = np.zeros((len(tabs), len(labels)))
+        for idx, (xs, ys) in enumerate(categories):
+            values[idx, [label_idx[x] for x in xs]] = [0 if y is None else y for y in ys]
+        if kind == VisualizationKinds.STACKED_100:
+            totals = np.abs(values).sum(axis=0)
+            values = np.divide(values * 100, totals, out=np.zeros_like(values), where=totals != 0)
+
+        fig = self.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        width = 0.8 if is_stacked else 0.8 / len(tabs)
+        bottom = np.zeros(len(labels))
+        for idx, tab in enumerate(tabs):
+            offset = positions if is_stacked else positions - 0.4 + width * (idx + 0.5)
+            if is_horizontal:
+                ax.barh(offset, values[idx], height=width, left=bottom if is_stacked else None, color=colors[idx], label=tab.name)
+            else:
+                ax.bar(offset, values[idx], width=width, bottom=bottom if is_stacked else None, color=colors[idx], label=tab.name)
+            if is_stacked:
+                bottom = bottom + values[idx]
+        tick_labels = [str(label) for label in labels]
+        if is_horizontal:
+            ax.set_yticks(positions)
+            ax.set_yticklabels(tick_labels)
+            chart_properties["yscale"] = None
+        else:
+            ax.set_xticks(positions)
+            ax.set_xticklabels(tick_labels, rotation=45, ha="right")
+            chart_properties["xscale"] = None
+        self._set_axes_properties(fig, ax, chart_properties)
+        return fig
+
+    def _get_points(self, tab):
+        import numpy as np
+
+        xs, ys = self.result_set._get_chart_sub_table_points(tab, **self.kwargs)
+        xs = np.array(xs, dtype=object if len(xs) > 0 and not isinstance(xs[0], (int, float)) else float)
+        ys = np.array([np.nan if y is None else y for y in ys], dtype=float)
+        return xs, ys
+
+    def _render_areachart(self, properties: dict, tabs: list):
+        import numpy as np
+
+        chart_properties = self.result_set._get_plotly_chart_properties(properties, tabs)
+        colors = self._get_colors(len(tabs))
+        kind = properties.get(VisualizationKeys.KIND)
+        if properties.get(VisualizationKeys.VISUALIZATION) == VisualizationValues.STACKED_AREA_CHART:
+            kind = kind or VisualizationKinds.STACKED
+        fig = self.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        if kind in (VisualizationKinds.STACKED, VisualizationKinds.STACKED_100) and len({len(tab) for tab in tabs}) == 1:
+            xs, ys_list = self.result_set._get_chart_sub_tables_stacked_points(tabs, **self.kwargs)
+            xs = np.array(xs, dtype=object if len(xs) > 0 and not isinstance(xs[0], (int, float)) else float)
+            ys_stack = np.array([[np.nan if y is None else y for y in ys] for ys in ys_list], dtype=float).reshape(len(tabs), len(xs))
+            ys_stack = np.nan_to_num(ys_stack)
+            if kind == VisualizationKinds.STACKED_100:
+                totals = np.abs(ys_stack).sum(axis=0)
+                ys_stack = np.divide(ys_stack * 100, totals, out=np.zeros_like(ys_stack), where=totals != 0)
+            ax.stackplot(xs, ys_stack, labels=[tab.name for tab in tabs], colors=colors, alpha=0.8)
+        else:
+            for idx, tab in enumerate(tabs):
+                xs, ys = self._get_points(tab)
+                ax.fill_between(xs, np.nan_to_num(ys), color=colors[idx], alpha=0.5, label=tab.name)
+        if tabs[0].is_descending_sorted:
+            ax.invert_xaxis()
+        self._set_axes_properties(fig, ax, chart_properties)
+        return fig
+
+    def _render_linechart(self, properties: dict, tabs: list):
+        chart_properties = self.result_set._get_plotly_chart_properties(properties, tabs)
+        colors = self._get_colors(len(tabs))
+        fig = self.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        for idx, tab in enumerate(tabs):
+            xs, ys = self._get_points(tab)
+            ax.plot(xs, ys, color=colors[idx], linewidth=1, alpha=0.8, label=tab.name)
+        if tabs[0].is_descending_sorted:
+            ax.invert_xaxis()
+        self._set_axes_properties(fig, ax, chart_properties)
+        return fig
+
+    def _render_scatterchart(self, properties: dict, tabs: list):
+        chart_properties = self.result_set._get_plotly_chart_properties(properties, tabs)
+        colors = self._get_colors(len(tabs))
+        fig = self.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        for idx, tab in enumerate(tabs):
+            ax.scatter(list(tab.keys()), [y for y in tab.values()], color=colors[idx], s=10, label=tab.name)
+        self._set_axes_properties(fig, ax, chart_properties)
+        return fig
@@ -7,6 +7,7 @@
 """A module to acquire tokens from AAD.
 """
 
+import threading
 from enum import Enum, unique
 from datetime import timedelta, datetime
 
@@ -64,6 +65,7 @@ class _MyAadHelper(object):
         authority = kcsb.authority_id or "common"
         self._resource = "{0.scheme}://{0.hostname}".format(urlparse(kcsb.data_source))
         self._adal_context = AuthenticationContext("https://login.microsoftonline.com/{0}".format(authority))
+        self._lock = threading.Lock()
         self._username = None
         if all([kcsb.aad_user_id, kcsb.password]):
             self._authentication_method = AuthenticationMethod.aad_username_password
@@ -84,7 +86,12 @@ class _MyAadHelper(object):
             self._client_id = default_clientid
 
     def acquire_token(self):
-        """Acquire tokens from AAD."""
+        """Acquire tokens from AAD.
+        Serialized, so concurrent queries (such as a sweep) authenticate once, and share the cached token"""
+        with self._lock:
+            return self._acquire_token()
+
+    def _acquire_token(self):
         token = self._adal_context.acquire_token(self._resource, self._username, self._client_id)
         if token is not None:
             expiration_date = dateutil.parser.parse(token[TokenResponseFields.EXPIRES_ON])
@@ -6,9 +6,20 @@
 
 import six
 import json
+import itertools
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 from datetime import timedelta, datetime
 from pandas import DataFrame
 from Kqlmagic.constants import Constants
+from Kqlmagic import kql_lexer
+
+
+# guards Parameterizer._serialization_cache, parameters are expanded concurrently by the query sweep workers
+_serialization_cache_lock = threading.Lock()
+
 
 class ExtendedJSONEncoder(json.JSONEncoder):
     def defaultt(self, o):
@@ -23,23 +34,43 @@ class Parameterizer(object):
 
     def __init__(self, ns_vars):
         self.ns_vars = ns_vars
+        # query parameters values (as kql literals), of the parameters declared by the expanded query
+        self.query_parameters = {}
 
     def expand(self, query: str, **kwargs):
-        """expand query to include resolution of python parameters"""
-        query_management_prefix = ""
-        query_body = query
-        if query.startswith("."):
-            parts = query.split("<|")  
-            if len(parts) == 2:
-                query_management_prefix = parts[0] + "<| "
-                query_body = parts[1].strip()
-        q = self._normalize(query_body)
-        query_let_statments = [s.strip()[4:].strip() for s in q.split(";") if s.strip().startswith("let ")]
-        parameters = self._detect_parameters(query_let_statments)
-        statements = self._build_let_statements(parameters)
+        """expand query to include resolution of python parameters.
+        If params_declare is set, scalar and dynamic parameters are declared by a declare query_parameters statement,
+        and their values are set to query_parameters (to be sent in the request properties), so the query text doesn't change
+        when the parameters values change"""
+        query_management_prefix, query_body, tokens = self._split_management_prefix(query)
+        parameters = self._detect_parameters(self._get_let_statements(tokens))
+        statements = []
+        if kwargs.get("params_declare") and not query.startswith("."):
+            declarations, parameters = self._build_query_parameters(parameters, **kwargs)
+            if len(declarations) > 0:
+                statements.append("declare query_parameters({0})".format(", ".join(declarations)))
+        statements.extend(self._build_let_statements(parameters, **kwargs))
         statements.append(query_body)
         return query_management_prefix + ";".join(statements)
 
+    def detect_parameters(self, query: str) -> list:
+        """returns the names of the python variables that resolve the query unresolved let statements"""
+        _, _, tokens = self._split_management_prefix(query)
+        return self._detect_parameters(self._get_let_statements(tokens))
+
+    def _split_management_prefix(self, query: str):
+        "returns the management command prefix (up to and including '<|'), the query body, and the query body tokens"
+        tokens = kql_lexer.tokenize(query)
+        if query.startswith("."):
+            parts = kql_lexer.split(tokens, "<|")
+            if len(parts) == 2:
+                query_body = kql_lexer.to_text(parts[1]).strip()
+                return kql_lexer.to_text(parts[0]) + "<| ", query_body, kql_lexer.tokenize(query_body)
+        return "", query, tokens
+
+    def _get_let_statements(self, tokens: list) -> list:
+        return [s for s in kql_lexer.split_statements(tokens) if s.strip().startswith("let ")]
+
     def _object_to_kql(self, v) -> str:
         try:
             val = (
@@ -78,16 +109,153 @@ class Parameterizer(object):
         return str(val)
 
 
-    def _build_let_statements(self, parameters: list):
-        """build let statements that resolve python variable names to python variables values"""
+    def _build_query_parameters(self, parameters: list, **kwargs):
+        """sets query_parameters to the values of parameters that can be declared as query parameters.
+        returns tuple (declarations, let parameters), let parameters are the rest of the parameters
+        (DataFrames, large lists, null values and unsupported types), to be resolved by let statements"""
+        inline_max_size = kwargs.get("params_inline_max_size")
+        upload_url = kwargs.get("params_upload_url")
+        declarations = []
+        let_parameters = []
+        for k in parameters:
+            v = self.ns_vars[k]
+            kql_type = self._query_parameter_type(v)
+            if kql_type is None:
+                let_parameters.append(k)
+                continue
+            # strings are sent as is, other values as kql literals
+            val = v if kql_type == "string" else self._object_to_kql(v)
+            if kql_type == "dynamic" and inline_max_size and upload_url and len(val) > inline_max_size:
+                let_parameters.append(k)
+                continue
+            declarations.append("{0}:{1}".format(k, kql_type))
+            self.query_parameters[k] = val
+        return declarations, let_parameters
+
+    def _query_parameter_type(self, v):
+        "returns the kql type of a query parameter value, or None if value can't be a query parameter"
+        if isinstance(v, (bool, np.bool_)):
+            return "bool"
+        elif isinstance(v, (int, np.integer)):
+            return "long"
+        elif isinstance(v, (float, np.floating)):
+            return "real"
+        elif isinstance(v, str):
+            return "string"
+        elif isinstance(v, datetime) and str(v) != "NaT":
+            return "datetime"
+        elif isinstance(v, timedelta) and str(v) != "NaT":
+            return "timespan"
+        elif isinstance(v, (dict, list, tuple, set)):
+            return "dynamic"
+        return None
+
+    def _build_let_statements(self, parameters: list, **kwargs):
+        """build let statements that resolve python variable names to python variables values.
+        DataFrame and list values, larger than params_inline_max_size, are uploaded to params_upload_url, and referenced as externaldata"""
         statements = []
+        inline_max_size = kwargs.get("params_inline_max_size")
+        upload_url = kwargs.get("params_upload_url")
         for k in parameters:
             if k in self.ns_vars:
                 v = self.ns_vars[k]
                 # print('type', type(v))
-                val = self._object_to_kql(v)
+                if isinstance(v, DataFrame):
+                    val = self._dataframe_to_kql(k, v, **kwargs)
+                elif inline_max_size and upload_url and isinstance(v, (list, tuple, set)):
+                    val = self._object_to_kql(v)
+                    if len(val) > inline_max_size:
+                        val = self._external_dynamic(k, v, upload_url, **kwargs)
+                else:
+                    val = self._object_to_kql(v)
                 statements.append("let {0} = {1}".format(k, val))
         return statements
+
+    # serialized DataFrame parameters, least recently used are dropped
+    MAX_SERIALIZATION_CACHE_SIZE = 16
+    _serialization_cache = OrderedDict()
+
+    def _dataframe_to_kql(self, name: str, df: DataFrame, **kwargs) -> str:
+        """returns the DataFrame as datatable or externaldata view.
+        The serialization is cached, keyed by object identity and content fingerprint, so an unchanged DataFrame is not serialized again"""
+        inline_max_size = kwargs.get("params_inline_max_size")
+        upload_url = kwargs.get("params_upload_url")
+        fingerprint = self._dataframe_fingerprint(df)
+        key = (name, id(df), fingerprint, inline_max_size, upload_url)
+        if fingerprint is not None:
+            with _serialization_cache_lock:
+                val = Parameterizer._serialization_cache.get(key)
+                if val is not None:
+                    Parameterizer._serialization_cache.move_to_end(key)
+                    return val
+
+        schema, columns_values = self._dataframe_to_kql_columns(df)
+        if inline_max_size and upload_url and self._kql_columns_size(columns_values) > inline_max_size:
+            val = self._external_datatable(name, schema, columns_values, upload_url, **kwargs)
+        else:
+            val = self._kql_columns_to_datatable(schema, columns_values)
+
+        if fingerprint is not None:
+            with _serialization_cache_lock:
+                Parameterizer._serialization_cache[key] = val
+                while len(Parameterizer._serialization_cache) > Parameterizer.MAX_SERIALIZATION_CACHE_SIZE:
+                    Parameterizer._serialization_cache.popitem(last=False)
+        return val
+
+    def _dataframe_fingerprint(self, df: DataFrame) -> str:
+        """returns a fingerprint of the DataFrame content, hashed from the columns data, names and types,
+        or None if the content can't be hashed.
+        All the values are hashed, so an in place change is detected. The cost is linear in the DataFrame size, the hash is vectorized,
+        only object columns values are converted to str, so it is about an order of magnitude cheaper than the serialization"""
+        from pandas.util import hash_pandas_object
+        from pandas.api.types import infer_dtype
+
+        try:
+            # categorize=False, the values are hashed directly, factorizing mostly unique strings first costs more than it saves
+            rows_hash = hash_pandas_object(df, index=False, categorize=False).values
+        except TypeError:
+            return None
+        fingerprint = hashlib.sha1(rows_hash.tobytes())
+        fingerprint.update(repr([(str(col), str(t)) for col, t in df.dtypes.items()]).encode("utf-8"))
+        # object columns values are hashed by their str, the inferred values type is added to tell 1 from '1'
+        for idx, t in enumerate(df.dtypes):
+            if t == object:
+                fingerprint.update(infer_dtype(df.iloc[:, idx], skipna=False).encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    def _kql_columns_size(self, columns_values: list) -> int:
+        "returns the size of the datatable values literal"
+        count = sum([len(values) for values in columns_values])
+        return sum([sum(map(len, values)) for values in columns_values]) + 2 * max(count - 1, 0)
+
+    def _kql_value_to_csv(self, val: str) -> str:
+        "returns the csv value of a kql literal value"
+        if val.endswith("(null)"):
+            return ""
+        if val.startswith("'") and val.endswith("'") and len(val) > 1:
+            return val[1:-1]
+        if val.startswith("datetime(") or val.startswith("time(") or val.startswith("dynamic("):
+            return val[val.index("(") + 1 : -1]
+        return val
+
+    def _external_datatable(self, name: str, schema: str, columns_values: list, upload_url: str, **kwargs) -> str:
+        "uploads the columns values as gzip compressed csv, and returns a view of the externaldata"
+        from Kqlmagic.external_data import to_csv_gz, upload_blob
+
+        csv_columns = [[self._kql_value_to_csv(val) for val in values] for values in columns_values]
+        blob_url = upload_blob(to_csv_gz(zip(*csv_columns)), "{0}.csv.gz".format(name), upload_url, timeout=kwargs.get("timeout"))
+        return " view () {{externaldata ({0}) [h@'{1}'] with (format='csv')}}".format(schema, blob_url)
+
+    def _external_dynamic(self, name: str, v, upload_url: str, **kwargs) -> str:
+        "uploads the list items as gzip compressed csv (one item per row), and returns a scalar list of the externaldata"
+        from Kqlmagic.external_data import to_csv_gz, upload_blob
+
+        items = list(set(v)) if isinstance(v, set) else list(v)
+        rows = [[json.dumps(item, cls=ExtendedJSONEncoder)] for item in items]
+        blob_url = upload_blob(to_csv_gz(rows), "{0}.csv.gz".format(name), upload_url, timeout=kwargs.get("timeout"))
+        return "toscalar(externaldata (value:dynamic) [h@'{0}'] with (format='csv') | summarize make_list(value, {1}))".format(
+            blob_url, max(len(items), 1)
+        )
     
     _DATAFRAME_TO_KQL_TYPES = {
         "int8": "long",
@@ -146,99 +314,169 @@ class Parameterizer(object):
         return "" if s is None else "'{0}'".format(s)
 
         
-    def guess_object_types(self, pairs_type:dict, r:list) -> dict:
-        new_pairs_type = {}
-        for idx, col in enumerate(pairs_type):
-            pair = pairs_type[col]
-            if pair[0] == "object":
-                ty = None
-                for row in r:
-                    val = row[idx]
-                    if val is not None:
-                        cty = type(val)
-                        if cty == str or str(val) not in ["nan", "NaT"]:
-                            ty = ty or cty
-                            if ty != cty or ty == str:
-                                ty = str
-                                break
-                            if ty in [dict, list, set, tuple]:
-                                try:
-                                    json.dumps(val, cls=ExtendedJSONEncoder)
-                                except:
-                                    ty = str
-                                    break
-                if ty == str:
-                    new_pairs_type[col] = [pair[0], "string"]
-                elif ty == bool:
-                    new_pairs_type[col] = [pair[0], "bool"]
-                elif ty in [dict, list, set, tuple]:
-                    new_pairs_type[col] = [pair[0], "dynamic"]
-                elif ty == int:
-                    new_pairs_type[col] = [pair[0], "long"]
-                elif ty == float:
-                    new_pairs_type[col] = [pair[0], "real"]
-                elif str(ty).split(".")[-1].startswith("datetime"):
-                    new_pairs_type[col] = [pair[0], "datetime"]
-                elif str(ty).split(".")[-1].startswith("timedelta"):
-                    new_pairs_type[col] = [pair[0], "timespan"]
-                elif ty == bytes:
-                    new_pairs_type[col] = ["bytes", "string"]
-                else:
-                    new_pairs_type[col] = [pair[0], "string"]
-            else:
-                new_pairs_type[col] = pair
-        return new_pairs_type
+    def _guess_object_type(self, pair:list, values:list) -> list:
+        """returns the column [pandas type, kql type] pair, the kql type of object columns is guessed from the column values"""
+        if pair[0] != "object":
+            return pair
+        ty = None
+        for val in values:
+            if val is not None:
+                cty = type(val)
+                if cty == str or str(val) not in ["nan", "NaT"]:
+                    ty = ty or cty
+                    if ty != cty or ty == str:
+                        ty = str
+                        break
+                    if ty in [dict, list, set, tuple]:
+                        try:
+                            json.dumps(val, cls=ExtendedJSONEncoder)
+                        except:
+                            ty = str
+                            break
+        if ty == str:
+            return [pair[0], "string"]
+        elif ty == bool:
+            return [pair[0], "bool"]
+        elif ty in [dict, list, set, tuple]:
+            return [pair[0], "dynamic"]
+        elif ty == int:
+            return [pair[0], "long"]
+        elif ty == float:
+            return [pair[0], "real"]
+        elif str(ty).split(".")[-1].startswith("datetime"):
+            return [pair[0], "datetime"]
+        elif str(ty).split(".")[-1].startswith("timedelta"):
+            return [pair[0], "timespan"]
+        elif ty == bytes:
+            return ["bytes", "string"]
+        else:
+            return [pair[0], "string"]
 
+    def _series_to_kql_values(self, series, pair_type:list) -> list:
+        """returns the kql values of a dataframe column, formatted in one pass by the column type.
+        Values are identical to dataframe_to_kql_value values, object columns and tz aware datetime columns are formatted per value"""
+        pd_type, kql_type = pair_type
+        dtype = series.dtype
+        kind = dtype.kind if isinstance(dtype, np.dtype) and pd_type != "object" else None
+        if kind in ["i", "u"] and kql_type == "long":
+            return series.to_numpy().astype(str).tolist()
+        if kind == "f" and kql_type == "real":
+            # python float str (float16 and float32 values are boxed to python float), nan is null
+            return ["real(null)" if s == "nan" else s for s in map(str, series.tolist())]
+        if kind == "b" and kql_type == "bool":
+            return np.where(series.to_numpy(), "true", "false").tolist()
+        if kind == "M" and kql_type == "datetime":
+            return self._datetime64_to_kql_values(series.to_numpy())
+        if kind == "m" and kql_type == "timespan":
+            # Timedelta.total_seconds() per value, same (microseconds) precision as dataframe_to_kql_value
+            total_seconds = np.fromiter((val.total_seconds() for val in series.tolist()), dtype=np.float64, count=len(series))
+            return self._timedelta64_to_kql_values(series.to_numpy(), total_seconds)
+        values = self._series_to_list(series)
+        if kql_type == "string" and pd_type != "bytes":
+            return ["'{0}'".format(s) for s in map(str, values)]
+        return [self.dataframe_to_kql_value(val, pair_type) for val in values]
+
+    def _series_to_list(self, series) -> list:
+        "returns the column values as python objects, object and extension columns values are boxed as by DataFrame.to_dict"
+        values = series.tolist()
+        if isinstance(series.dtype, np.dtype) and series.dtype != object:
+            return values
+        from pandas import NA, Timestamp, Timedelta
+
+        def _box(val):
+            if val is NA:
+                return None
+            if isinstance(val, np.datetime64):
+                return Timestamp(val)
+            if isinstance(val, np.timedelta64):
+                return Timedelta(val)
+            return val.item() if isinstance(val, np.generic) else val
 
+        return [_box(val) for val in values]
+
+    def _datetime64_to_kql_values(self, values) -> list:
+        "returns kql datetime values of a numpy datetime64 array, formatted as pandas Timestamp str"
+        if len(values) == 0:
+            # numpy string functions fail on empty arrays
+            return []
+        nat = np.isnat(values)
+        strings = np.char.replace(np.datetime_as_string(values, unit="s"), "T", " ").astype(object)
+        unit = np.datetime_data(values.dtype)[0]
+        if unit in ["ms", "us", "ns"]:
+            # fraction is shown in microseconds, or in nanoseconds if it has nanoseconds
+            fraction = (values - values.astype("datetime64[s]")).astype("timedelta64[ns]").astype(np.int64)
+            has_fraction = (fraction != 0) & ~nat
+            has_nanoseconds = has_fraction & (fraction % 1000 != 0)
+            has_microseconds = has_fraction & ~has_nanoseconds
+            if has_microseconds.any():
+                strings[has_microseconds] = np.char.replace(np.datetime_as_string(values[has_microseconds], unit="us"), "T", " ")
+            if has_nanoseconds.any():
+                strings[has_nanoseconds] = np.char.replace(np.datetime_as_string(values[has_nanoseconds], unit="ns"), "T", " ")
+        strings = np.char.add(np.char.add("datetime(", strings.astype(str)), ")")  # assume utc
+        return np.where(nat, "datetime(null)", strings).tolist()
+
+    def _timedelta64_to_kql_values(self, values, total_seconds) -> list:
+        "returns kql timespan values of a numpy timedelta64 array, same arithmetic as _timedelta_to_timespan"
+        days = total_seconds // Constants.DAY_SECS
+        rest_secs = total_seconds - (days * Constants.DAY_SECS)
+        hours = rest_secs // Constants.HOUR_SECS
+        rest_secs = rest_secs - (hours * Constants.HOUR_SECS)
+        minutes = rest_secs // Constants.MINUTE_SECS
+        rest_secs = rest_secs - (minutes * Constants.MINUTE_SECS)
+        seconds = rest_secs // 1
+        rest_secs = rest_secs - seconds
+        ticks = rest_secs * Constants.TICK_TO_INT_FACTOR
+        nat = np.isnat(values)
+        parts = [np.where(nat, 0, a).astype(np.int64).tolist() for a in (days, hours, minutes, seconds, ticks)]
+        return [
+            "time(null)" if is_nat else "time({0:01}.{1:02}:{2:02}:{3:02}.{4:07})".format(d, h, m, s, t)
+            for is_nat, d, h, m, s, t in zip(nat.tolist(), *parts)
+        ]
 
     def datatable(self, df: DataFrame) -> str:
+        schema, columns_values = self._dataframe_to_kql_columns(df)
+        return self._kql_columns_to_datatable(schema, columns_values)
+
+    def _kql_columns_to_datatable(self, schema: str, columns_values: list) -> str:
+        # values are formatted column by column, and joined row by row
+        data = ", ".join(itertools.chain.from_iterable(zip(*columns_values)))
+        return " view () {{datatable ({0}) [{1}]}}".format(schema, data)
+
+    def _dataframe_to_kql_columns(self, df: DataFrame):
+        "returns the datatable schema, and the kql values of each column"
         t = {col: str(t).split(".")[-1].split("[",1)[0] for col, t in dict(df.dtypes).items()}
-        d = df.to_dict("split")
-        # i = d["index"]
-        c = d["columns"]
-        r = d["data"]
+        c = list(df.columns)
+        columns = [df.iloc[:, idx] for idx in range(len(c))]
         pairs_t = {col: [str(t[col]), self._DATAFRAME_TO_KQL_TYPES.get(str(t[col]))] for col in c}
-        pairs_t = self.guess_object_types(pairs_t, r)
+        pairs_t = {
+            col: self._guess_object_type(pairs_t[col], self._series_to_list(series) if pairs_t[col][0] == "object" else None)
+            for col, series in zip(c, columns)
+        }
         schema = ", ".join(["{0}:{1}".format(col, pairs_t[col][1]) for col in c])
-        data = ", ".join([", ".join([self.dataframe_to_kql_value(val, pairs_t[c[idx]]) for idx, val in enumerate(row)]) for row in r])
-        return " view () {{datatable ({0}) [{1}]}}".format(schema, data)        
+        columns_values = [self._series_to_kql_values(series, pairs_t[col]) for col, series in zip(c, columns)]
+        return schema, columns_values
  
     def _detect_parameters(self, query_let_statments: list):
         """detect in query let staements, the unresolved parameter that can be resolved by python variables"""
         set_keys = []
         parameters = []
         for statment in query_let_statments:
-            kv = statment.split("=")
-            if len(kv) == 2:
-                param_name = kv[1].strip()
+            name_value = kql_lexer.split_let_statement(statment)
+            if name_value is None:
+                continue
+            key, value_tokens = name_value
+            if len(value_tokens) == 1 and value_tokens[0].kind == kql_lexer.TokenKind.IDENTIFIER:
+                param_name = value_tokens[0].text
                 if (
-                    not param_name.startswith('"')
-                    and not param_name.startswith("'")
-                    and not "(" in param_name
-                    and not "[" in param_name
-                    and not "{" in param_name
-                    and not param_name[0] in [str(i) for i in range(10)]
-                    and not param_name == "true"
+                    not param_name == "true"
                     and not param_name == "false"
                     and not param_name in set_keys
                     and param_name in self.ns_vars
                 ):
                     parameters.append(param_name)
-            key = kv[0].strip()
             set_keys.append(key)
         return parameters
 
-    def _normalize(self, query: str):
-        """convert query to one line without comments"""
-        lines = []
-        for line in query.split("\n"):
-            idx = line.find("//")
-            if idx >= 0:
-                lines.append(line[:idx])
-            else:
-                lines.append(line)
-        return " ".join([line.replace("\r", "").replace("\t", " ") for line in lines])
-    
     def _timedelta_to_timespan(self, total_seconds:float):
         days = total_seconds // Constants.DAY_SECS
         rest_secs = total_seconds - (days * Constants.DAY_SECS)
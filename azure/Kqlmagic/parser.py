@@ -4,36 +4,73 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import ast
+import functools
 import itertools
+import operator
 import os
 import six
+from collections import OrderedDict
 from six.moves import configparser as CP
 from Kqlmagic.log import Logger, logger
+from Kqlmagic import kql_lexer
 from traitlets import Bool, Int, Unicode, Enum, Float, TraitError
 
 
+@functools.lru_cache(maxsize=1024)
+def _compile_value(value: str):
+    "returns the option value expression compiled, so same value text is compiled once"
+    return compile(value, "<option value>", "eval")
+
+
 class Parser(object):
 
+    MAX_PARSE_CACHE_SIZE = 128
+
+    # split cells by (cell text, engines), most recently used last
+    _parse_cache = OrderedDict()
+
+    # dsn files config parsers by file name, with the file modification time they were read at
+    _dsn_cache = {}
+
+    # the (flag, getter) pairs of the options default values
+    _default_options_getters = None
+
     @classmethod
     def parse(cls, cell, config, engines: list, user_ns: dict):
-        """Separate input into (connection info, KQL statements, options)"""
+        """Separate input into (connection info, KQL statements, options)
+
+        The cell text is split once, and the split cell is cached by the cell text. Re-running a cell only binds the
+        options values, that depend on the user namespace and on the config, and the dsn section connection."""
+
+        key = (cell, tuple(engines))
+        split_cell = cls._parse_cache.get(key)
+        if split_cell is None:
+            split_cell = cls._split_cell(cell, engines)
+            cls._parse_cache[key] = split_cell
+            if len(cls._parse_cache) > cls.MAX_PARSE_CACHE_SIZE:
+                cls._parse_cache.popitem(last=False)
+        else:
+            cls._parse_cache.move_to_end(key)
+        return cls._bind_cell(split_cell, config, engines, user_ns)
 
-        parsed_queries = []
-        cell, command = cls._parse_kql_command(cell, user_ns)
-        if len(command) > 0 and command.get("command") != "submit":
-            cell, options = cls._parse_kql_options(cell.strip(), config, user_ns)
-            if cell: 
-                raise ValueError("command {0} has too many parameters".format(command.get("command")))
-            parsed_queries.append({"connection": "", "query": "", "options": options, "command": command})
-            return parsed_queries
+    @classmethod
+    def _split_cell(cls, cell, engines: list):
+        """split cell to command, connection, queries and options, values are not evaluated"""
+
+        cell, command = cls._split_kql_command(cell)
+        if command is not None and command[0].get("flag") != "submit":
+            split_options = cls._split_kql_options(cell.strip())
+            if split_options[0]: 
+                raise ValueError("command {0} has too many parameters".format(command[0].get("flag")))
+            return {"command": command, "options": split_options}
 
          # split to max 2 parts. First part, parts[0], is the first string.
         parts = [part.strip() for part in cell.split(None, 1)]
 
         # print(parts)
         if not parts:
-            parsed_queries.append({"connection": "", "query": "", "options": {}, "command": {}})
-            return parsed_queries
+            return {"empty": True}
         
 
         #
@@ -42,31 +79,18 @@ class Parser(object):
         # parts[0] = os.path.expandvars(parts[0])  # for environment variables
         sub_parts = parts[0].split("://", 1)
 
+        section = None
         connection = None
         # assume connection is specified and will be found
         code = parts[1] if len(parts) == 2 else ""
 
         #
         # connection taken from a section in  dsn file (file name have to be define in config.dsn_filename or specified as a parameter)
+        # the connection is resolved when the cell is bound, because the dsn file can be modified
         #
         if parts[0].startswith("[") and parts[0].endswith("]"):
             section = parts[0][1:-1].strip()
 
-            # parse to get flag, for the case that the file nema is specified in the options
-            kql, options = cls._parse_kql_options(code, config, user_ns)
-
-            parser = CP.ConfigParser()
-            parser.read(options.get("dsn_filename", config.dsn_filename))
-            cfg_dict = dict(parser.items(section))
-
-            cfg_dict_lower = {k.lower().replace("_", "").replace("-", ""): v for (k, v) in cfg_dict.items()}
-            for e in engines:
-                if e._MANDATORY_KEY in cfg_dict_lower.keys():
-                    all_keys = set(itertools.chain(*e._VALID_KEYS_COMBINATIONS))
-                    connection_kv = ["{0}='{1}'".format(k, v) for k, v in cfg_dict_lower.items() if v and k in all_keys]
-                    connection = "{0}://{1}".format(e._URI_SCHEMA_NAME, ";".join(connection_kv))
-                    break
-
         #
         # connection specified starting with one of the supported prefixes
         #
@@ -82,25 +106,28 @@ class Parser(object):
         #
         # connection not specified, override default
         #
-        if connection is None:
+        if connection is None and section is None:
             connection = ""
             code = cell
 
+        return {
+            "section": section,
+            # parse to get flag, for the case that the file nema is specified in the options
+            "section_options": cls._split_kql_options(code) if section is not None else None,
+            "connection": connection,
+            "queries": cls._split_queries(code),
+            "cell": cell,
+        }
+
+    @classmethod
+    def _split_queries(cls, code):
+        """split code to queries, returns tuple (queries split options, suppress results)"""
+
         #
         # split string to queries
         #
-        queries = []
-        queryLines = []
-        for line in code.splitlines(True):
-            if line.isspace():
-                if len(queryLines) > 0:
-                    queries.append("".join(queryLines))
-                    queryLines = []
-            else:
-                queryLines.append(line)
-
-        if len(queryLines) > 0:
-            queries.append("".join(queryLines))
+        # split at blank lines, a blank line within a multi-line string literal doesn't split
+        queries = kql_lexer.split_blank_lines(code)
 
         suppress_results = False
         if len(queries) > 0 and queries[-1].strip() == ";":
@@ -110,11 +137,38 @@ class Parser(object):
         if len(queries) == 0:
             queries.append("")
 
+        return [cls._split_kql_options(query.strip()) for query in queries], suppress_results
+
+    @classmethod
+    def _bind_cell(cls, split_cell, config, engines: list, user_ns: dict):
+        """evaluates the split cell values, returns the parsed queries"""
+
+        if split_cell.get("command") is not None:
+            command = cls._bind_kql_command(split_cell.get("command"), user_ns)
+            cell, options = cls._bind_kql_options(split_cell.get("options"), config, user_ns)
+            return [{"connection": "", "query": "", "options": options, "command": command}]
+
+        if split_cell.get("empty"):
+            return [{"connection": "", "query": "", "options": {}, "command": {}}]
+
+        connection = split_cell.get("connection")
+        split_queries, suppress_results = split_cell.get("queries")
+        if split_cell.get("section") is not None:
+            kql, options = cls._bind_kql_options(split_cell.get("section_options"), config, user_ns)
+            connection = cls._get_dsn_connection(options.get("dsn_filename", config.dsn_filename), split_cell.get("section"), engines)
+            #
+            # connection not found in section, override default
+            #
+            if connection is None:
+                connection = ""
+                split_queries, suppress_results = cls._split_queries(split_cell.get("cell"))
+
         #
         # parse code to kql and options
         #
-        for query in queries:
-            kql, options = cls._parse_kql_options(query.strip(), config, user_ns)
+        parsed_queries = []
+        for split_query in split_queries:
+            kql, options = cls._bind_kql_options(split_query, config, user_ns)
             kql = options.pop("query", None) or kql
             conn = options.pop("conn", None) or connection
             if suppress_results:
@@ -123,6 +177,34 @@ class Parser(object):
 
         return parsed_queries
 
+    @classmethod
+    def _get_dsn_connection(cls, dsn_filename: str, section: str, engines: list):
+        """returns connection string built from the dsn file section, or None if the section doesn't match any engine"""
+        cfg_dict = dict(cls._read_dsn_file(dsn_filename).items(section))
+
+        cfg_dict_lower = {k.lower().replace("_", "").replace("-", ""): v for (k, v) in cfg_dict.items()}
+        for e in engines:
+            if e._MANDATORY_KEY in cfg_dict_lower.keys():
+                all_keys = set(itertools.chain(*e._VALID_KEYS_COMBINATIONS))
+                connection_kv = ["{0}='{1}'".format(k, v) for k, v in cfg_dict_lower.items() if v and k in all_keys]
+                return "{0}://{1}".format(e._URI_SCHEMA_NAME, ";".join(connection_kv))
+        return None
+
+    @classmethod
+    def _read_dsn_file(cls, dsn_filename: str):
+        """returns the dsn file config parser, the file is read again only if it was modified"""
+        try:
+            mtime = os.path.getmtime(dsn_filename)
+        except OSError:
+            mtime = None
+        cached = cls._dsn_cache.get(dsn_filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        parser = CP.ConfigParser()
+        parser.read(dsn_filename)
+        cls._dsn_cache[dsn_filename] = (mtime, parser)
+        return parser
+
     _COMMANDS_TABLE = {
         "version" : {"flag": "version", "type": "bool", "init": "False"},
         "usage" : {"flag": "usage", "type": "bool", "init": "False"},
@@ -135,9 +217,11 @@ class Parser(object):
         "usecache": {"flag": "use_cache", "type": "str", "init": "None"},
     }
     @classmethod
-    def _parse_kql_command(cls, code, user_ns: dict):
+    def _split_kql_command(cls, code):
+        """returns tuple (code without the command, command), command is a tuple (command table entry, command word, parameter text),
+        or None if code has no command"""
         if not code.strip().startswith("--"):
-            return (code.strip(), {})
+            return (code.strip(), None)
         words = code.split()
         word = words[0][2:]
         if word.startswith("-"):
@@ -151,17 +235,29 @@ class Parser(object):
         trimmed_code = trimmed_code[trimmed_code.find(words[0]) + len(words[0]) :]
 
         _type = obj.get("type")
+        param = None
         if _type == "bool":
-            param = True 
+            pass
         elif len(words) >= 2 and not words[1].startswith("-"):
-            param = cls.parse_value(words[1], words[0], _type, user_ns)
+            param = words[1]
             trimmed_code = trimmed_code[trimmed_code.find(words[1]) + len(words[1]) :]
-        elif obj.get("default") is not None:
-            param = obj.get("default")
-        else:
+        elif obj.get("default") is None:
             raise ValueError("command {0} is missing parameter".format(word[0]))
 
-        return (trimmed_code.strip(), {"command":  obj.get("flag"), "param": param})
+        return (trimmed_code.strip(), (obj, words[0], param))
+
+    @classmethod
+    def _bind_kql_command(cls, command, user_ns: dict):
+        obj, word, param = command
+        _type = obj.get("type")
+        if _type == "bool":
+            param = True 
+        elif param is not None:
+            param = cls.parse_value(param, word, _type, user_ns)
+        else:
+            param = obj.get("default")
+
+        return {"command":  obj.get("flag"), "param": param}
 
     # all lookup keys in table, must be without spaces, underscores and hypthen-minus, because parser ignores them
     _OPTIONS_TABLE = {
@@ -181,6 +277,37 @@ class Parser(object):
         "enablesuppressresult": {"flag": "enable_suppress_result", "type": "bool", "config": "config.enable_suppress_result"},
         "pfi": {"abbreviation": "plotlyfsincludejs"},
         "plotlyfsincludejs": {"flag": "plotly_fs_includejs", "type": "bool", "config": "config.plotly_fs_includejs"},
+        "cmp": {"abbreviation": "chartmaxpoints"},
+        "chartmaxpoints": {"flag": "chart_max_points", "type": "int", "config": "config.chart_max_points"},
+        "cmc": {"abbreviation": "chartmaxcategories"},
+        "chartmaxcategories": {"flag": "chart_max_categories", "type": "int", "config": "config.chart_max_categories"},
+        "ce": {"abbreviation": "chartengine"},
+        "chartengine": {"flag": "chart_engine", "type": "str", "config": "config.chart_engine"},
+        "cwt": {"abbreviation": "chartwebglthreshold"},
+        "chartwebglthreshold": {"flag": "chart_webgl_threshold", "type": "int", "config": "config.chart_webgl_threshold"},
+        "live": {"flag": "live", "type": "int", "init": "None"},
+        "lw": {"abbreviation": "livewindow"},
+        "livewindow": {"flag": "live_window", "type": "int", "config": "config.live_window"},
+        "pims": {"abbreviation": "paramsinlinemaxsize"},
+        "paramsinlinemaxsize": {"flag": "params_inline_max_size", "type": "int", "config": "config.params_inline_max_size"},
+        "puu": {"abbreviation": "paramsuploadurl"},
+        "paramsuploadurl": {"flag": "params_upload_url", "type": "str", "config": "config.params_upload_url"},
+        "pdc": {"abbreviation": "paramsdeclare"},
+        "paramsdeclare": {"flag": "params_declare", "type": "bool", "config": "config.params_declare"},
+        "qrcma": {"abbreviation": "queryresultscachemaxage"},
+        "queryresultscachemaxage": {"flag": "query_results_cache_max_age", "type": "str", "config": "config.query_results_cache_max_age"},
+        "tms": {"abbreviation": "truncationmaxsize"},
+        "truncationmaxsize": {"flag": "truncation_max_size", "type": "int", "config": "config.truncation_max_size"},
+        "sto": {"abbreviation": "servertimeout"},
+        "servertimeout": {"flag": "server_timeout", "type": "str", "config": "config.server_timeout"},
+        "qds": {"abbreviation": "querydatascope"},
+        "querydatascope": {"flag": "query_datascope", "type": "str", "config": "config.query_datascope"},
+        "rpe": {"abbreviation": "resultsprogressiveenabled"},
+        "resultsprogressiveenabled": {"flag": "results_progressive_enabled", "type": "bool", "config": "config.results_progressive_enabled"},
+        "columns": {"flag": "columns", "type": "list", "init": "None"},
+        "sweep": {"flag": "sweep", "type": "dict", "init": "None"},
+        "smw": {"abbreviation": "sweepmaxworkers"},
+        "sweepmaxworkers": {"flag": "sweep_max_workers", "type": "int", "config": "config.sweep_max_workers"},
         "pw": {"abbreviation": "popupwindow"},
         "popupwindow": {"flag": "popup_window", "type": "bool", "init": "False"},
         "al": {"abbreviation": "autolimit"},
@@ -234,24 +361,37 @@ class Parser(object):
         "popupschema": {"flag": "popup_schema", "type": "bool", "init": "False"},
     }    
     @classmethod
-    def _parse_kql_options(cls, code, config, user_ns: dict):
-        words = code.split()
-        options = {}
+    def _get_default_options_getters(cls):
+        """returns list of (flag, getter) pairs, getter returns the option default value from config.
+        The table config expressions are compiled to getters once, instead of being evaluated per option per query"""
+        if cls._default_options_getters is None:
+            getters = []
+            for value in cls._OPTIONS_TABLE.values():
+                if value.get("config"):
+                    getters.append((value.get("flag"), operator.attrgetter(value.get("config")[len("config.") :])))
+                elif value.get("init"):
+                    getters.append((value.get("flag"), lambda config, init=ast.literal_eval(value.get("init")): init))
+            cls._default_options_getters = getters
+        return cls._default_options_getters
 
-        for value in cls._OPTIONS_TABLE.values():
-            if value.get("config"):
-                options[value.get("flag")] = eval(value.get("config"))
-            elif value.get("init"):
-                options[value.get("flag")] = eval(value.get("init"))
+    @classmethod
+    def _split_kql_options(cls, code):
+        """split options from kql, values are not evaluated.
+        returns tuple (trimmed kql, result var, options items, suppress results),
+        options items are tuples (key, option table entry, bool value, value text)"""
+        words = code.split()
+        result_var = None
+        items = []
+        suppress_results = False
 
         if not words:
-            return ("", options)
+            return ("", result_var, (), suppress_results)
         num_words = len(words)
         trimmed_kql = code
         first_word = 0
 
         if num_words - first_word >= 2 and words[first_word + 1] == "<<":
-            options["result_var"] = words[first_word]
+            result_var = words[first_word]
             trimmed_kql = trimmed_kql[trimmed_kql.find("<<") + 2 :]
             first_word += 2
 
@@ -286,41 +426,57 @@ class Parser(object):
                         raise ValueError("option {0} is readony, cannot be set".format(key))
 
                     _type = obj.get("type")
-                    opt_key = obj.get("flag")
-                    option_config = obj.get("config")
                     if _type == "bool" and value is None:
-                        options[opt_key] = bool_value
+                        items.append((key, obj, bool_value, None))
                     else:
                         if not bool_value:
                             raise ValueError("option {0} cannot be negated".format(key))
                         if value is not None:
-                            options[opt_key] = cls.parse_value(value, key, _type, user_ns)
+                            items.append((key, obj, bool_value, value))
                         else:
                             key_state = False
                 else:
                     raise ValueError("unknown option")
             else:
                 trimmed_kql = trimmed_kql[trimmed_kql.find(word) + len(word) :]
-                options[opt_key] = cls.parse_value(word, key, _type, user_ns)
+                items.append((key, obj, True, word))
                 key_state = True
             first_word += 1
 
-            # validate using config traits
-            if key_state and option_config is not None:
-                template = "'{0}'" if _type == "str" else "{0}"
-                saved = eval(option_config)
-                exec(option_config + "=" + (template.format(str(options[opt_key]).replace("'", "\\'")) if options[opt_key] is not None else "None"))
-                exec(option_config + "=" + (template.format(str(saved).replace("'", "\\'")) if saved is not None else "None"))
-
         if not key_state:
             raise ValueError("last option is missing parameter")
 
         if num_words - first_word > 0:
             last_word = words[-1].strip()
             if last_word.endswith(";"):
-                options["suppress_results"] = True
+                suppress_results = True
                 trimmed_kql = trimmed_kql[: trimmed_kql.rfind(";")]
-        return (trimmed_kql.strip(), options)
+        return (trimmed_kql.strip(), result_var, tuple(items), suppress_results)
+
+    @classmethod
+    def _bind_kql_options(cls, split_options, config, user_ns: dict):
+        """evaluates the split options values, returns tuple (trimmed kql, options)"""
+        trimmed_kql, result_var, items, suppress_results = split_options
+        options = {flag: get_default(config) for flag, get_default in cls._get_default_options_getters()}
+
+        if result_var is not None:
+            options["result_var"] = result_var
+
+        for key, obj, bool_value, value in items:
+            opt_key = obj.get("flag")
+            options[opt_key] = bool_value if value is None else cls.parse_value(value, key, obj.get("type"), user_ns)
+
+            # validate using config traits
+            option_config = obj.get("config")
+            if option_config is not None:
+                trait_name = option_config[len("config.") :]
+                saved = getattr(config, trait_name)
+                setattr(config, trait_name, options[opt_key])
+                setattr(config, trait_name, saved)
+
+        if suppress_results:
+            options["suppress_results"] = True
+        return (trimmed_kql, options)
 
     @classmethod
     def parse_and_get_kv_string(cls, conn_str: str, user_ns: dict):
@@ -414,16 +570,25 @@ class Parser(object):
                 return bool(val)
             elif _type == "dict":
                 return dict(val)
+            elif _type == "list":
+                if isinstance(val, str):
+                    val = val.split(",")
+                return [str(v).strip() for v in val if str(v).strip()]
             return str(val)
 
 
         try:
             if value == "" and _type == "str":
                 return value
+            if _type == "list" and not value.startswith("$"):
+                # list items are names, the raw text is split on commas, it is not evaluated (quotes are optional)
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                    value = value[1:-1]
+                return _convert(value, _type)
             if value.startswith('$'):
                 val = os.getenv(value[1:])
             else:
-                val = eval(value, None, user_ns)
+                val = eval(_compile_value(value), None, user_ns)
 
             # check value if of the right type
             try:
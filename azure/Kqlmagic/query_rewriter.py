@@ -0,0 +1,41 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import re
+
+from Kqlmagic import kql_lexer
+
+
+_IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][\w]*$")
+
+
+class QueryRewriter(object):
+    """
+    Rewrites the expanded query on the client side, before it is submitted.
+
+    Rewrites are opt-in, by options, and work on the query token stream, so string literals and comments are not touched.
+    Control commands (queries that start with a dot) are never rewritten.
+    """
+
+    def rewrite(self, query: str, **kwargs) -> str:
+        "returns the query, rewritten according to the options"
+        if query.strip().startswith("."):
+            return query
+        columns = kwargs.get("columns")
+        if columns:
+            query = self._project_columns(query, columns)
+        return query
+
+    def _project_columns(self, query: str, columns: list) -> str:
+        """projection pushdown, only the specified columns are returned by the service.
+        The project operator is inserted before the render operator, so the render operator remains last"""
+        project = "| project {0}".format(", ".join([self._quote_column_name(name) for name in columns]))
+        return kql_lexer.insert_before_render(query, project)
+
+    def _quote_column_name(self, name: str) -> str:
+        if _IDENTIFIER_PATTERN.match(name):
+            return name
+        return "['{0}']".format(name.replace("\\", "\\\\").replace("'", "\\'"))
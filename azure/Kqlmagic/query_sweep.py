@@ -0,0 +1,68 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from Kqlmagic.parameterizer import Parameterizer
+from Kqlmagic.query_rewriter import QueryRewriter
+
+
+class QuerySweep(object):
+    """
+    Runs one query template for many parameter sets.
+
+    The sweep is a dict of python parameter name to a list of values, the parameter sets are all the combinations of the
+    values (one parameter set per value, if there is only one parameter). The cell is parsed once. The first parameter set
+    query is executed on the calling thread, so an interactive authentication happens once, and the token is cached,
+    then the queries of the other parameter sets are submitted concurrently over a thread pool.
+    Other python parameters of the query are resolved once per parameter set, so DataFrame parameters are served
+    from the Parameterizer serialization cache.
+    The primary results are combined into one DataFrame, tagged by the parameter set values columns.
+    """
+
+    def __init__(self, sweep: dict):
+        self.names = list(sweep.keys())
+        self.param_sets = [dict(zip(self.names, values)) for values in itertools.product(*[list(v) for v in sweep.values()])]
+
+    def validate(self, query: str, params_dict: dict):
+        "raises ValueError if a swept parameter doesn't resolve a query let statement, the sweep would run the same query for all the values"
+        if len(self.param_sets) == 0:
+            return
+        detected_parameters = Parameterizer({**params_dict, **self.param_sets[0]}).detect_parameters(query)
+        missing = [name for name in self.names if name not in detected_parameters]
+        if len(missing) > 0:
+            raise ValueError(
+                "sweep failed, parameters {0} are not used by the query, sweep parameters must be resolved by a let statement, "
+                "such as: let {1} = {1};".format(", ".join(missing), missing[0])
+            )
+
+    def execute(self, conn, query: str, params_dict: dict, user_ns: dict, max_workers: int = None, **options):
+        "returns the combined DataFrame of the query primary results, of all the parameter sets"
+        import pandas
+
+        self.validate(query, params_dict)
+
+        def _execute(param_set):
+            parameterizer = Parameterizer({**params_dict, **param_set})
+            parametrized_query = parameterizer.expand(query, **options)
+            parametrized_query = QueryRewriter().rewrite(parametrized_query, **options)
+            raw_query_result = conn.execute(parametrized_query, user_ns, **{**options, "query_parameters": parameterizer.query_parameters})
+            return raw_query_result.tables[0].to_dataframe()
+
+        dataframes = [_execute(param_set) for param_set in self.param_sets[:1]]
+        if len(self.param_sets) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers or None) as executor:
+                dataframes.extend(executor.map(_execute, self.param_sets[1:]))
+
+        for param_set, df in zip(self.param_sets, dataframes):
+            # parameter values are inserted as leading columns, unless the query already returns a column with that name
+            for idx, (name, value) in enumerate(param_set.items()):
+                if name not in df.columns:
+                    df.insert(idx, name, [value] * len(df))
+        if len(dataframes) == 0:
+            return pandas.DataFrame()
+        return pandas.concat(dataframes, ignore_index=True)
@@ -5,22 +5,24 @@
 # --------------------------------------------------------------------------
 
 import copy
+import json
+import datetime
 import functools
 import operator
 import csv
 import six
 import codecs
 import os.path
-import re
 import uuid
 import prettytable
 
 from Kqlmagic.constants import VisualizationKeys, VisualizationValues, VisualizationScales, VisualizationLegends, VisualizationSplits, VisualizationKinds
 from Kqlmagic.column_guesser import ColumnGuesserMixin
 
-from Kqlmagic.display import Display
+from Kqlmagic.display import Display, DateTimeEncoder
 
 from Kqlmagic.palette import Palette, Palettes
+from Kqlmagic.matplotlib_chart import MatplotlibChart
 
 import plotly
 
@@ -77,11 +79,20 @@ class UnicodeWriter(object):
             self.writerow(row)
 
 
+class ExportJSONEncoder(DateTimeEncoder):
+    "json encoder for exported values, timedelta is exported as in csv (DateTimeEncoder drops the days)"
+
+    def default(self, obj):  # pylint: disable=E0202
+        if isinstance(obj, datetime.timedelta):
+            return str(obj)
+        return super(ExportJSONEncoder, self).default(obj)
+
+
 class FileResultDescriptor(bytes):
     """Provides IPython Notebook-friendly output for the feedback after a ``.csv`` called."""
 
-    FILE_BINARY_FORMATS = ["png", "pdf", "jpeg", "jpg", "eps"]
-    FILE_STRING_FORMATS = ["svg", "webp", "csv"]
+    FILE_BINARY_FORMATS = ["png", "pdf", "jpeg", "jpg", "eps", "parquet", "zip"]
+    FILE_STRING_FORMATS = ["svg", "webp", "csv", "jsonl"]
 
     @staticmethod
     def get_format(file, format=None):
@@ -161,25 +172,94 @@ class FileResultDescriptor(bytes):
             return self._get_data()
 
 
-def _nonbreaking_spaces(match_obj):
+# html escaping of a table cell, and line breaks, in one pass
+_HTML_CELL_TRANSLATION_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\n": "<br>"})
+
+
+def _html_cell(value) -> str:
+    """
+    Convert a value to an escaped html table cell string.
+    Leading spaces (two or more) are replaced with nonbreaking spaces ``&nbsp;``,
+    to make them visible in HTML.
     """
-    Make spaces visible in HTML by replacing all `` `` with ``&nbsp;``
+    s = str(value).translate(_HTML_CELL_TRANSLATION_TABLE)
+    if s.startswith("  "):
+        stripped = s.lstrip(" ")
+        s = "&nbsp;" * (len(s) - len(stripped)) + stripped
+    return s
 
-    Call with a ``re`` match object.  Retain group 1, replace group 2
-    with nonbreaking speaces.
+
+def _min_max_downsample(xs: list, ys: list, max_points: int):
     """
-    spaces = "&nbsp;" * len(match_obj.group(2))
-    return "%s%s" % (match_obj.group(1), spaces)
+    Downsample a chart serie to at most ``max_points`` points, by min/max bucketing.
 
+    Points (sorted by x) are split to buckets of equal size, and from each bucket only the points
+    with the min and max y values are kept, in x order, so peaks remain visible.
+    A bucket with no y values is kept as a single gap (None) point.
+    """
+    rows_count = len(xs)
+    if not max_points or rows_count <= max_points:
+        return xs, ys
+    buckets = max(max_points // 2, 1)
+    ds_xs = []
+    ds_ys = []
+    for bucket in range(buckets):
+        start = rows_count * bucket // buckets
+        end = rows_count * (bucket + 1) // buckets
+        idxs = [i for i in range(start, end) if ys[i] is not None]
+        if len(idxs) == 0:
+            ds_xs.append(xs[start])
+            ds_ys.append(None)
+            continue
+        min_idx = min(idxs, key=ys.__getitem__)
+        max_idx = max(idxs, key=ys.__getitem__)
+        for i in sorted({min_idx, max_idx}):
+            ds_xs.append(xs[i])
+            ds_ys.append(ys[i])
+    return ds_xs, ds_ys
+
+
+def _top_categories(tabs: list, max_categories: int, other_label: str = "other"):
+    """
+    Aggregate the categories of chart sub-tables to the top ``max_categories`` categories.
 
-_cell_with_spaces_pattern = re.compile(r"(<td>)( {2,})")
+    Categories are ranked by the sum of their absolute values over all sub-tables. The top ``max_categories - 1``
+    categories are kept in their original order, and the remaining categories are summed into a single ``other_label`` category.
+    Returns a list of (categories, values) per sub-table.
+    """
+    import numpy as np
+
+    categories = list(dict.fromkeys(x for tab in tabs for x in tab.keys()))
+    if not max_categories or len(categories) <= max_categories:
+        return [(list(tab.keys()), list(tab.values())) for tab in tabs]
+
+    category_idx = {x: idx for idx, x in enumerate(categories)}
+    tabs_values = np.zeros((len(tabs), len(categories)))
+    for tab_idx, tab in enumerate(tabs):
+        idxs = np.fromiter((category_idx[x] for x in tab.keys()), dtype=np.int64, count=len(tab))
+        tabs_values[tab_idx, idxs] = np.fromiter((0 if y is None else y for y in tab.values()), dtype=np.float64, count=len(tab))
+
+    top_count = max(max_categories - 1, 1)
+    totals = np.abs(tabs_values).sum(axis=0)
+    top_idxs = np.sort(np.argpartition(-totals, top_count - 1)[:top_count])
+    other_mask = np.ones(len(categories), dtype=bool)
+    other_mask[top_idxs] = False
+    other_values = tabs_values[:, other_mask].sum(axis=1)
+
+    top_categories = [categories[idx] for idx in top_idxs]
+    while other_label in category_idx:
+        other_label = "[{0}]".format(other_label)
+    result = []
+    for tab_idx, tab in enumerate(tabs):
+        result.append((top_categories + [other_label], [tab.get(x) for x in top_categories] + [float(other_values[tab_idx])]))
+    return result
 
 
 class ResultSet(list, ColumnGuesserMixin):
     """
     Results of a query.
 
-    Can access rows listwise, or by string value of leftmost column.
+    Can access rows listwise, or by value of leftmost column (or the column set by index_by).
     """
 
     # Object constructor
@@ -202,21 +282,29 @@ class ResultSet(list, ColumnGuesserMixin):
         self.display_info = True
         self.suppress_result = False
 
+        # column used for keyed access, None means leftmost column
+        self._key_column = None
+
+        # incremented on each data update, invalidates the cached chart sub-tables and figure
+        self._data_version = 0
+        self._chart_cache = None
+
         self._update(queryResult)
 
-    def _get_palette(self, n_colors=None, desaturation=None):
-        name = self.options.get("palette_name")
-        length = max(n_colors or 10, self.options.get("palette_colors") or 10)
+    def _get_palette(self, n_colors=None, desaturation=None, **kwargs):
+        options = {**self.options, **kwargs}
+        name = options.get("palette_name")
+        length = max(n_colors or 10, options.get("palette_colors") or 10)
         self.metadata["palette"] = Palette(
             palette_name=name,
             n_colors=length,
-            desaturation=desaturation or self.options.get("palette_desaturation"),
-            to_reverse=self.options.get("palette_reverse"),
+            desaturation=desaturation or options.get("palette_desaturation"),
+            to_reverse=options.get("palette_reverse"),
         )
         return self.palette
 
-    def get_color_from_palette(self, idx, n_colors=None, desaturation=None):
-        palette = self.palette or self._get_palette(n_colors, desaturation)
+    def get_color_from_palette(self, idx, n_colors=None, desaturation=None, **kwargs):
+        palette = self.palette or self._get_palette(n_colors, desaturation, **kwargs)
         if idx < len(palette):
             return str(palette[idx])
         return None
@@ -268,6 +356,10 @@ class ResultSet(list, ColumnGuesserMixin):
         self._json_response = queryResult.json_response
         queryResultTable = queryResult.tables[self.fork_table_id]
         self._dataframe = None
+        self._columns_values = None
+        self._key_index = None
+        self._data_version += 1
+        self._chart_cache = None
         # schema
         self.columns_name = queryResultTable.keys()
         self.columns_type = queryResultTable.types()
@@ -352,23 +444,40 @@ class ResultSet(list, ColumnGuesserMixin):
         self.suppress_result = False
         return ""
 
-    def _getTableHtml(self):
-        "get query result in a table format as an HTML string"
-        _cell_with_spaces_pattern = re.compile(r"(<td>)( {2,})")
-        if self.pretty:
-            self.pretty.add_rows(self)
-            result = self.pretty.get_html_string()
-            result = _cell_with_spaces_pattern.sub(_nonbreaking_spaces, result)
-            display_limit = 0 if not self.options.get("display_limit") else self.options.get("display_limit")
-            if display_limit > 0 and len(self) > display_limit:
-                result = '%s\n<span style="font-style:italic;text-align:center;">%d rows, truncated to display_limit of %d</span>' % (
-                    result,
-                    len(self),
-                    display_limit,
-                )
-            return {"body": result}
-        else:
+    # max number of rows rendered to html when display_limit is not set, protects the browser from huge html payloads
+    _DEFAULT_DISPLAY_LIMIT = 10000
+
+    def _get_display_limit(self, **kwargs):
+        display_limit = {**self.options, **kwargs}.get("display_limit")
+        return display_limit if display_limit else self._DEFAULT_DISPLAY_LIMIT
+
+    def _getTableHtml(self, offset=0, **kwargs):
+        """get query result in a table format as an HTML string.
+        Only rows in the display window are converted and rendered, directly from the columns values"""
+        if len(self.field_names) == 0:
             return {}
+        display_limit = self._get_display_limit(**kwargs)
+        end = min(len(self), offset + display_limit)
+        columns_values = self._queryResult.tables[self.fork_table_id].columns_values_range(max(offset, 0), end)
+        columns_cells = [[_html_cell(v) for v in values] for values in columns_values]
+
+        lines = ["<table>", "    <tr>"]
+        lines.extend(["        <th>{0}</th>".format(_html_cell(name)) for name in self.field_names])
+        lines.append("    </tr>")
+        for row_cells in zip(*columns_cells):
+            lines.append("    <tr>")
+            lines.extend(["        <td>{0}</td>".format(cell) for cell in row_cells])
+            lines.append("    </tr>")
+        lines.append("</table>")
+        result = "\n".join(lines)
+
+        if offset > 0 or len(self) > end:
+            if offset > 0:
+                message = "%d rows, displaying rows %d to %d" % (len(self), offset + 1, end)
+            else:
+                message = "%d rows, truncated to display_limit of %d" % (len(self), display_limit)
+            result = '%s\n<span style="font-style:italic;text-align:center;">%s</span>' % (result, message)
+        return {"body": result}
 
     def show_table(self, **kwargs):
         "display the table"
@@ -379,8 +488,13 @@ class ResultSet(list, ColumnGuesserMixin):
         elif options.get("table_package", "").upper() == "PANDAS":
             t = self.to_dataframe()._repr_html_()
             html = Display.toHtml(body=t)
+        elif options.get("table_package", "").upper() == "INTERACTIVE" and not options.get("popup_window"):
+            from Kqlmagic.interactive_table import InteractiveTable
+
+            table = InteractiveTable(self, **options)
+            html = table.get_widget() or table.get_html()
         else:
-            t = self._getTableHtml()
+            t = self._getTableHtml(**kwargs)
             html = Display.toHtml(**t)
         if options.get("popup_window") and not options.get("button_text"):
             options["button_text"] = "popup " + "table" + ((" - " + self.title) if self.title else "") + " "
@@ -409,20 +523,80 @@ class ResultSet(list, ColumnGuesserMixin):
         try:
             return list.__getitem__(self, key)
         except TypeError:
-            result = [row for row in self if row[0] == key]
-            if not result or len(result) == 0:
+            try:
+                rows_idx = self._get_key_index().get(key)
+            except TypeError:
+                # unhashable key (dict, list), can be matched only by scanning the rows
+                key_column_idx = self._get_key_column_idx()
+                rows_idx = [idx for idx, row in enumerate(self) if row[key_column_idx] == key]
+            if not rows_idx:
                 raise KeyError(key)
-            if len(result) > 1:
-                raise KeyError('%d results for "%s"' % (len(result), key))
-            return result[0]
+            if len(rows_idx) > 1:
+                raise KeyError('%d results for "%s"' % (len(rows_idx), key))
+            return list.__getitem__(self, rows_idx[0])
+
+    def index_by(self, column=None):
+        """Set the column used for keyed access, result[key].
+        column can be a column name or a column index, if None the leftmost column is used.
+        Returns the result set, to enable chaining, for example: result.index_by('name')['foo']"""
+        if isinstance(column, int):
+            if not 0 <= column < len(self.columns_name):
+                raise ValueError("index_by failed, column index {0} out of range, result has {1} columns".format(column, len(self.columns_name)))
+        elif column is not None and column not in self.columns_name:
+            raise ValueError("index_by failed, column {0} not in result columns".format(column))
+        self._key_column = column
+        self._key_index = None
+        return self
+
+    def _get_key_column_idx(self):
+        if self._key_column is None:
+            return 0
+        if isinstance(self._key_column, int):
+            return self._key_column
+        return self.columns_name.index(self._key_column)
+
+    def _get_key_index(self):
+        "lazily build a hash index that maps key column value to rows position, invalidated by _update"
+        if self._key_index is None:
+            key_index = {}
+            key_column_idx = self._get_key_column_idx()
+            if self._columns_values is not None:
+                key_column_values = self._columns_values[key_column_idx]
+            else:
+                # only the key column is converted
+                key_column_values = self._queryResult.tables[self.fork_table_id].column_values_range(key_column_idx, 0, len(self))
+            for idx, value in enumerate(key_column_values):
+                try:
+                    key_index.setdefault(value, []).append(idx)
+                except TypeError:
+                    # unhashable value (dynamic), cannot be matched by a hashable key
+                    pass
+            self._key_index = key_index
+        return self._key_index
+
+    def _get_columns_values(self):
+        "returns the result set columns values, built column-wise from the response (without row objects)"
+        if self._columns_values is None:
+            if len(self) > 0:
+                self._columns_values = self._queryResult.tables[self.fork_table_id].columns_values(size=len(self))
+            else:
+                self._columns_values = [[] for c in self.columns_name]
+        return self._columns_values
+
+    def _get_columns_schema(self):
+        "returns the columns schema (name, type, dataframe_type, is_quantity, is_datetime, has_nulls), inferred once per response"
+        return self._queryResult.tables[self.fork_table_id].columns_schema
 
     def to_dict(self):
         """Returns a single dict built from the result set
         Keys are column names; values are a tuple"""
-        if len(self):
-            return dict(zip(self.columns_name, zip(*self)))
-        else:
-            return dict(zip(self.columns_name, [() for c in self.columns_name]))
+        columns = []
+        for col_schema, values in zip(self._get_columns_schema(), self._get_columns_values()):
+            if col_schema["type"] == "dynamic":
+                columns.append(tuple(Display.to_styled_class(v, **self.options) for v in values))
+            else:
+                columns.append(tuple(values))
+        return dict(zip(self.columns_name, columns))
 
     def dicts_iterator(self):
         "Iterator yielding a dict for each row"
@@ -458,7 +632,12 @@ class ResultSet(list, ColumnGuesserMixin):
         window_mode = options is not None and options.get("popup_window")
         if window_mode and not options.get("button_text"):
             options["button_text"] = "popup " + self.visualization + ((" - " + self.title) if self.title else "") + " "
-        c = self._getChartHtml(window_mode)
+        live_chart = self.metadata.get("live_chart")
+        if live_chart is not None and live_chart.is_running and live_chart.result_set is self and not window_mode:
+            # the live chart figure widget is displayed, so live updates are visible
+            Display.show(live_chart.figure, **options)
+            return None
+        c = self._getChartHtml(window_mode, **kwargs)
         if c.get("body") or c.get("head"):
             html = Display.toHtml(**c)
             Display.show(html, **options)
@@ -471,15 +650,43 @@ class ResultSet(list, ColumnGuesserMixin):
         else:
             return self.show_table(**kwargs)
 
+    def start_live(self, interval=30, window=None, **kwargs):
+        """start live update of the timechart: every interval seconds, only rows newer than the last seen time are queried,
+        and appended to the chart figure. Each serie retains at most window points"""
+        from Kqlmagic.live_chart import LiveChart
+
+        self.stop_live()
+        self.metadata["live_chart"] = LiveChart(self, interval, window, **kwargs).start()
+        return self
+
+    def stop_live(self):
+        "stop live update of the timechart"
+        live_chart = self.metadata.get("live_chart")
+        if live_chart is not None:
+            live_chart.stop()
+            self.metadata["live_chart"] = None
+        return self
+
     def to_image(self, **kwargs):
         "export image of the chart that was specified in the query to a file"
         params = kwargs or {}
-        fig = self._getChartHtml().get("fig")
+        fig = self._getChartHtml(**kwargs).get("fig")
         if fig is not None:
             file = params.get("filename")
-            image = self._export_chart_image_plotly(fig, file, **kwargs)
+            if MatplotlibChart.is_figure(fig):
+                image = self._export_chart_image_matplotlib(fig, file, **kwargs)
+            else:
+                image = self._export_chart_image_plotly(fig, file, **kwargs)
             return FileResultDescriptor(image, message="image results", format=params.get("format"), show=params.get("show"))
 
+    def _export_chart_image_matplotlib(self, fig, file, **kwargs):
+        image = MatplotlibChart.to_image(fig, format=kwargs.get("format"), dpi=kwargs.get("dpi"))
+        if file:
+            with open(file, "wb") as f:
+                f.write(image)
+            return file
+        return image
+
     def _export_chart_image_plotly(self, fig, file, **kwargs):
         params = kwargs or {}
         if file:
@@ -492,6 +699,79 @@ class ResultSet(list, ColumnGuesserMixin):
                 fig, format=params.get("format"), scale=params.get("scale"), width=params.get("width"), height=params.get("height")
             )
 
+    @staticmethod
+    def export_images(charts, folder=None, zip_filename=None, format="png", max_workers=4, **kwargs):
+        """export images of many charts (result sets, plotly or matplotlib figures) in one batch.
+        Plotly images are requested from the plotly image renderer (a persistent orca server process), up to max_workers
+        requests at a time, matplotlib images are rendered headless, in process.
+        Images are written to folder (default current folder), or to zip_filename, named <index>_<title>.<format>.
+        A chart that fails to export is skipped, and reported in a warning message, the other charts are exported.
+        Returns a list of FileResultDescriptor, one per exported image, or a FileResultDescriptor of the zip file"""
+        from concurrent.futures import ThreadPoolExecutor
+        import zipfile
+
+        format = format or "png"
+        named_figures = []
+        errors = []
+        for idx, chart in enumerate(charts):
+            name = "{0:04d}".format(idx)
+            try:
+                if isinstance(chart, ResultSet):
+                    fig = chart._getChartHtml(**kwargs).get("fig")
+                    title = chart.title or chart.visualization
+                else:
+                    fig = chart
+                    title = None
+                if fig is None:
+                    continue
+                if MatplotlibChart.is_figure(fig):
+                    # matplotlib figures are rendered headless, in process, they don't require the renderer server
+                    fig_dict = None
+                    image = MatplotlibChart.to_image(fig, format=format, dpi=kwargs.get("dpi"))
+                    title = title or "chart"
+                else:
+                    # figures are serialized in the calling thread, figure widgets are not thread safe
+                    fig_dict = fig.to_dict() if hasattr(fig, "to_dict") else fig
+                    image = None
+                    title = title or ((fig_dict.get("layout") or {}).get("title") or "chart")
+            except Exception as e:
+                errors.append("{0}: {1}".format(name, e))
+                continue
+            title = "".join([c if c.isalnum() or c in "-_" else "_" for c in str(title)])
+            named_figures.append(["{0}_{1}.{2}".format(name, title, format), fig_dict, image])
+
+        def _render(named_figure):
+            name, fig_dict, image = named_figure
+            try:
+                named_figure[2] = plotly.io.to_image(
+                    fig_dict, format=format, scale=kwargs.get("scale"), width=kwargs.get("width"), height=kwargs.get("height"), validate=False
+                )
+            except Exception as e:
+                errors.append("{0}: {1}".format(name, e))
+
+        plotly_figures = [named_figure for named_figure in named_figures if named_figure[1] is not None]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_render, plotly_figures))
+        images = [(name, image) for name, fig_dict, image in named_figures if image is not None]
+        if len(errors) > 0:
+            Display.showWarningMessage(["export of {0} of {1} images failed:".format(len(errors), len(errors) + len(images))] + sorted(errors))
+
+        if zip_filename:
+            with zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_DEFLATED) as zip_file:
+                for name, image in images:
+                    zip_file.writestr(name, image)
+            return FileResultDescriptor(zip_filename, message="images zip", format="zip")
+
+        folder = folder or "."
+        os.makedirs(folder, exist_ok=True)
+        descriptors = []
+        for name, image in images:
+            file_path = os.path.join(folder, name)
+            with open(file_path, "wb") as f:
+                f.write(image)
+            descriptors.append(FileResultDescriptor(file_path, message="image results", format=format))
+        return descriptors
+
     def popup_Chart(self, **kwargs):
         "display the chart that was specified in the query in a popup window"
         return self.popup(**kwargs)
@@ -511,7 +791,7 @@ class ResultSet(list, ColumnGuesserMixin):
     def is_chart(self):
         return self.visualization and self.visualization != VisualizationValues.TABLE
 
-    def _getChartHtml(self, window_mode=False):
+    def _getChartHtml(self, window_mode=False, **kwargs):
         "get query result in a char format as an HTML string"
         # https://kusto.azurewebsites.net/docs/queryLanguage/query_language_renderoperator.html
 
@@ -534,46 +814,116 @@ class ResultSet(list, ColumnGuesserMixin):
             body = '<div id="uuid-' + id + '"><br><br>EMPTY CHART (no data)<br><br>.</div>'
             return {"body": body, "head": head}
 
+        figure_or_data = self._get_chart_figure(**kwargs)
+
+        if figure_or_data is not None:
+            self.metadata["figure_or_data"] = figure_or_data
+            if MatplotlibChart.is_figure(figure_or_data):
+                return {"body": MatplotlibChart.to_html(figure_or_data), "head": "", "fig": figure_or_data}
+            elif window_mode:
+                head = (
+                    '<script src="https://cdn.plot.ly/plotly-latest.min.js"></script>'
+                    if window_mode and not self.options.get("plotly_fs_includejs", False)
+                    else ""
+                )
+                body = plotly.offline.plot(
+                    figure_or_data, include_plotlyjs=window_mode and self.options.get("plotly_fs_includejs", False), output_type="div"
+                )
+                return {"body": body, "head": head}
+            else:
+                self
+                return {"fig": figure_or_data}
+        return {}
+
+    # options that change the chart data, a change in these options requires to rebuild the figure
+    _CHART_DATA_OPTIONS = ["plot_package", "chart_max_points", "chart_max_categories", "chart_engine", "chart_webgl_threshold"]
+    # options that change only the chart style, a change in these options is patched on the existing figure
+    _CHART_STYLE_OPTIONS = ["palette_name", "palette_colors", "palette_desaturation", "palette_reverse"]
+
+    def _get_chart_figure(self, **kwargs):
+        """returns the chart figure.
+        The figure is cached, keyed by the visualization properties, the data options and the data version.
+        Palette options changes are patched on the cached figure, instead of rebuilding it"""
+        options = {**self.options, **kwargs}
+        data_key = (
+            self._data_version,
+            self.visualization,
+            json.dumps(self.visualization_properties, sort_keys=True, default=str),
+            tuple(options.get(o) for o in self._CHART_DATA_OPTIONS),
+        )
+        style_key = tuple(options.get(o) for o in self._CHART_STYLE_OPTIONS)
+        if self._chart_cache is not None and self._chart_cache["data_key"] == data_key:
+            figure_or_data = self._chart_cache["figure_or_data"]
+            if figure_or_data is None or self._chart_cache["style_key"] == style_key:
+                return figure_or_data
+            # matplotlib figures are not patched, they are rebuilt
+            if not MatplotlibChart.is_figure(figure_or_data):
+                self._patch_chart_figure_palette(figure_or_data, **kwargs)
+                self._chart_cache["style_key"] = style_key
+                return figure_or_data
+
+        self.metadata["palette"] = None
+        figure_or_data = self._build_chart_figure(**kwargs)
+        self._chart_cache = {"data_key": data_key, "style_key": style_key, "figure_or_data": figure_or_data}
+        return figure_or_data
+
+    def _patch_chart_figure_palette(self, fig, **kwargs):
+        "set figure traces colors from the palette, in place"
+        traces = fig.data
+        n_colors = len(traces[0].labels) if len(traces) > 0 and traces[0].type == "pie" else len(traces)
+        palette = [str(c) for c in self._get_palette(n_colors=n_colors, **kwargs)]
+        with fig.batch_update():
+            for idx, trace in enumerate(traces):
+                color = palette[idx] if idx < len(palette) else None
+                if trace.type == "pie":
+                    trace.marker.colors = palette[:n_colors]
+                elif trace.type == "bar" or trace.mode == "markers":
+                    trace.marker.color = color
+                else:
+                    trace.line.color = color
+
+    def _build_chart_figure(self, **kwargs):
+        "build the chart figure from the result set, based on the visualization"
         figure_or_data = None
 
+        if {**self.options, **kwargs}.get("plot_package") == "matplotlib":
+            return MatplotlibChart(self, **kwargs).build(self.visualization_properties)
+
         # First column is color-axis, second column is numeric
         if self.visualization == VisualizationValues.PIE_CHART:
-            figure_or_data = self._render_piechart_plotly(self.visualization_properties, " ")
-            # chart = self._render_pie(self.visualization_properties, " ")
+            figure_or_data = self._render_piechart_plotly(self.visualization_properties, " ", **kwargs)
 
         # First column is x-axis, and can be text, datetime or numeric. Other columns are numeric, displayed as horizontal strips.
         # kind = default, unstacked, stacked, stacked100 (Default, same as unstacked; unstacked - Each "area" to its own; stacked - "Areas" are stacked to the right; stacked100 - "Areas" are stacked to the right, and stretched to the same width)
         elif self.visualization == VisualizationValues.BAR_CHART:
-            figure_or_data = self._render_barchart_plotly(self.visualization_properties, " ")
-            # chart = self._render_barh(self.visualization_properties, " ")
+            figure_or_data = self._render_barchart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Like barchart, with vertical strips instead of horizontal strips.
         # kind = default, unstacked, stacked, stacked100
         elif self.visualization == VisualizationValues.COLUMN_CHART:
-            figure_or_data = self._render_barchart_plotly(self.visualization_properties, " ")
-            # chart = self._render_bar(self.visualization_properties, " ")
+            figure_or_data = self._render_barchart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Area graph. First column is x-axis, and should be a numeric column. Other numeric columns are y-axes.
         # kind = default, unstacked, stacked, stacked100
         elif self.visualization == VisualizationValues.AREA_CHART:
-            figure_or_data = self._render_areachart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_areachart_plotly(self.visualization_properties, " ", **kwargs)
             # chart = self._render_areachart(self.visualization_properties, " ")
 
         # Line graph. First column is x-axis, and should be a numeric column. Other numeric columns are y-axes.
         elif self.visualization == VisualizationValues.LINE_CHART:
-            figure_or_data = self._render_linechart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_linechart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Line graph. First column is x-axis, and should be datetime. Other columns are y-axes.
         elif self.visualization == VisualizationValues.TIME_CHART:
-            figure_or_data = self._render_timechart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_timechart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Similar to timechart, but highlights anomalies using an external machine-learning service.
         elif self.visualization == VisualizationValues.ANOMALY_CHART:
-            figure_or_data = self._render_linechart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_linechart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Stacked area graph. First column is x-axis, and should be a numeric column. Other numeric columns are y-axes.
         elif self.visualization == VisualizationValues.STACKED_AREA_CHART:
-            figure_or_data = self._render_stackedareachart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_stackedareachart_plotly(self.visualization_properties, " ", **kwargs)
 
         # Last two columns are the x-axis, other columns are y-axis.
         elif self.visualization == VisualizationValues.LADDER_CHART:
@@ -592,32 +942,15 @@ class ResultSet(list, ColumnGuesserMixin):
 
         # Points graph. First column is x-axis, and should be a numeric column. Other numeric columns are y-axes
         elif self.visualization == VisualizationValues.SCATTER_CHART:
-            figure_or_data = self._render_scatterchart_plotly(self.visualization_properties, " ")
+            figure_or_data = self._render_scatterchart_plotly(self.visualization_properties, " ", **kwargs)
 
-        if figure_or_data is not None:
-            self.metadata["figure_or_data"] = figure_or_data
-            if window_mode:
-                head = (
-                    '<script src="https://cdn.plot.ly/plotly-latest.min.js"></script>'
-                    if window_mode and not self.options.get("plotly_fs_includejs", False)
-                    else ""
-                )
-                body = plotly.offline.plot(
-                    figure_or_data, include_plotlyjs=window_mode and self.options.get("plotly_fs_includejs", False), output_type="div"
-                )
-                return {"body": body, "head": head}
-            else:
-                self
-                return {"fig": figure_or_data}
-        return {}
+        return figure_or_data
 
     def pie(self, properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab pie chart from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
+        """Generates a matplotlib pie chart from the result set.
 
-            %%matplotlib inline
+        ``matplotlib`` must be installed. The chart is drawn on a new figure
+        (no pyplot state) and displayed as an image, no inlining is required.
 
         Values (pie slice sizes) are taken from the
         rightmost column (numerical values required).
@@ -630,24 +963,23 @@ class ResultSet(list, ColumnGuesserMixin):
         title: Plot title, defaults to name of value column
 
         Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.pie``.
+        through to ``matplotlib.axes.Axes.pie``.
         """
+        import numpy as np
 
         self.build_columns()
-        import matplotlib.pyplot as plt
-
-        pie = plt.pie(self.columns[1], labels=self.columns[0], **kwargs)
-        plt.title(properties.get(VisualizationKeys.TITLE) or self.columns[1].name)
-        plt.show()
+        fig = MatplotlibChart.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        pie = ax.pie(np.asarray(self.columns[1], dtype=float), labels=[str(label) for label in self.columns[0]], **kwargs)
+        ax.set_title(properties.get(VisualizationKeys.TITLE) or self.columns[1].name)
+        Display.show_html(MatplotlibChart.to_html(fig))
         return pie
 
     def plot(self, properties:dict, **kwargs):
-        """Generates a pylab plot from the result set.
+        """Generates a matplotlib plot from the result set.
 
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
-
-            %%matplotlib inline
+        ``matplotlib`` must be installed. The chart is drawn on a new figure
+        (no pyplot state) and displayed as an image, no inlining is required.
 
         The first and last columns are taken as the X and Y
         values.  Any columns between are ignored.
@@ -657,28 +989,29 @@ class ResultSet(list, ColumnGuesserMixin):
         title: Plot title, defaults to names of Y value columns
 
         Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.plot``.
+        through to ``matplotlib.axes.Axes.plot``.
         """
-        import matplotlib.pylab as plt
+        import numpy as np
 
         self.guess_plot_columns()
-        self.x = self.x or range(len(self.ys[0]))
-        coords = functools.reduce(operator.add, [(self.x, y) for y in self.ys])
-        plot = plt.plot(*coords, **kwargs)
+        x = np.asarray(self.x) if self.x else np.arange(len(self.ys[0]))
+        fig = MatplotlibChart.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        coords = functools.reduce(operator.add, [(x, np.asarray(y)) for y in self.ys])
+        plot = ax.plot(*coords, **kwargs)
         if hasattr(self.x, "name"):
-            plt.xlabel(self.x.name)
+            ax.set_xlabel(self.x.name)
         ylabel = ", ".join(y.name for y in self.ys)
-        plt.title(properties.get(VisualizationKeys.TITLE) or ylabel)
-        plt.ylabel(ylabel)
+        ax.set_title(properties.get(VisualizationKeys.TITLE) or ylabel)
+        ax.set_ylabel(ylabel)
+        Display.show_html(MatplotlibChart.to_html(fig))
         return plot
 
     def bar(self, properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab bar plot from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
+        """Generates a matplotlib bar plot from the result set.
 
-            %%matplotlib inline
+        ``matplotlib`` must be installed. The chart is drawn on a new figure
+        (no pyplot state) and displayed as an image, no inlining is required.
 
         The last quantitative column is taken as the Y values;
         all other columns are combined to label the X axis.
@@ -690,199 +1023,149 @@ class ResultSet(list, ColumnGuesserMixin):
                       from each other in labels
 
         Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.bar``.
+        through to ``matplotlib.axes.Axes.bar``.
         """
-        import matplotlib.pylab as plt
+        import numpy as np
 
         self.guess_pie_columns(xlabel_sep=key_word_sep)
-        plot = plt.bar(range(len(self.ys[0])), self.ys[0], **kwargs)
+        fig = MatplotlibChart.new_figure()
+        ax = fig.add_subplot(1, 1, 1)
+        positions = np.arange(len(self.ys[0]))
+        plot = ax.bar(positions, np.asarray(self.ys[0], dtype=float), **kwargs)
         if self.xlabels:
-            plt.xticks(range(len(self.xlabels)), self.xlabels, rotation=45)
-        plt.xlabel(self.xlabel)
-        plt.ylabel(self.ys[0].name)
+            ax.set_xticks(positions)
+            ax.set_xticklabels(self.xlabels, rotation=45)
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ys[0].name)
+        Display.show_html(MatplotlibChart.to_html(fig))
         return plot
 
-    def to_csv(self, filename=None, **kwargs):
+    # number of rows converted and written at a time by the export methods
+    _EXPORT_CHUNK_SIZE = 10000
+
+    # file extension to export method
+    _EXPORT_FORMATS = {"csv": "to_csv", "parquet": "to_parquet", "jsonl": "to_jsonl"}
+
+    # index MUST be lowercase, types not in the table are exported as string
+    _KQL_TO_PARQUET_DATA_TYPES = {
+        "bool": "bool_",
+        "boolean": "bool_",
+        "sbyte": "int64",
+        "uint8": "int64",
+        "int16": "int64",
+        "uint16": "int64",
+        "int": "int64",
+        "int32": "int64",
+        "uint": "int64",
+        "long": "int64",
+        "int64": "int64",
+        "ulong": "int64",
+        "float": "float64",
+        "real": "float64",
+        "double": "float64",
+        "datetime": "timestamp",
+        "timespan": "duration",
+    }
+
+    @classmethod
+    def is_export_file(cls, filename) -> bool:
+        "returns True if the file extension is one of the formats that can be exported from a result set"
+        return isinstance(filename, str) and filename.split(".")[-1].lower() in cls._EXPORT_FORMATS
+
+    def export(self, filename, **kwargs):
+        "export the result set to a file, format is set by the file extension (csv, parquet or jsonl)"
+        if not self.is_export_file(filename):
+            raise ValueError(
+                "export failed, unknown file format {0}, valid formats are: {1}".format(filename, ", ".join(self._EXPORT_FORMATS.keys()))
+            )
+        return getattr(self, self._EXPORT_FORMATS[filename.split(".")[-1].lower()])(filename, **kwargs)
+
+    def _iter_columns_chunks(self, chunk_size=None):
+        "iterate over the result set rows in chunks, each chunk is a list of columns values, streamed from the response"
+        table = self._queryResult.tables[self.fork_table_id]
+        return table.iter_columns_chunks(chunk_size or self._EXPORT_CHUNK_SIZE, size=len(self))
+
+    @staticmethod
+    def _export_value(value):
+        return json.dumps(value, cls=ExportJSONEncoder) if isinstance(value, (dict, list)) else value
+
+    def to_csv(self, filename=None, chunk_size=None, **kwargs):
         """Generate results in comma-separated form.  Write to ``filename`` if given.
+           Rows are streamed from the response in chunks.
            Any other parameters will be passed on to csv.writer."""
-        if not self.pretty:
+        if len(self.field_names) == 0:
             return None  # no results
-        self.pretty.add_rows(self)
+        encoding = kwargs.pop("encoding", "utf-8")
         if filename:
-            encoding = kwargs.get("encoding", "utf-8")
             if six.PY2:
                 outfile = open(filename, "wb")
             else:
                 outfile = open(filename, "w", newline="", encoding=encoding)
         else:
             outfile = six.StringIO()
-        writer = UnicodeWriter(outfile, **kwargs)
+        writer = UnicodeWriter(outfile, encoding=encoding, **kwargs) if six.PY2 else csv.writer(outfile, **kwargs)
         writer.writerow(self.field_names)
-        for row in self:
-            writer.writerow(row)
+        export_value = self._export_value
+        for columns_values in self._iter_columns_chunks(chunk_size):
+            writer.writerows([[export_value(v) for v in row] for row in zip(*columns_values)])
         if filename:
             outfile.close()
             message = "csv results"
-            return FileResultDescriptor(filename, message=message, format="csv", **kwargs)
+            return FileResultDescriptor(filename, message=message, format="csv")
         else:
             return outfile.getvalue()
 
-    def _render_pie(self, properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab pie chart from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
-
-            %%matplotlib inline
-
-        First column is color-axis, second column is numeric
-
-        Parameters
-        ----------
-        key_word_sep: string used to separate column values
-                      from each other in pie labels
-        title: Plot title, defaults to name of value column
-
-        Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.pie``.
-        """
-        self.build_columns()
-        import matplotlib.pylab as plt
-
-        pie = plt.pie(self.columns[1], labels=self.columns[0], **kwargs)
-        plt.title(properties.get(VisualizationKeys.TITLE) or self.columns[1].name)
-        plt.show()
-        return pie
-
-    def _render_barh(self, properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab horizaontal barchart from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
-
-            %%matplotlib inline
-
-        First column is x-axis, and can be text, datetime or numeric. 
-        Other columns are numeric, displayed as horizontal strips.
-
-        Parameters
-        ----------
-        key_word_sep: string used to separate column values
-                      from each other in pie labels
-        title: Plot title, defaults to name of value column
-
-        Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.pie``.
-        """
-        import matplotlib.pylab as plt
-
-        self.build_columns()
-        quantity_columns = [c for c in self.columns[1:] if c.is_quantity]
-        ylabel = ", ".join([c.name for c in quantity_columns])
-        xlabel = self.columns[0].name
-
-        dim = len(quantity_columns)
-        w = 0.8
-        dimw = w / dim
-
-        x = plt.arange(len(self.columns[0]))
-        xpos = -dimw * (len(quantity_columns) / 2)
-        for y in quantity_columns:
-            barchart = plt.barh(x + xpos, y, align="center", **kwargs)
-            # ax.barh(x + xpos, y, width = dimw, color='b', align='center', **kwargs)
-            # ax.bar(y, width = dimw, height = w, x + xpos, *, align='center', **kwargs)
-            xpos += dimw
-        plt.yticks(range(len(self.columns[0])), self.columns[0], rotation=0)
-        plt.ylabel(xlabel)
-        plt.xlabel(ylabel)
-        plt.title(properties.get(VisualizationKeys.TITLE) or ylabel)
-
-        plt.show()
-        return barchart
-
-    def _render_bar(self,properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab horizaontal barchart from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
-
-            %%matplotlib inline
-
-        First column is x-axis, and can be text, datetime or numeric. 
-        Other columns are numeric, displayed as horizontal strips.
-
-        Parameters
-        ----------
-        key_word_sep: string used to separate column values
-                      from each other in pie labels
-        title: Plot title, defaults to name of value column
-
-        Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.pie``.
-        """
-        import matplotlib.pylab as plt
-
-        self.build_columns()
-        quantity_columns = [c for c in self.columns[1:] if c.is_quantity]
-        ylabel = ", ".join([c.name for c in quantity_columns])
-        xlabel = self.columns[0].name
-
-        # print("xlabel: {}".format(xlabel))
-        # print("ylabel: {}".format(ylabel))
-
-        dim = len(quantity_columns)
-        w = 0.8
-        dimw = w / dim
-
-        x = plt.arange(len(self.columns[0]))
-        xpos = -dimw * (len(quantity_columns) / 2)
-        for y in quantity_columns:
-            columnchart = plt.bar(x + xpos, y, width=dimw, align="center", **kwargs)
-            xpos += dimw
-        plt.xticks(range(len(self.columns[0])), self.columns[0], rotation=45)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.title(properties.get(VisualizationKeys.TITLE) or ylabel)
-
-        plt.show()
-        return columnchart
-
-    def _render_linechart(self, properties:dict, key_word_sep=" ", **kwargs):
-        """Generates a pylab plot from the result set.
-
-        ``matplotlib`` must be installed, and in an
-        IPython Notebook, inlining must be on::
-
-            %%matplotlib inline
-
-        First column is x-axis, and should be a numeric column. Other numeric columns are y-axes.
-
-        Parameters
-        ----------
-        title: Plot title, defaults to names of Y value columns
+    def to_jsonl(self, filename=None, chunk_size=None, **kwargs):
+        """Generate results in json lines form, a json object per row.  Write to ``filename`` if given.
+           Rows are streamed from the response in chunks."""
+        encoding = kwargs.get("encoding", "utf-8")
+        outfile = open(filename, "w", encoding=encoding) if filename else six.StringIO()
+        columns_name = self.field_names
+        for columns_values in self._iter_columns_chunks(chunk_size):
+            outfile.writelines([json.dumps(dict(zip(columns_name, row)), cls=ExportJSONEncoder) + "\n" for row in zip(*columns_values)])
+        if filename:
+            outfile.close()
+            message = "jsonl results"
+            return FileResultDescriptor(filename, message=message, format="jsonl")
+        else:
+            return outfile.getvalue()
 
-        Any additional keyword arguments will be passsed
-        through to ``matplotlib.pylab.plot``.
-        """
+    def to_parquet(self, filename, chunk_size=None, **kwargs):
+        """Write results to a parquet file. Each chunk of rows is streamed from the response as a row group.
 
-        import matplotlib.pyplot as plt
+        ``pyarrow`` must be installed.
+        Any other parameters will be passed on to pyarrow.parquet.ParquetWriter."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("to_parquet requires pyarrow package, run '!pip install pyarrow' to install it")
+
+        parquet_types = [self._KQL_TO_PARQUET_DATA_TYPES.get(t.lower(), "string") for t in self.columns_type]
+        fields = []
+        for name, parquet_type in zip(self.field_names, parquet_types):
+            if parquet_type == "timestamp":
+                arrow_type = pyarrow.timestamp("us", tz="UTC")
+            elif parquet_type == "duration":
+                arrow_type = pyarrow.duration("us")
+            else:
+                arrow_type = getattr(pyarrow, parquet_type)()
+            fields.append(pyarrow.field(name, arrow_type))
+        schema = pyarrow.schema(fields)
 
-        self.build_columns()
-        quantity_columns = [c for c in self.columns if c.is_quantity]
-        if len(quantity_columns) < 2:
-            return None
-        x = quantity_columns[0]
-        ys = quantity_columns[1:]
-        ylabel = ", ".join([c.name for c in ys])
-        xlabel = x.name
-
-        coords = functools.reduce(operator.add, [(x, y) for y in ys])
-        plot = plt.plot(*coords, **kwargs)
-        plt.title(properties.get(VisualizationKeys.TITLE) or ylabel)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.show()
-        return plot
+        writer = pyarrow.parquet.ParquetWriter(filename, schema, **kwargs)
+        try:
+            for columns_values in self._iter_columns_chunks(chunk_size):
+                arrays = []
+                for values, parquet_type, field in zip(columns_values, parquet_types, fields):
+                    if parquet_type == "string":
+                        values = [v if v is None or isinstance(v, str) else json.dumps(v, cls=ExportJSONEncoder) for v in values]
+                    arrays.append(pyarrow.array(values, type=field.type))
+                writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        finally:
+            writer.close()
+        message = "parquet results"
+        return FileResultDescriptor(filename, message=message, format="parquet")
 
     def _get_plotly_axis_scale(self, specified_property: str, col=None):
         if col is not None:
@@ -942,6 +1225,31 @@ class ResultSet(list, ColumnGuesserMixin):
         return chart_properties
 
 
+    def _get_plotly_scatter_class(self, points_count: int, **kwargs):
+        "returns plotly scatter trace class, WebGL based (Scattergl) or SVG based (Scatter), based on chart_engine option and number of points"
+        options = {**self.options, **kwargs}
+        chart_engine = options.get("chart_engine") or "auto"
+        if chart_engine == "webgl" or (chart_engine == "auto" and points_count > (options.get("chart_webgl_threshold") or 0)):
+            return go.Scattergl
+        return go.Scatter
+
+    def _get_chart_sub_table_points(self, tab, **kwargs):
+        "returns chart sub-table x and y lists, downsampled to chart_max_points"
+        return _min_max_downsample(list(tab.keys()), list(tab.values()), {**self.options, **kwargs}.get("chart_max_points"))
+
+    def _get_chart_sub_tables_stacked_points(self, tabs, **kwargs):
+        """returns the shared x list, and a y list per chart sub-table, of chart sub-tables that are stacked on the same x values.
+        Downsampled to chart_max_points by the min/max of the stack total, so all sub-tables keep the same x points and stacks line up"""
+        xs = list(tabs[0].keys())
+        ys_list = [list(tab.values()) for tab in tabs]
+        totals = [sum(y or 0 for y in ys) for ys in zip(*ys_list)]
+        idxs, _ = _min_max_downsample(list(range(len(xs))), totals, {**self.options, **kwargs}.get("chart_max_points"))
+        return [xs[i] for i in idxs], [[ys[i] for i in idxs] for ys in ys_list]
+
+    def _get_chart_sub_tables_categories(self, tabs, **kwargs):
+        "returns chart sub-tables categories and values lists, aggregated to chart_max_categories categories"
+        return _top_categories(tabs, {**self.options, **kwargs}.get("chart_max_categories"))
+
     def _render_areachart_plotly(self, properties:dict, key_word_sep=" ", **kwargs):
         """Generates a pylab plot from the result set.
 
@@ -954,13 +1262,14 @@ class ResultSet(list, ColumnGuesserMixin):
             return None
         chart_properties = self._get_plotly_chart_properties(properties, self.chart_sub_tables)
 
+        points = [self._get_chart_sub_table_points(tab, **kwargs) for tab in self.chart_sub_tables]
         data = [
             go.Scatter(
-                x=list(tab.keys()),
-                y=list(tab.values()),
+                x=points[idx][0],
+                y=points[idx][1],
                 name=tab.name,
                 mode="lines",
-                line=dict(width=0.5, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                line=dict(width=0.5, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
                 fill="tozeroy",
             )
             for idx, tab in enumerate(self.chart_sub_tables)
@@ -998,19 +1307,20 @@ class ResultSet(list, ColumnGuesserMixin):
 
         # create stack one on top of each other
         # TODO: chack newer version of plotly, support it better
+        xs, ys_list = self._get_chart_sub_tables_stacked_points(self.chart_sub_tables, **kwargs)
         ys_stcks = []
-        y_stck = [0 for x in range(len(self.chart_sub_tables[0]))]
-        for tab in self.chart_sub_tables:
-            y_stck = [(r or 0) + y_stck[idx] for (idx, r) in enumerate(tab.values())]
+        y_stck = [0 for x in range(len(xs))]
+        for ys in ys_list:
+            y_stck = [(r or 0) + y_stck[idx] for (idx, r) in enumerate(ys)]
             ys_stcks.append(y_stck)
 
         data = [
             go.Scatter(
-                x=list(tab.keys()),
+                x=xs,
                 y=ys_stcks[idx],
                 name=tab.name,
                 mode="lines",
-                line=dict(width=0.5, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                line=dict(width=0.5, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
                 fill="tonexty",
             )
             for idx, tab in enumerate(self.chart_sub_tables)
@@ -1046,12 +1356,14 @@ class ResultSet(list, ColumnGuesserMixin):
             return None
         chart_properties = self._get_plotly_chart_properties(properties, self.chart_sub_tables)
 
+        points = [self._get_chart_sub_table_points(tab, **kwargs) for tab in self.chart_sub_tables]
+        scatter_class = self._get_plotly_scatter_class(sum([len(xs) for xs, ys in points]), **kwargs)
         data = [
-            go.Scatter(
-                x=list(tab.keys()),
-                y=list(tab.values()),
+            scatter_class(
+                x=points[idx][0],
+                y=points[idx][1],
                 name=tab.name,
-                line=dict(width=1, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                line=dict(width=1, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
                 opacity=0.8,
             )
             for idx, tab in enumerate(self.chart_sub_tables)
@@ -1096,7 +1408,9 @@ class ResultSet(list, ColumnGuesserMixin):
         self._build_chart_sub_tables(properties, x_type=self._get_plotly_chart_x_type(properties))
         if len(self.chart_sub_tables) < 1:
             return None
-        n_colors = len(self.chart_sub_tables[0])
+        # each pie is aggregated by its own categories
+        categories = [self._get_chart_sub_tables_categories([tab], **kwargs)[0] for tab in self.chart_sub_tables]
+        n_colors = max([len(labels) for labels, values in categories])
 
         # number of pies to display
         pies = len(self.chart_sub_tables)
@@ -1118,14 +1432,14 @@ class ResultSet(list, ColumnGuesserMixin):
             for i in range(0, pies)
         ]
 
-        palette = self._get_palette(n_colors=n_colors)
+        palette = self._get_palette(n_colors=n_colors, **kwargs)
         show_legend = properties.get(VisualizationKeys.LEGEND) != VisualizationLegends.HIDDEN
         title = properties.get(VisualizationKeys.TITLE) or VisualizationValues.PIE_CHART
 
         data = [
             go.Pie(
-                labels=list(tab.keys()),
-                values=list(tab.values()),
+                labels=categories[idx][0],
+                values=categories[idx][1],
                 domain=domains[idx],
                 marker=dict(colors=palette),
                 name=tab.name,
@@ -1162,11 +1476,16 @@ class ResultSet(list, ColumnGuesserMixin):
             return None
         chart_properties = self._get_plotly_chart_properties(properties, sub_tables)
 
+        if sub_tables[0].col_x.is_quantity:
+            # numeric or datetime axis is not aggregated
+            categories = [(list(tab.keys()), list(tab.values())) for tab in sub_tables]
+        else:
+            categories = self._get_chart_sub_tables_categories(sub_tables, **kwargs)
         data = [
             go.Bar(
-                x=list(tab.values()) if chart_properties["orientation"] == "h" else list(tab.keys()),
-                y=list(tab.keys()) if chart_properties["orientation"] == "h" else list(tab.values()),
-                marker=dict(color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                x=categories[idx][1] if chart_properties["orientation"] == "h" else categories[idx][0],
+                y=categories[idx][0] if chart_properties["orientation"] == "h" else categories[idx][1],
+                marker=dict(color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
                 name=tab.name,
                 orientation=chart_properties["orientation"],
             )
@@ -1203,12 +1522,14 @@ class ResultSet(list, ColumnGuesserMixin):
             return None
         chart_properties = self._get_plotly_chart_properties(properties, self.chart_sub_tables)
 
+        points = [self._get_chart_sub_table_points(tab, **kwargs) for tab in self.chart_sub_tables]
+        scatter_class = self._get_plotly_scatter_class(sum([len(xs) for xs, ys in points]), **kwargs)
         data = [
-            go.Scatter(
-                x=list(tab.keys()),
-                y=list(tab.values()),
+            scatter_class(
+                x=points[idx][0],
+                y=points[idx][1],
                 name=tab.name,
-                line=dict(width=1, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                line=dict(width=1, color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
                 opacity=0.8,
             )
             for idx, tab in enumerate(self.chart_sub_tables)
@@ -1244,13 +1565,14 @@ class ResultSet(list, ColumnGuesserMixin):
             return None
         chart_properties = self._get_plotly_chart_properties(properties, self.chart_sub_tables)
 
+        scatter_class = self._get_plotly_scatter_class(sum([len(tab) for tab in self.chart_sub_tables]), **kwargs)
         data = [
-            go.Scatter(
+            scatter_class(
                 x=list(tab.keys()),
                 y=list(tab.values()),
                 name=tab.name,
                 mode="markers",
-                marker=dict(line=dict(width=1), color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"])),
+                marker=dict(line=dict(width=1), color=self.get_color_from_palette(idx, n_colors=chart_properties["n_colors"], **kwargs)),
             )
             for idx, tab in enumerate(self.chart_sub_tables)
         ]
@@ -0,0 +1,104 @@
+#-------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+#--------------------------------------------------------------------------
+
+"""
+Performance benchmarks, of the column-wise implementations against the row-wise implementations they replaced.
+Benchmarks are not collected as tests, they are run as a script, from the azure folder:
+
+    python tests/benchmark.py [benchmark_name ...] [--rows=N]
+"""
+
+import os
+import sys
+import time
+
+# Kqlmagic package is imported from the azure folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_parse import _result_set, _row_wise_chart_sub_tables, _row_wise_datatable
+
+
+def _best_time(func, repeat=3):
+    "returns the best elapsed time of func, and its result"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _report(name, rows, elapsed, row_wise_elapsed):
+    print("{0}: {1} rows, {2:.3f}s, row-wise {3:.3f}s, x{4:.1f}".format(name, rows, elapsed, row_wise_elapsed, row_wise_elapsed / elapsed))
+
+
+def benchmark_datatable(rows=100000):
+    "DataFrame parameter serialization to a datatable literal, with nulls, timedelta and dynamic values"
+    import numpy
+    import pandas
+    from Kqlmagic.parameterizer import Parameterizer
+
+    df = pandas.DataFrame({
+        'n': numpy.arange(rows),
+        'r': numpy.where(numpy.arange(rows) % 10 == 0, numpy.nan, numpy.random.rand(rows)),
+        's': ["s{0}".format(i) if i % 10 else None for i in range(rows)],
+        't': pandas.Timestamp('2019-01-01') + pandas.to_timedelta(numpy.arange(rows), unit='s'),
+        'd': pandas.to_timedelta(numpy.arange(rows) * 1001, unit='ms'),
+        'o': [{'a': i} if i % 2 else [i, 'x'] for i in range(rows)],
+    })
+    df.loc[::7, 't'] = pandas.NaT
+    df.loc[::7, 'd'] = pandas.NaT
+    parameterizer = Parameterizer({})
+    elapsed, datatable = _best_time(lambda: parameterizer.datatable(df))
+    row_wise_elapsed, row_wise_datatable = _best_time(lambda: _row_wise_datatable(parameterizer, df), repeat=1)
+    assert datatable == row_wise_datatable
+    _report("datatable", rows, elapsed, row_wise_elapsed)
+
+
+def benchmark_chart_sub_tables(rows=1000000, row_wise_rows=2000):
+    """linechart sub-tables of 10 shuffled series. The columns values are converted before the build is timed.
+    The row-wise implementation is quadratic in the number of x values, it is timed on the first row_wise_rows rows only"""
+    import random
+    from Kqlmagic.constants import VisualizationKeys
+
+    random.seed(7)
+    table_rows = [["s{0}".format(i % 10), i // 10, float(i)] for i in range(rows)]
+    random.shuffle(table_rows)
+    columns = [("s", "string"), ("x", "long"), ("y", "real")]
+    properties = {VisualizationKeys.VISUALIZATION: "linechart"}
+
+    def _build(table_rows):
+        result = _result_set(columns, table_rows)
+        result._get_columns_values()
+        elapsed, sub_tables = _best_time(lambda: result._build_chart_sub_tables(properties, x_type="quantity"), repeat=1)
+        return result, elapsed, sub_tables
+
+    result, elapsed, sub_tables = _build(table_rows)
+    assert len(sub_tables) == 10 and all(len(sub_table) == (rows + 9) // 10 for sub_table in sub_tables)
+    print("chart_sub_tables: {0} rows, {1:.3f}s".format(rows, elapsed))
+
+    result, elapsed, sub_tables = _build(table_rows[:row_wise_rows])
+    converted_rows = [list(row) for row in result]
+    row_wise_elapsed, (expected, _) = _best_time(lambda: _row_wise_chart_sub_tables(converted_rows, 1, [0], [(2, "y")]), repeat=1)
+    assert [(sub_table.name, list(sub_table.items())) for sub_table in sub_tables] == expected
+    _report("chart_sub_tables", len(converted_rows), elapsed, row_wise_elapsed)
+
+
+BENCHMARKS = {
+    "datatable": benchmark_datatable,
+    "chart_sub_tables": benchmark_chart_sub_tables,
+}
+
+
+if __name__ == "__main__":
+    names = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--"))
+    for name in names or BENCHMARKS.keys():
+        if options.get("rows"):
+            BENCHMARKS[name](rows=int(options["rows"]))
+        else:
+            BENCHMARKS[name]()
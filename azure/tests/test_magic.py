@@ -106,6 +106,26 @@ def test_access_results_by_keys():
     print(result_by_key)
     assert result_by_key == (u'William', u'Shakespeare', 1616)
 
+@with_setup(_setup, _teardown)
+def test_access_results_by_index_by_keys():
+    result = ip.run_line_magic('kql', query2)
+    result_by_key = result.index_by('last_name')['Brecht']
+    print(result_by_key)
+    assert result_by_key == (u'Bertold', u'Brecht', 1956)
+    assert result.index_by()['William'] == (u'William', u'Shakespeare', 1616)
+
+@with_setup(_setup, _teardown)
+def test_interactive_table_window():
+    from Kqlmagic.interactive_table import InteractiveTable
+    result = ip.run_line_magic('kql', query2)
+    table = InteractiveTable(result)
+    window = table.get_window(offset=0, limit=1, sort={"column": 2, "ascending": False})
+    assert window["total"] == 2
+    assert window["rows"] == [[u'Bertold', u'Brecht', u'1956']]
+    window = table.get_window(offset=0, limit=10, filter="shake")
+    assert window["total"] == 1
+    assert window["rows"][0][1] == u'Shakespeare'
+
 query4 = """
         $TEST_CONNECTION_STR
         let T = view () { datatable(first_name:string, last_name:string, year_of_death:long)
@@ -210,6 +230,20 @@ def test_csv_to_file():
             assert len(content.splitlines()) == 3
 
 
+@with_setup(_setup, _teardown)
+def test_jsonl_to_file():
+    ip.run_line_magic('config',  "{0}.auto_dataframe = False".format(Constants.MAGIC_CLASS_NAME))
+    result = ip.run_line_magic('kql', query1)
+    with tempfile.TemporaryDirectory() as tempdir:
+        fname = os.path.join(tempdir, 'test.jsonl')
+        output = result.export(fname)
+        assert os.path.exists(output.file_or_image)
+        with open(output.file_or_image) as jsonlfile:
+            lines = jsonlfile.read().splitlines()
+            assert len(lines) == 2
+            assert '"name": "foo"' in lines[0]
+
+
 @with_setup(_setup, _teardown)
 def test_dict():
     result = ip.run_line_magic('kql',  query6)
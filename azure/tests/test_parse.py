@@ -5,6 +5,8 @@
 #--------------------------------------------------------------------------
 
 import os
+import json
+import pytest
 from Kqlmagic.parser import Parser
 from Kqlmagic.kusto_engine import KustoEngine
 from six.moves import configparser
@@ -79,3 +81,787 @@ def test_parse_kusto_socket_connection_dsn():
             {'connection': result_conn_str,
             'kql': query1,
             'options': default_options}
+
+def test_parameterizer_datatable():
+    import pandas
+    from Kqlmagic.parameterizer import Parameterizer
+    df = pandas.DataFrame({
+        'n': [1, 2],
+        'r': [1.5, float('nan')],
+        'b': [True, False],
+        's': ['foo', 'bar'],
+        't': [pandas.Timestamp('2019-01-01 10:00:00'), pandas.Timestamp('2019-01-01 10:00:00.5')],
+        'd': pandas.to_timedelta(['1 days 02:03:04.5', '-00:00:01']),
+    })
+    assert Parameterizer({}).datatable(df) == \
+        " view () {datatable (n:long, r:real, b:bool, s:string, t:datetime, d:timespan) " \
+        "[1, 1.5, true, 'foo', datetime(2019-01-01 10:00:00), time(1.02:03:04.5000000), " \
+        "2, real(null), false, 'bar', datetime(2019-01-01 10:00:00.500000), time(-1.23:59:59.0000000)]}"
+
+def test_parameterizer_dataframe_serialization_cache():
+    import pandas
+    from Kqlmagic.parameterizer import Parameterizer
+    df = pandas.DataFrame({'n': [1, 2]})
+    query = "let T = T; T"
+    expanded = Parameterizer({'T': df}).expand(query)
+    assert Parameterizer({'T': df}).expand(query) == expanded
+    df.loc[0, 'n'] = 3
+    assert Parameterizer({'T': df}).expand(query) == "let T =  view () {datatable (n:long) [3, 2]};let T = T; T"
+
+def test_parameterizer_serialization_cache_shared_by_threads(monkeypatch):
+    import pandas
+    from concurrent.futures import ThreadPoolExecutor
+    from Kqlmagic.parameterizer import Parameterizer
+    monkeypatch.setattr(Parameterizer, "MAX_SERIALIZATION_CACHE_SIZE", 2)
+    dfs = [pandas.DataFrame({'n': [i, i + 1], 's': ['a', 1]}) for i in range(8)]
+
+    def _expand(i):
+        return Parameterizer({'T': dfs[i % len(dfs)]}).expand("let T = T; T")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        expanded = list(executor.map(_expand, range(400)))
+    assert expanded[:8] == ["let T =  view () {{datatable (n:long, s:string) [{0}, 'a', {1}, '1']}};let T = T; T".format(i, i + 1) for i in range(8)]
+    assert expanded[8:] == expanded[:8] * 49
+    assert len(Parameterizer._serialization_cache) <= 2
+    # the values types are part of the fingerprint
+    parameterizer = Parameterizer({})
+    assert parameterizer._dataframe_fingerprint(pandas.DataFrame({'s': [1]})) != parameterizer._dataframe_fingerprint(pandas.DataFrame({'s': ['1']}))
+
+def test_parameterizer_detects_parameters_with_lexer():
+    from Kqlmagic.parameterizer import Parameterizer
+    query = "let u = 'http://host/path;x=1'; // let c = n\nlet n = n; let b = n == 1; T | where url == u and count == n"
+    assert Parameterizer({'n': 5, 'u': 'ignored'}).expand(query) == "let n = 5;" + query
+
+def test_params_declare_supported_only_by_kusto_engines():
+    from Kqlmagic.la_engine import LoganalyticsEngine
+    from Kqlmagic.ai_engine import AppinsightsEngine
+    from Kqlmagic.cache_engine import CacheEngine
+    from Kqlmagic.parameterizer import Parameterizer
+    engines = {engine_class: engine_class.__new__(engine_class) for engine_class in [KustoEngine, LoganalyticsEngine, AppinsightsEngine, CacheEngine]}
+    engines[CacheEngine].kql_engine = engines[LoganalyticsEngine]
+    assert [engine.supports_query_parameters() for engine in engines.values()] == [True, False, False, False]
+    engines[CacheEngine].kql_engine = engines[KustoEngine]
+    assert engines[CacheEngine].supports_query_parameters()
+    # the values of a non kusto engine query are inlined
+    query = "let n = n; T | take n"
+    parameterizer = Parameterizer({'n': 5})
+    assert parameterizer.expand(query, params_declare=engines[LoganalyticsEngine].supports_query_parameters()) == "let n = 5;" + query
+    assert parameterizer.query_parameters == {}
+
+def test_query_rewriter_projects_columns_before_render():
+    from Kqlmagic.query_rewriter import QueryRewriter
+    query = "T | where s == '| render x' | render timechart"
+    assert QueryRewriter().rewrite(query, columns=['a', 'my col']) == \
+        "T | where s == '| render x' | project a, ['my col'] | render timechart"
+    assert QueryRewriter().rewrite("T | take 10;", columns=['a']) == "T | take 10\n| project a;"
+    assert QueryRewriter().rewrite(".show tables", columns=['a']) == ".show tables"
+
+def _magic_config():
+    "returns a config with the Kqlmagic config traits default values"
+    from types import SimpleNamespace
+    from Kqlmagic.kql_magic import Kqlmagic
+    return SimpleNamespace(**{name: trait.default() for name, trait in Kqlmagic.class_traits(config=True).items()})
+
+def test_parse_columns_option_is_not_evaluated(monkeypatch):
+    user_ns = {'a': 1}
+    parsed = Parser.parse("-columns a,b,c T | take 1", _magic_config(), TEST_ENGINE, user_ns)[0]
+    assert parsed['query'] == "T | take 1" and parsed['options']['columns'] == ['a', 'b', 'c']
+    assert Parser.parse("-columns 'a,b' T", _magic_config(), TEST_ENGINE, user_ns)[0]['options']['columns'] == ['a', 'b']
+    monkeypatch.setenv('KQLMAGIC_TEST_COLUMNS', "x,y")
+    parsed = Parser.parse("-columns $KQLMAGIC_TEST_COLUMNS T", _magic_config(), TEST_ENGINE, user_ns)[0]
+    assert parsed['options']['columns'] == ['x', 'y']
+
+def test_dsn_file_cache_invalidated_by_mtime(tmpdir):
+    dsn_filename = str(tmpdir.join("odbc.ini"))
+    with open(dsn_filename, "w") as f:
+        f.write("[mydb]\ndatabase=db1\n")
+    assert Parser._read_dsn_file(dsn_filename).get("mydb", "database") == "db1"
+    with open(dsn_filename, "w") as f:
+        f.write("[mydb]\ndatabase=db2\n")
+    os.utime(dsn_filename, (0, os.path.getmtime(dsn_filename) + 10))
+    assert Parser._read_dsn_file(dsn_filename).get("mydb", "database") == "db2"
+
+def test_query_sweep_parameter_sets():
+    from Kqlmagic.query_sweep import QuerySweep
+    assert QuerySweep({'c': ['a', 'b'], 'r': (1, 2)}).param_sets == \
+        [{'c': 'a', 'r': 1}, {'c': 'a', 'r': 2}, {'c': 'b', 'r': 1}, {'c': 'b', 'r': 2}]
+
+def test_parameterizer_declares_query_parameters():
+    from Kqlmagic.parameterizer import Parameterizer
+    query = "let n = n; let s = s; let z = z; T | take n"
+    parameterizer = Parameterizer({'n': 5, 's': "it's", 'z': None})
+    assert parameterizer.expand(query, params_declare=True) == \
+        "declare query_parameters(n:long, s:string);let z = null;" + query
+    assert parameterizer.query_parameters == {'n': '5', 's': "it's"}
+
+def test_progressive_frames_merged_from_chunks():
+    from Kqlmagic.kql_client import iter_json_array, KqlProgressiveFrames
+    text = '[{"FrameType": "TableHeader", "TableId": 0, "TableKind": "PrimaryResult", "TableName": "T", "Columns": []},\r\n' \
+        '{"FrameType": "TableFragment", "TableId": 0, "TableFragmentType": "DataAppend", "Rows": [[1, "}{\\""]]},\r\n' \
+        '{"FrameType": "TableFragment", "TableId": 0, "TableFragmentType": "DataAppend", "Rows": [[2, "x"]]},\r\n' \
+        '{"FrameType": "TableCompletion", "TableId": 0, "RowCount": 2}]'
+    progressive = KqlProgressiveFrames()
+    for frame in iter_json_array(text[i : i + 7] for i in range(0, len(text), 7)):
+        progressive.add(frame)
+    assert progressive.primary_table["Rows"] == [[1, '}{"'], [2, "x"]]
+
+def test_fetchmany_converts_only_fetched_rows():
+    from Kqlmagic.kql_client import KqlQueryResponse
+    from Kqlmagic.kql_proxy import KqlResponse
+    rows = [["2019-01-01T00:00:{0:02d}Z".format(i % 60), i] for i in range(1000)]
+    columns = [{"ColumnName": "t", "ColumnType": "datetime"}, {"ColumnName": "n", "ColumnType": "long"}]
+    json_response = {"Tables": [{"TableName": "Table_0", "Columns": columns, "Rows": rows}]}
+    table = KqlResponse(KqlQueryResponse(json_response)).tables[0]
+    converted = []
+    to_datetime = table.data_table.converters_lambda_mappings["datetime"]
+    table.data_table.converters_lambda_mappings["datetime"] = lambda value: converted.append(value) or to_datetime(value)
+    fetched = list(table.fetchmany(5))
+    assert len(fetched) == 5 and fetched[4][1] == 4
+    assert converted == [row[0] for row in rows[:5]]
+    assert table.data_table._columns_values is None
+
+def _result_set(columns, rows, **options):
+    "returns a ResultSet of a v1 response with one table, columns is a list of (name, type) tuples"
+    from Kqlmagic.kql_client import KqlQueryResponse
+    from Kqlmagic.kql_proxy import KqlResponse
+    from Kqlmagic.results import ResultSet
+    columns = [{"ColumnName": name, "ColumnType": ctype} for name, ctype in columns]
+    json_response = {"Tables": [{"TableName": "Table_0", "Columns": columns, "Rows": rows}]}
+    return ResultSet(KqlResponse(KqlQueryResponse(json_response)), "T", 0, {}, {}, options)
+
+def test_export_streams_chunks_without_converting_the_table(tmpdir):
+    import pytest
+    rows = [["2019-01-01T00:00:{0:02d}Z".format(i % 60), i, '{"a": %d}' % i] for i in range(250)]
+    result = _result_set([("t", "datetime"), ("n", "long"), ("d", "dynamic")], rows)
+    data_table = result._queryResult.tables[0].data_table
+    lines = result.to_csv(chunk_size=100).splitlines()
+    assert len(lines) == 251
+    assert lines[0] == "t,n,d" and lines[250] == '2019-01-01 00:00:09+00:00,249,"{""a"": 249}"'
+    assert len(result.to_jsonl(chunk_size=100).splitlines()) == 250
+    assert data_table._columns_values is None and result._columns_values is None
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("result.parquet"))
+    result.to_parquet(filename, chunk_size=100)
+    parquet_file = pyarrow_parquet.ParquetFile(filename)
+    assert parquet_file.metadata.num_row_groups == 3 and parquet_file.metadata.num_rows == 250
+    assert data_table._columns_values is None and result._columns_values is None
+
+def test_table_html_renders_the_display_window():
+    result = _result_set([("n", "long"), ("s", "string")], [[i, "<{0}>".format(i)] for i in range(30)])
+    body = result._getTableHtml(display_limit=10)["body"]
+    assert body.count("<tr>") == 11 and "<td>&lt;9&gt;</td>" in body and "<td>10</td>" not in body
+    assert body.endswith("30 rows, truncated to display_limit of 10</span>")
+    body = result._getTableHtml(offset=25, display_limit=10)["body"]
+    assert body.count("<tr>") == 6 and "<td>25</td>" in body and "<td>24</td>" not in body
+    assert body.endswith("30 rows, displaying rows 26 to 30</span>")
+    assert "<span" not in result._getTableHtml(display_limit=30)["body"]
+    assert result._queryResult.tables[0].data_table._columns_values is None
+
+def test_table_html_default_display_limit(monkeypatch):
+    from Kqlmagic.results import ResultSet
+    monkeypatch.setattr(ResultSet, "_DEFAULT_DISPLAY_LIMIT", 5)
+    result = _result_set([("n", "long")], [[i] for i in range(8)])
+    body = result._getTableHtml()["body"]
+    assert body.count("<tr>") == 6 and body.endswith("8 rows, truncated to display_limit of 5</span>")
+
+def test_interactive_table_windows():
+    from Kqlmagic.interactive_table import InteractiveTable
+    rows = [[i, "name{0}".format(i % 7), None if i % 5 == 0 else i * 10] for i in range(250)]
+    result = _result_set([("n", "long"), ("s", "string"), ("v", "long")], rows)
+    table = InteractiveTable(result)
+    window = table.get_window(offset=240, limit=20)
+    assert window["offset"] == 240 and window["total"] == 250 and len(window["rows"]) == 10
+    assert window["rows"][0] == ["240", "name2", ""]
+    assert result._queryResult.tables[0].data_table._columns_values is None
+    window = table.get_window(offset=0, limit=3, sort={"column": 2, "ascending": False})
+    assert [row[2] for row in window["rows"]] == ["", "", ""]
+    window = table.get_window(offset=0, limit=3, sort={"column": 2, "ascending": True})
+    assert [row[2] for row in window["rows"]] == ["10", "20", "30"]
+    window = table.get_window(offset=0, limit=100, sort={"column": 0, "ascending": False}, filter="NAME3")
+    assert window["total"] == 36 and window["rows"][0][0] == "248" and all(row[1] == "name3" for row in window["rows"])
+
+def test_interactive_table_drops_least_recently_used_tables(monkeypatch):
+    from Kqlmagic.interactive_table import InteractiveTable
+    from collections import OrderedDict
+    monkeypatch.setattr(InteractiveTable, "MAX_TABLES", 2)
+    monkeypatch.setattr(InteractiveTable, "_tables", OrderedDict())
+    result = _result_set([("n", "long")], [[i] for i in range(250)])
+    first, second = InteractiveTable(result), InteractiveTable(result)
+    widget = first.get_widget()
+    assert InteractiveTable.get_table(second.table_id) is second
+    InteractiveTable(result)
+    assert InteractiveTable.get_table(first.table_id) is None and InteractiveTable.get_table(second.table_id) is second
+    next_button = widget.children[0].children[4]
+    next_button.click()
+    assert widget.children[0].children[5].value == "table is not available anymore, rerun the cell"
+
+def test_interactive_table_widget_pages_sorts_and_filters():
+    from Kqlmagic.interactive_table import InteractiveTable
+    result = _result_set([("n", "long")], [[i] for i in range(250)])
+    widget = InteractiveTable(result).get_widget()
+    filter_text, sort_column, descending, prev_button, next_button, status = widget.children[0].children
+    rows_html = widget.children[1]
+    assert status.value == "250 rows, displaying rows 1 to 100" and prev_button.disabled
+    next_button.click()
+    next_button.click()
+    assert status.value == "250 rows, displaying rows 201 to 250" and next_button.disabled
+    sort_column.value = 0
+    descending.value = True
+    assert status.value == "250 rows, displaying rows 1 to 100" and ">249</td>" in rows_html.value
+    filter_text.value = "24"
+    assert status.value == "13 rows, displaying rows 1 to 13" and ">249</td>" in rows_html.value
+
+def _row_wise_datatable(parameterizer, df):
+    "the datatable serialization before the column-wise serializer, value by value of df.to_dict('split') rows"
+    t = {col: str(t).split(".")[-1].split("[",1)[0] for col, t in dict(df.dtypes).items()}
+    d = df.to_dict("split")
+    c = d["columns"]
+    r = d["data"]
+    pairs_t = {col: [str(t[col]), parameterizer._DATAFRAME_TO_KQL_TYPES.get(str(t[col]))] for col in c}
+    pairs_t = {col: parameterizer._guess_object_type(pairs_t[col], [row[idx] for row in r]) for idx, col in enumerate(c)}
+    schema = ", ".join(["{0}:{1}".format(col, pairs_t[col][1]) for col in c])
+    data = ", ".join([", ".join([parameterizer.dataframe_to_kql_value(val, pairs_t[c[idx]]) for idx, val in enumerate(row)]) for row in r])
+    return " view () {{datatable ({0}) [{1}]}}".format(schema, data)
+
+def test_parameterizer_datatable_same_as_row_wise_serialization():
+    import numpy
+    import pandas
+    from Kqlmagic.parameterizer import Parameterizer
+    df = pandas.DataFrame({
+        'n': numpy.array([1, -2, 3], dtype='int32'),
+        'nn': [1, None, 3],
+        'r': numpy.array([1.25, float('nan'), -0.1], dtype='float32'),
+        'b': [True, False, True],
+        'ob': [True, None, False],
+        's': ['foo', None, "it's"],
+        't': [pandas.Timestamp('2019-01-01 10:00:00'), pandas.NaT, pandas.Timestamp('2019-01-01 10:00:00.000000001')],
+        'tz': pandas.to_datetime(['2019-01-01 10:00:00', None, '2019-01-02 00:00:00']).tz_localize('UTC'),
+        'd': pandas.to_timedelta(['1 days 02:03:04.5', None, '-00:00:01']),
+        'o': [{'a': [1, 2]}, None, [1, 'x']],
+        'm': [1, 'x', None],
+        'y': [b'ab', b'', b'c'],
+        'ie': pandas.array([1, None, 3], dtype='Int64'),
+        'se': pandas.array(['a', None, 'c'], dtype='string'),
+        'on': [numpy.int64(5), numpy.float64(0.5), numpy.datetime64('2019-01-01T00:00:00')],
+    })
+    parameterizer = Parameterizer({})
+    assert parameterizer.datatable(df) == _row_wise_datatable(parameterizer, df)
+    assert parameterizer.datatable(df.iloc[0:0]) == _row_wise_datatable(parameterizer, df.iloc[0:0])
+
+def _row_wise_chart_sub_tables(rows, x_idx, series_idxs, y_names, is_query_sorted=False):
+    "the chart sub-tables as built before the column arrays rewrite, by sorting and scanning the rows, as (name, items) pairs"
+    is_descending_sorted = None
+    if is_query_sorted:
+        is_descending_sorted = all(rows[i][x_idx] >= rows[i + 1][x_idx] for i in range(len(rows) - 1))
+    rows = list(reversed(rows)) if is_descending_sorted else sorted(rows, key=lambda row: row[x_idx])
+    col_x = []
+    for row in rows:
+        if row[x_idx] not in col_x:
+            col_x.append(row[x_idx])
+    sub_tables = {}
+    for row in rows:
+        for y_idx, y_name in y_names:
+            name = ":".join([str(row[idx]) for idx in series_idxs]) + ":" + y_name if series_idxs else y_name
+            sub_table = sub_tables.setdefault(name, dict(zip(col_x, [None] * len(col_x))))
+            sub_table[row[x_idx]] = row[y_idx]
+    return [(name, list(sub_table.items())) for name, sub_table in sub_tables.items()], is_descending_sorted
+
+def test_chart_sub_tables_of_shuffled_series_match_row_wise_order():
+    import random
+    from Kqlmagic.constants import VisualizationKeys
+    random.seed(7)
+    rows = [[x, "s{0}".format(s), "h{0}".format(x % 2), float(x * s), x - s] for x in range(40) for s in range(3) if (x + s) % 4]
+    rows += [[5, "s0", "h1", 0.5, 1]]
+    random.shuffle(rows)
+    for is_query_sorted, table_rows in [(False, rows), (True, sorted(rows, key=lambda row: -row[0]))]:
+        result = _result_set([("x", "long"), ("s", "string"), ("h", "string"), ("y1", "real"), ("y2", "long")], table_rows)
+        sub_tables = result._build_chart_sub_tables({VisualizationKeys.IS_QUERY_SORTED: is_query_sorted})
+        expected, is_descending_sorted = _row_wise_chart_sub_tables(table_rows, 0, [1, 2], [(3, "y1"), (4, "y2")], is_query_sorted)
+        assert [(sub_table.name, list(sub_table.items())) for sub_table in sub_tables] == expected
+        assert all(sub_table.is_descending_sorted == is_descending_sorted for sub_table in sub_tables)
+
+def test_live_chart_delta_query():
+    from datetime import datetime, timezone, timedelta
+    from Kqlmagic.live_chart import get_delta_query
+    assert get_delta_query("T | summarize count() by bin(t, 1m) | render timechart", "t", 5) == \
+        "T | summarize count() by bin(t, 1m) | where ['t'] > 5 | render timechart"
+    assert get_delta_query("T | where s == '| render x'\n| take 10;", "t", 2.5) == \
+        "T | where s == '| render x'\n| take 10\n| where ['t'] > 2.5;"
+    last_value = datetime(2019, 1, 1, 12, 0, 0, 500000, tzinfo=timezone(timedelta(hours=2)))
+    assert get_delta_query("T | render timechart", "my t", last_value) == \
+        "T | where ['my t'] > datetime(2019-01-01T10:00:00.500000) | render timechart"
+    assert get_delta_query("T", "name", "it's") == "T\n| where ['name'] > 'it\\'s'"
+
+def test_live_chart_updates_traces_on_the_event_loop():
+    import asyncio
+    import threading
+    import plotly.graph_objs as go
+    from Kqlmagic.live_chart import LiveChart
+    from Kqlmagic.column_guesser import ChartSubTable
+    result = _result_set([("t", "long"), ("y", "real")], [[1, 1.0], [2, 2.0]])
+    live_chart = LiveChart(result, interval=0.01, window=3)
+    live_chart.figure = go.FigureWidget(go.Figure(data=[go.Scattergl(x=[1, 2], y=[1.0, 2.0], name="y")]))
+    deltas = [[ChartSubTable(name="y", mapping={3: 3.0, 4: None}), ChartSubTable(name="z", mapping={3: 5.0})], []]
+    update_threads = []
+    live_chart.get_delta_sub_tables = lambda: deltas.pop(0) if deltas else []
+    update = live_chart.update
+    live_chart.update = lambda delta_sub_tables: update_threads.append(threading.get_ident()) or update(delta_sub_tables)
+
+    async def _run():
+        live_chart._loop = asyncio.get_running_loop()
+        live_chart._stopped = False
+        live_chart._schedule()
+        while deltas:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        live_chart.stop()
+
+    asyncio.run(_run())
+    assert set(update_threads) == {threading.get_ident()}
+    assert [type(trace).__name__ for trace in live_chart.figure.data] == ["Scattergl", "Scattergl"]
+    assert list(live_chart.figure.data[0].x) == [1, 2, 3] and list(live_chart.figure.data[1].y) == [5.0]
+    assert live_chart.last_value == 3 and not live_chart.is_running
+
+class _SweepConnection(object):
+    "stub connection, returns for each query a table of the query text and its query parameters"
+
+    def __init__(self):
+        import threading
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def execute(self, query, user_ns, **options):
+        import json
+        import pandas
+        import threading
+        from types import SimpleNamespace
+        with self.lock:
+            self.threads.append(threading.get_ident())
+        df = pandas.DataFrame({"query": [query], "qp": [json.dumps(options.get("query_parameters"), sort_keys=True)]})
+        return SimpleNamespace(tables=[SimpleNamespace(to_dataframe=lambda: df)])
+
+def test_query_sweep_execute_combines_tagged_results():
+    import threading
+    from Kqlmagic.query_sweep import QuerySweep
+    conn = _SweepConnection()
+    query = "let c = c; let r = r; T | where x == c | take r"
+    df = QuerySweep({'c': ['a', 'b'], 'r': [1, 2]}).execute(conn, query, {'z': 0}, {}, max_workers=3)
+    assert list(df.columns) == ['c', 'r', 'query', 'qp']
+    assert df[['c', 'r']].values.tolist() == [['a', 1], ['a', 2], ['b', 1], ['b', 2]]
+    assert df['query'].tolist()[3] == "let c = 'b';let r = 2;" + query
+    assert conn.threads[0] == threading.get_ident() and len(conn.threads) == 4
+    df = QuerySweep({'c': ['a', 'b']}).execute(conn, query, {'r': 5}, {}, params_declare=True)
+    assert df['qp'].tolist() == ['{"c": "a", "r": "5"}', '{"c": "b", "r": "5"}']
+
+def test_query_sweep_rejects_parameters_not_used_by_the_query():
+    import pytest
+    from Kqlmagic.query_sweep import QuerySweep
+    conn = _SweepConnection()
+    with pytest.raises(ValueError, match="parameters cc are not used by the query"):
+        QuerySweep({'c': ['a'], 'cc': ['b']}).execute(conn, "let c = c; T | where x == c", {}, {})
+    assert conn.threads == []
+
+def test_export_images_collects_errors_per_chart(tmpdir, monkeypatch):
+    import zipfile
+    import plotly
+    from Kqlmagic.display import Display
+    from Kqlmagic.results import ResultSet
+
+    def _to_image(fig, format=None, **kwargs):
+        if fig["layout"]["title"] == "bad":
+            raise ValueError("renderer failed")
+        return "{0}:{1}".format(fig["layout"]["title"], format).encode()
+
+    warnings = []
+    monkeypatch.setattr(plotly.io, "to_image", _to_image)
+    monkeypatch.setattr(Display, "showWarningMessage", lambda msg, **kwargs: warnings.append(msg))
+    charts = [{"data": [], "layout": {"title": "a b"}}, {"data": [], "layout": {"title": "bad"}}, None, {"data": [], "layout": {"title": "c"}}]
+    descriptors = ResultSet.export_images(charts, folder=str(tmpdir.join("images")), max_workers=2)
+    assert [os.path.basename(d.file_or_image) for d in descriptors] == ["0000_a_b.png", "0003_c.png"]
+    assert open(descriptors[1].file_or_image, "rb").read() == b"c:png"
+    assert warnings == [["export of 1 of 3 images failed:", "0001_bad.png: renderer failed"]]
+    zip_filename = str(tmpdir.join("images.zip"))
+    assert ResultSet.export_images(charts, zip_filename=zip_filename, format="svg").format == "zip"
+    assert zipfile.ZipFile(zip_filename).namelist() == ["0000_a_b.svg", "0003_c.svg"]
+
+def test_min_max_downsample_keeps_peaks_in_x_order():
+    from Kqlmagic.results import _min_max_downsample
+    xs = list(range(10))
+    ys = [5, 1, 9, 2, None, None, 3, 8, 0, 4]
+    assert _min_max_downsample(xs, ys, 10) == (xs, ys)
+    assert _min_max_downsample(xs, ys, None) == (xs, ys)
+    # a bucket keeps its min and max points, a bucket of None values is a single gap point
+    gap_ys = [5, 1, 9, 2, None, None, None, 8, 0, 4, 6, 3]
+    assert _min_max_downsample(list(range(12)), gap_ys, 10) == ([0, 1, 2, 3, 4, 7, 8, 10, 11], [5, 1, 9, 2, None, 8, 0, 6, 3])
+    assert _min_max_downsample(xs, ys, 4) == ([1, 2, 7, 8], [1, 9, 8, 0])
+    assert _min_max_downsample(xs, [7] * 10, 2) == ([0], [7])
+
+def test_stacked_area_chart_downsampled_over_shared_x():
+    rows = [["s{0}".format(i % 3), i // 3, float((i * 7) % 11) if i % 13 else None] for i in range(150)]
+    result = _result_set([("s", "string"), ("x", "long"), ("y", "real")], rows, chart_max_points=10)
+    properties = {"Visualization": "stackedareachart"}
+    fig = result._render_stackedareachart_plotly(properties, " ")
+    assert len(fig.data) == 3 and 0 < len(fig.data[0].x) <= 10
+    assert all(list(trace.x) == list(fig.data[0].x) for trace in fig.data)
+    # stacks line up, each trace is on top of the previous one
+    assert all(upper >= lower for idx in range(1, 3) for upper, lower in zip(fig.data[idx].y, fig.data[idx - 1].y))
+    xs, ys_list = result._get_chart_sub_tables_stacked_points(result.chart_sub_tables, chart_max_points=None)
+    assert len(xs) == 50 and all(len(ys) == 50 for ys in ys_list)
+
+def test_plotly_scatter_class_by_chart_engine():
+    import plotly.graph_objs as go
+    result = _result_set([("n", "long")], [[1]], chart_engine="auto", chart_webgl_threshold=100)
+    assert result._get_plotly_scatter_class(100) is go.Scatter
+    assert result._get_plotly_scatter_class(101) is go.Scattergl
+    assert result._get_plotly_scatter_class(101, chart_engine="svg") is go.Scatter
+    assert result._get_plotly_scatter_class(1, chart_engine="webgl") is go.Scattergl
+    assert result._get_plotly_scatter_class(101, chart_webgl_threshold=1000) is go.Scatter
+
+def test_chart_figure_cached_by_data_and_patched_by_palette():
+    import plotly.graph_objs as go
+    from Kqlmagic.palette import Palette
+    result = _result_set([("x", "long"), ("y", "long")], [[1, 2], [2, 3]], palette_name="deep", chart_max_points=100)
+    result.visualization_properties = {"Visualization": "linechart"}
+    builds = []
+
+    def _build_chart_figure(**kwargs):
+        builds.append(kwargs)
+        return go.Figure(data=[go.Scatter(x=[1, 2], y=[2, 3], mode="lines"), go.Bar(x=[1, 2], y=[3, 4])])
+
+    result._build_chart_figure = _build_chart_figure
+    fig = result._get_chart_figure()
+    assert result._get_chart_figure() is fig and len(builds) == 1
+
+    # a palette change is patched on the cached figure
+    assert result._get_chart_figure(palette_name="pastel") is fig and len(builds) == 1
+    pastel = [str(c) for c in Palette(palette_name="pastel", n_colors=10)]
+    assert fig.data[0].line.color == pastel[0] and fig.data[1].marker.color == pastel[1]
+
+    # a data option change, a visualization properties change, or a data update, rebuild the figure
+    assert result._get_chart_figure(palette_name="pastel", chart_max_points=10) is not fig and len(builds) == 2
+    fig = result._get_chart_figure(palette_name="pastel", chart_max_points=10)
+    result.visualization_properties = {"Visualization": "linechart", "Title": "t"}
+    assert result._get_chart_figure(palette_name="pastel", chart_max_points=10) is not fig and len(builds) == 3
+    result._update(result._queryResult)
+    result.visualization_properties = {"Visualization": "linechart", "Title": "t"}
+    result._get_chart_figure(palette_name="pastel", chart_max_points=10)
+    assert len(builds) == 4
+
+def test_chart_figure_palette_patch_colors_pie_slices():
+    import plotly.graph_objs as go
+    from Kqlmagic.palette import Palette
+    result = _result_set([("x", "long")], [[1]])
+    fig = go.Figure(data=[go.Pie(labels=["a", "b", "c"], values=[1, 2, 3])])
+    result._patch_chart_figure_palette(fig, palette_name="deep")
+    assert list(fig.data[0].marker.colors) == [str(c) for c in Palette(palette_name="deep", n_colors=10)][:3]
+
+def test_get_sort_order():
+    from Kqlmagic.column_guesser import get_sort_order
+    assert get_sort_order([]) == "constant"
+    assert get_sort_order([3]) == "constant"
+    assert get_sort_order([3, 3, 3]) == "constant"
+    assert get_sort_order([1, 2, 2, 5]) == "ascending"
+    assert get_sort_order([5, 3, 1]) == "descending"
+    assert get_sort_order([5, 3, 3, 1]) == "non_increasing"
+    assert get_sort_order([1, 3, 2]) is None
+    assert get_sort_order([3, 3, 1, 2]) is None
+    assert get_sort_order(iter(["a", "b", "c"])) == "ascending"
+
+def test_top_categories_sums_the_rest_into_other():
+    from Kqlmagic.results import _top_categories
+    tabs = [{"a": 1, "b": -10, "c": 2}, {"a": 1, "c": 3, "d": None}]
+    assert _top_categories(tabs, 4) == [(["a", "b", "c"], [1, -10, 2]), (["a", "c", "d"], [1, 3, None])]
+    assert _top_categories(tabs, None) == _top_categories(tabs, 4)
+    # top categories by absolute total (b: 10, c: 5) are kept in original order
+    assert _top_categories(tabs, 3) == [(["b", "c", "other"], [-10, 2, 1.0]), (["b", "c", "other"], [None, 3, 1.0])]
+    # the aggregated category name does not collide with an existing category
+    tabs = [{"other": 5, "[other]": 4, "x": 1, "y": 1}]
+    assert _top_categories(tabs, 2) == [(["other", "[[other]]"], [5, 6.0])]
+
+def test_matplotlib_chart_figures_render_headless():
+    import pytest
+    pytest.importorskip("matplotlib")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from Kqlmagic.matplotlib_chart import MatplotlibChart
+    fig = MatplotlibChart.new_figure(figsize=(3, 2))
+    assert MatplotlibChart.is_figure(fig) and not MatplotlibChart.is_figure(object())
+    assert isinstance(fig.canvas, FigureCanvasAgg) and tuple(fig.get_size_inches()) == (3, 2)
+    assert MatplotlibChart.new_figure() is not fig
+
+    rows = [["2019-01-01T00:00:{0:02d}Z".format(i), i * 2, 10 - i] for i in range(10)]
+    result = _result_set([("t", "datetime"), ("y", "long"), ("z", "long")], rows)
+    fig = MatplotlibChart(result).build({"Visualization": "timechart"})
+    ax = fig.axes[0]
+    assert [line.get_label() for line in ax.get_lines()] == ["y", "z"]
+    assert list(ax.get_lines()[0].get_ydata()) == [i * 2 for i in range(10)]
+    assert MatplotlibChart.to_image(fig).startswith(b"\x89PNG")
+    assert MatplotlibChart.to_html(fig, format="svg").startswith("<svg")
+    assert MatplotlibChart(result).build({"Visualization": "table"}) is None
+
+_V2_FRAMES = [
+    {"FrameType": "DataSetHeader", "IsProgressive": False, "Version": "v2.0"},
+    {
+        "FrameType": "DataTable",
+        "TableId": 0,
+        "TableKind": "PrimaryResult",
+        "TableName": "PrimaryResult",
+        "Columns": [{"ColumnName": "n", "ColumnType": "long"}],
+        "Rows": [[1], [2]],
+    },
+    {"FrameType": "DataSetCompletion", "HasErrors": False, "Cancelled": False},
+]
+
+class _FakeKustoResponse(object):
+    "requests response of a v2 query, with the response text, streamed in small chunks"
+
+    def __init__(self, text):
+        self.status_code = 200
+        self.encoding = None
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        assert decode_unicode and self.encoding == "utf-8"
+        return (self.text[i : i + 7] for i in range(0, len(self.text), 7))
+
+def _kusto_client(monkeypatch, response_text, posted):
+    "returns a Kusto_Client, that posts the requests to posted, and receives response_text"
+    import Kqlmagic.kusto_client as kusto_client
+
+    def _post(endpoint, headers=None, json=None, timeout=None, stream=False):
+        posted.update(endpoint=endpoint, payload=json, stream=stream)
+        return _FakeKustoResponse(response_text)
+
+    monkeypatch.setattr(kusto_client.requests, "post", _post)
+    return kusto_client.Kusto_Client({"cluster": "http://127.0.0.1:1", "anonymous": "anonymous"})
+
+def _execute_request(monkeypatch, query, **options):
+    "returns the request payload posted by Kusto_Client.execute"
+    posted = {}
+    response = _kusto_client(monkeypatch, json.dumps(_V2_FRAMES), posted).execute("db", query, **options)
+    assert response.primary_results[0].rows_count == 2
+    return posted
+
+def test_kusto_client_sends_request_properties(monkeypatch):
+    posted = _execute_request(
+        monkeypatch, "T | take n", query_results_cache_max_age="1h", truncation_max_size=1024, server_timeout="00:10:00", query_parameters={"n": "5"}
+    )
+    assert posted["endpoint"] == "http://127.0.0.1:1/v2/rest/query" and not posted["stream"]
+    assert json.loads(posted["payload"]["properties"]) == {
+        "Options": {"query_results_cache_max_age": "1h", "truncationmaxsize": 1024, "servertimeout": "00:10:00"},
+        "Parameters": {"n": "5"},
+    }
+    # unset options are not sent
+    posted = _execute_request(monkeypatch, "T", query_results_cache_max_age=None, results_progressive_enabled=False)
+    assert posted["payload"] == {"db": "db", "csl": "T"}
+
+_PROGRESSIVE_TEXT = json.dumps(
+    [
+        {"FrameType": "DataSetHeader", "IsProgressive": True, "Version": "v2.0"},
+        {
+            "FrameType": "TableHeader",
+            "TableId": 0,
+            "TableKind": "PrimaryResult",
+            "TableName": "PrimaryResult",
+            "Columns": [{"ColumnName": "t", "ColumnType": "datetime"}, {"ColumnName": "y", "ColumnType": "real"}],
+        },
+        {
+            "FrameType": "TableFragment",
+            "TableId": 0,
+            "TableFragmentType": "DataAppend",
+            "Rows": [["2019-01-01T00:00:01Z", 1.0], ["2019-01-01T00:00:02Z", 2.0]],
+        },
+        {"FrameType": "TableProgress", "TableId": 0, "TableProgress": 50.0},
+        {
+            "FrameType": "TableFragment",
+            "TableId": 0,
+            "TableFragmentType": "DataAppend",
+            "Rows": [["2019-01-01T00:00:03Z", 3.0], ["2019-01-01T00:00:04Z", 4.0]],
+        },
+        {"FrameType": "TableCompletion", "TableId": 0, "RowCount": 4},
+        {"FrameType": "DataSetCompletion", "HasErrors": False, "Cancelled": False},
+    ]
+)
+
+class _ProgressDisplay(object):
+    "records the progress display updates"
+
+    def __init__(self):
+        self.updates = []
+
+    def update(self, html_str):
+        self.updates.append(html_str)
+
+def test_progressive_results_displayed_while_streamed(monkeypatch):
+    from Kqlmagic.kql_magic import Kqlmagic
+    posted = {}
+    client = _kusto_client(monkeypatch, _PROGRESSIVE_TEXT, posted)
+    progress = []
+    response = client.execute(
+        "db",
+        "T",
+        results_progressive_enabled=True,
+        progress_callback=lambda frames: progress.append((len(frames.primary_table["Rows"]), frames.primary_progress)),
+    )
+    assert posted["stream"] and json.loads(posted["payload"]["properties"]) == {"Options": {"results_progressive_enabled": True}}
+    assert progress == [(0, None), (2, None), (2, 50.0), (4, 50.0), (4, 100.0)]
+    assert [row[1] for row in response.primary_results[0].fetchall()] == [1.0, 2.0, 3.0, 4.0]
+
+    # a stream that ends within a frame fails, after the received records were displayed
+    progress_display = _ProgressDisplay()
+    truncated_text = _PROGRESSIVE_TEXT[: _PROGRESSIVE_TEXT.index('"TableFragment"', _PROGRESSIVE_TEXT.index("TableProgress")) + 5]
+    client = _kusto_client(monkeypatch, truncated_text, posted)
+    progress_callback = Kqlmagic._get_progress_callback(Kqlmagic, progress_display, display_limit=1)
+    with pytest.raises(ValueError, match="incomplete json array item"):
+        client.execute("db", "T", results_progressive_enabled=True, progress_callback=progress_callback)
+    assert "2&nbsprecords&nbsp(50%)" in progress_display.updates[-1]
+    assert "<td>1.0</td>" in progress_display.updates[-1] and "<td>2.0</td>" not in progress_display.updates[-1]
+
+def test_progressive_result_saved_and_refreshed_by_live_chart(monkeypatch, tmpdir):
+    from Kqlmagic.cache_client import CacheClient
+    from Kqlmagic.connection import Connection
+    from Kqlmagic.kql_engine import KqlEngine
+    from Kqlmagic.kql_proxy import KqlResponse
+    from Kqlmagic.live_chart import LiveChart
+    from Kqlmagic.results import ResultSet
+
+    class _ClientConnection(object):
+        "connection of a Kusto_Client"
+        client_execute = KqlEngine.client_execute
+        execute = KqlEngine.execute
+
+        def __init__(self, client):
+            self.client = client
+
+        def get_client(self):
+            return self.client
+
+        def get_database(self):
+            return "db"
+
+    monkeypatch.chdir(tmpdir)
+    posted = {}
+    conn = _ClientConnection(_kusto_client(monkeypatch, _PROGRESSIVE_TEXT, posted))
+    options = {"results_progressive_enabled": True, "save_as": "result.json"}
+    raw_query_result = conn.execute("T | render timechart", {}, progress_callback=lambda frames: None, **options)
+
+    # the saved progressive result is the merged result, it is loaded from the cache as a regular v2 result
+    cache_client = CacheClient.__new__(CacheClient)
+    cache_client.save(raw_query_result, "db", "cluster", "T | render timechart", filepath=options["save_as"])
+    cached = KqlResponse(cache_client.execute(".", "result.json"))
+    assert [row[1] for row in cached.tables[0].fetchall()] == [1.0, 2.0, 3.0, 4.0]
+
+    # the live chart delta query is streamed with the result options, without the cell progress display
+    result = ResultSet(raw_query_result, "T | render timechart", 0, {}, {"connection": "live_test"}, options)
+    result.visualization_properties = {"Visualization": "timechart"}
+    monkeypatch.setitem(Connection.connections, "live_test", conn)
+    live_chart = LiveChart(result, interval=1)
+    assert "progress_callback" not in live_chart.options
+    live_chart.x_column_name = "t"
+    live_chart.last_value = result[1][0]
+    delta_sub_tables = live_chart.get_delta_sub_tables()
+    assert posted["stream"] and "where ['t'] > datetime(2019-01-01" in posted["payload"]["csl"]
+    assert [list(tab.values()) for tab in delta_sub_tables] == [[1.0, 2.0, 3.0, 4.0]]
+
+def _read_external_csv(kql):
+    "returns the csv rows of the externaldata blobs referred by kql, uploaded to a local folder"
+    import re
+    import csv
+    import gzip
+    from six.moves.urllib.request import url2pathname
+    rows = []
+    for blob_url in re.findall(r"\[h@'file:([^']*)'\]", kql):
+        with open(url2pathname(blob_url), "rb") as f:
+            rows.append(list(csv.reader(gzip.decompress(f.read()).decode("utf-8").splitlines())))
+    return rows
+
+def test_parameterizer_uploads_large_parameters_as_external_data(tmpdir):
+    import pandas as pd
+    from Kqlmagic.parameterizer import Parameterizer
+    df = pd.DataFrame(
+        {
+            "s": ["a,b", 'say "hi"', "x"],
+            "n": [1.5, None, 3.0],
+            "t": pd.to_datetime(["2019-01-01 00:00:00", None, "2019-01-02 03:04:05"]),
+            "td": pd.to_timedelta(["1h", None, "2D"]),
+        }
+    )
+    items = [1, "a,b", 'say "hi"', None, {"k": [1, 2]}]
+    container_url = "file://" + str(tmpdir.join("container"))
+    query = "let df = df; let l = l; df"
+    expanded = Parameterizer({"df": df, "l": items}).expand(query, params_inline_max_size=10, params_upload_url=container_url)
+    df_view, l_value = expanded[: -len(query)].split(";")[:2]
+    assert df_view.startswith("let df =  view () {externaldata (s:string, n:real, t:datetime, td:timespan) [h@'file:")
+    assert df_view.endswith("_df.csv.gz'] with (format='csv')}")
+    assert l_value.startswith("let l = toscalar(externaldata (value:dynamic) [h@'file:")
+    assert l_value.endswith("_l.csv.gz'] with (format='csv') | summarize make_list(value, 5))")
+
+    df_rows, l_rows = _read_external_csv(expanded)
+    # nulls are empty values, strings are csv quoted, values are the inline datatable literals values
+    assert df_rows == [
+        ["a,b", "1.5", "2019-01-01 00:00:00", "0.01:00:00.0000000"],
+        ['say "hi"', "", "", ""],
+        ["x", "3.0", "2019-01-02 03:04:05", "2.00:00:00.0000000"],
+    ]
+    assert [json.loads(row[0]) for row in l_rows] == items
+
+    # small parameters, or parameters without upload url, are inlined
+    assert Parameterizer({"l": [1, 2]}).expand("let l = l; T", params_inline_max_size=100, params_upload_url=container_url) == \
+        "let l = dynamic([1, 2]);let l = l; T"
+    assert "datatable" in Parameterizer({"df": df}).expand("let df = df; df", params_inline_max_size=10)
+
+def test_upload_blob_to_local_folder(tmpdir):
+    import gzip
+    from Kqlmagic.external_data import to_csv_gz, upload_blob
+    data = to_csv_gz([["a,b", None, 1], ['"q"', "", 2.5]])
+    assert gzip.decompress(data).decode("utf-8") == '"a,b",,1\n"""q""",,2.5\n'
+    # the same data is uploaded to the same blob, a folder path or file url can be used
+    blob_url = upload_blob(data, "x.csv.gz", str(tmpdir))
+    assert blob_url == upload_blob(data, "x.csv.gz", "file://" + str(tmpdir))
+    assert blob_url.startswith("file:") and blob_url.endswith("_x.csv.gz") and len(tmpdir.listdir()) == 1
+    assert tmpdir.listdir()[0].read_binary() == data
+
+def test_matplotlib_piechart_without_wedges():
+    import pytest
+    pytest.importorskip("matplotlib")
+    result = _result_set([("c", "string"), ("v", "long"), ("w", "long")], [["a", 0, 1], ["b", None, -2], ["c", 0, 3]])
+    result.visualization_properties = {"Visualization": "piechart"}
+    fig = result._get_chart_figure(plot_package="matplotlib")
+    # null and non positive values have no wedge, a pie without wedges is annotated
+    assert [(ax.get_title(), len(ax.patches)) for ax in fig.axes] == [("v", 0), ("w", 2)]
+    assert [text.get_text() for text in fig.axes[0].texts] == ["no data"]
+    assert [text.get_text() for text in fig.axes[1].texts] == ["a", "c", "25.0%", "75.0%"]
+
+def test_columns_schema_of_capitalized_v1_data_types():
+    from Kqlmagic.kql_client import KqlQueryResponse
+    from Kqlmagic.kql_proxy import KqlResponse
+    columns = [{"ColumnName": "n", "DataType": "Int64"}, {"ColumnName": "m", "DataType": "Int64"}, {"ColumnName": "s", "DataType": "String"}]
+    json_response = {"Tables": [{"TableName": "Table_0", "Columns": columns, "Rows": [[1, 2, "a"], [None, 3, None], [4, 5, "b"]]}]}
+    table = KqlResponse(KqlQueryResponse(json_response)).tables[0]
+    # datafarme_types maps the data types as they are, the schema maps the lower cased types, as to_dataframe did
+    assert table.datafarme_types == [None, None, None]
+    assert [(col["type"], col["dataframe_type"], col["has_nulls"]) for col in table.columns_schema] == [
+        ("int64", "int64", True),
+        ("int64", "int64", False),
+        ("string", "object", True),
+    ]
+    assert [str(t) for t in table.to_dataframe().dtypes] == ["float64", "int64", "object"]
+
+def test_keyed_access_converts_only_the_key_column():
+    import pytest
+    rows = [["2019-01-01T00:00:0{0}Z".format(i), "k{0}".format(i), i] for i in range(5)]
+    result = _result_set([("t", "datetime"), ("k", "string"), ("n", "long")], rows)
+    data_table = result._queryResult.tables[0].data_table
+    converted = []
+    to_datetime = data_table.converters_lambda_mappings["datetime"]
+    data_table.converters_lambda_mappings["datetime"] = lambda value: converted.append(value) or to_datetime(value)
+    data_table._columns_converters = None
+    assert list(result.index_by("k")["k3"])[1:] == ["k3", 3]
+    assert list(result.index_by(1)["k4"])[1:] == ["k4", 4]
+    assert converted == [] and result._columns_values is None
+    with pytest.raises(ValueError, match="out of range"):
+        result.index_by(3)
+    with pytest.raises(ValueError, match="not in result columns"):
+        result.index_by("x")